@@ -14,8 +14,13 @@ def load_content():
             return json.load(f)
     return {}
 
-def create_app(config_name='development'):
-    """Application factory function."""
+def create_app(config_name='development', database_uri=None, **settings):
+    """
+    Application factory function.
+    
+    database_uri and any other settings override the configuration class,
+    e.g. to run tests against a temporary database.
+    """
     # Get the root directory (parent of the app module)
     root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     
@@ -29,9 +34,38 @@ def create_app(config_name='development'):
         app.config.from_object('config.ProductionConfig')
     else:
         app.config.from_object('config.DevelopmentConfig')
+    if database_uri:
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config.update(settings)
     
-    # Initialize database
+    # Initialize database and apply the SQLite connection profile (SQLITE_PROFILE)
     db.init_app(app)
+    from app.db_profile import init_db_profile
+    init_db_profile(app, db)
+    
+    # Shipping rate quote cache (per worker, optional shared disk tier)
+    from app.rate_cache import init_rate_cache
+    init_rate_cache(app)
+    
+    # Offline zone/weight rate table (selectable backend and estimates when the API is slow)
+    from app.rate_table import init_rate_table
+    init_rate_table(app)
+    
+    # Background prefetch of quotes into the rate cache
+    from app.rate_prefetch import init_rate_prefetcher
+    init_rate_prefetcher(app)
+    
+    # Square client shared by all requests in this worker
+    from app.payment import init_square_processor
+    init_square_processor(app)
+    
+    # Per-request query counts, slow-query log and N+1 detection
+    from app.query_profiler import init_query_profiler
+    init_query_profiler(app)
+    
+    # Request, SQL and upstream latency metrics at /metrics
+    from app.metrics import init_metrics
+    init_metrics(app)
     
     # Add context processor to inject content into all templates
     @app.context_processor
@@ -46,8 +80,24 @@ def create_app(config_name='development'):
     app.register_blueprint(services_bp)
     app.register_blueprint(admin_bp)
     
-    # Create database tables
+    # Create database tables and add any columns missing from existing ones
+    # (only when the models changed since the last boot, see SCHEMA_CHECK)
+    from app.schema import prepare_schema
     with app.app_context():
-        db.create_all()
+        prepare_schema(app.config.get('SCHEMA_CHECK', 'version'))
+        # Don't leave pooled connections open for workers forked from a preloading master
+        db.engine.dispose()
     
     return app
+
+
+def reset_after_fork(app):
+    """
+    Make a preloaded app safe to use in a forked worker (gunicorn post_fork).
+    
+    Drops any database connections inherited from the master without closing
+    them, since the master's copies of those sockets are still its own.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -3,7 +3,7 @@ Admin Panel - Content Management System
 Allows editing of website content, design elements, and settings
 """
 
-from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, send_from_directory, current_app
+from flask import Blueprint, render_template, request, jsonify, session, redirect, url_for, send_from_directory, current_app, Response, stream_with_context
 from functools import wraps
 import json
 import os
@@ -12,6 +12,23 @@ from werkzeug.utils import secure_filename
 from slugify import slugify
 from app import db
 from app.models import Service, Category
+from app.pricing import pricing_engine, reprice_open_carts
+from app.catalog import sync_variant_index, parse_bulk_request, bulk_update_items
+from app.category_tree import breadcrumbs, descendants, is_in_subtree
+from app.catalog_import import import_catalog, read_rows
+from app.items import list_items, parse_item_fields, PAGE_SIZE as ITEMS_PAGE_SIZE
+from app.rate_cache import get_rate_cache
+from app.rate_prefetch import get_rate_prefetcher
+from app.payment import get_square_processor
+from app.outbox import outbox_stats
+from app.query_profiler import get_query_profiler
+from app.payment_batch import refund_orders, reconcile_payments
+from app.sales import sales_summary
+from app.export import EXPORTS, FORMATS as EXPORT_FORMATS, export_chunks
+from app.orders import (
+    list_orders, order_with_items_query, parse_order_filters, parse_date_range,
+    PAGE_SIZE, ORDER_STATUSES, PAYMENT_STATUSES
+)
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -127,9 +144,9 @@ def logout():
 @admin_bp.route('/dashboard')
 @login_required
 def dashboard():
-    """Admin dashboard - main content editor."""
+    """Admin dashboard - main content editor and sales figures."""
     content = load_content()
-    return render_template('admin/dashboard.html', content=content)
+    return render_template('admin/dashboard.html', content=content, sales=sales_summary())
 
 
 @admin_bp.route('/api/content', methods=['GET'])
@@ -211,6 +228,18 @@ def get_categories():
     return jsonify([cat.to_dict(include_children=True) for cat in root_categories])
 
 
+@admin_bp.route('/api/categories/<int:category_id>/tree')
+@login_required
+def get_category_tree(category_id):
+    """Get a category's breadcrumbs and every category below it, at any depth."""
+    category = Category.query.get_or_404(category_id)
+    return jsonify({
+        'category': category.to_dict(),
+        'breadcrumbs': [cat.to_dict() for cat in breadcrumbs(category_id)],
+        'descendants': [cat.to_dict() for cat in descendants(category_id)]
+    })
+
+
 @admin_bp.route('/api/categories', methods=['POST'])
 @login_required
 def create_category():
@@ -261,9 +290,14 @@ def update_category(category_id):
             category.name = data['name']
             category.slug = slugify(data['name'])
         if 'parent_id' in data:
-            # Prevent a category from being its own parent
+            # Prevent a category from being its own parent or ancestor
             if data['parent_id'] == category_id:
                 return jsonify({'success': False, 'error': 'A category cannot be its own parent'}), 400
+            if data['parent_id'] is not None:
+                if not db.session.get(Category, data['parent_id']):
+                    return jsonify({'success': False, 'error': 'Parent category not found'}), 400
+                if is_in_subtree(data['parent_id'], category_id):
+                    return jsonify({'success': False, 'error': 'A category cannot be moved under one of its sub-categories'}), 400
             category.parent_id = data['parent_id']
         if 'description' in data:
             category.description = data['description']
@@ -334,6 +368,28 @@ def manage_categories():
     return render_template('admin/categories.html')
 
 
+@admin_bp.route('/orders')
+@login_required
+def manage_orders():
+    """Order list page (rows are loaded from the orders API)."""
+    return render_template('admin/orders.html', order_statuses=ORDER_STATUSES, payment_statuses=PAYMENT_STATUSES)
+
+
+@admin_bp.route('/orders/<int:order_id>')
+@login_required
+def view_order(order_id):
+    """Order detail page."""
+    order = order_with_items_query(order_id).first_or_404()
+    return render_template('admin/order_detail.html', order=order.to_dict(include_items=True))
+
+
+@admin_bp.route('/queries')
+@login_required
+def query_stats():
+    """Query profiler page: the endpoints spending the most time in SQL."""
+    return render_template('admin/queries.html')
+
+
 @admin_bp.route('/about')
 @login_required
 def edit_about():
@@ -413,35 +469,25 @@ def update_contact_content():
 @admin_bp.route('/api/items')
 @login_required
 def get_items():
-    """Get all items with optional category filter."""
-    category_id = request.args.get('category_id')
-    query = Service.query
+    """
+    Items by id, one page at a time.
     
-    if category_id:
-        try:
-            category_id = int(category_id)
-            query = query.filter_by(category_id=category_id)
-        except (ValueError, TypeError):
-            pass
-    
-    items = query.all()
-    return jsonify([{
-        'id': item.id,
-        'name': item.name,
-        'description': item.description,
-        'price_base': item.price_base,
-        'category_id': item.category_id,
-        'sub_category_id': item.sub_category_id,
-        'category_name': item.category_obj.name if item.category_obj else None,
-        'sub_category_name': item.sub_category_obj.name if item.sub_category_obj else None,
-        'image_url': item.image_url,
-        'is_active': item.is_active,
-        'media_gallery': item.media_gallery or [],
-        'bulk_pricing': item.bulk_pricing or [],
-        'variants': item.variants or [],
-        'created_at': item.created_at.isoformat()
-    } for item in items])
-
+    Query args: fields (comma-separated; default is a summary without the JSON columns),
+    category_id (category or sub-category), is_active (1/0), q (name contains),
+    limit, cursor (next_cursor from the previous page).
+    """
+    try:
+        fields = parse_item_fields(request.args.get('fields'))
+        filters = {'q': (request.args.get('q') or '').strip()}
+        if request.args.get('category_id'):
+            filters['category_id'] = int(request.args['category_id'])
+        if request.args.get('is_active') in ('0', '1'):
+            filters['is_active'] = request.args['is_active'] == '1'
+        limit = int(request.args.get('limit', ITEMS_PAGE_SIZE))
+        items, next_cursor = list_items(fields, filters, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'items': items, 'next_cursor': next_cursor})
 
 
 @admin_bp.route('/api/items/<int:item_id>')
@@ -465,11 +511,26 @@ def get_item(item_id):
         'media_gallery': item.media_gallery or [],
         'bulk_pricing': item.bulk_pricing or [],
         'variants': item.variants or [],
+        'weight_kg': item.weight_kg,
+        'length_cm': item.length_cm,
+        'width_cm': item.width_cm,
+        'height_cm': item.height_cm,
         'created_at': item.created_at.isoformat()
     })
 
 
 
+def parse_shipping_fields(data):
+    """Extract optional shipping weight/dimensions from item JSON ('' or None clears a dimension)."""
+    fields = {}
+    if data.get('weight_kg') not in (None, ''):
+        fields['weight_kg'] = float(data['weight_kg'])
+    for field in ('length_cm', 'width_cm', 'height_cm'):
+        if field in data:
+            fields[field] = float(data[field]) if data[field] not in (None, '') else None
+    return fields
+
+
 @admin_bp.route('/api/items', methods=['POST'])
 @login_required
 def create_item():
@@ -507,10 +568,12 @@ def create_item():
             is_active=data.get('is_active', True),
             media_gallery=data.get('media_gallery', []),
             bulk_pricing=data.get('bulk_pricing', []),
-            variants=data.get('variants', [])
+            variants=data.get('variants', []),
+            **parse_shipping_fields(data)
         )
         
         db.session.add(item)
+        sync_variant_index(item)
         db.session.commit()
         
         return jsonify({
@@ -524,6 +587,58 @@ def create_item():
         return jsonify({'success': False, 'error': str(e)}), 400
 
 
+@admin_bp.route('/api/items/import', methods=['POST'])
+@login_required
+def import_items():
+    """
+    Create or update many items from an uploaded CSV/JSON/NDJSON file (field `file`)
+    or a JSON body (a list of items, or {"items": [...]}). Items are matched by slug.
+    ?dry_run=1 only validates; ?skip_invalid=1 imports the valid rows even if some fail.
+    """
+    upload = request.files.get('file')
+    try:
+        if upload:
+            fmt = upload.filename.rsplit('.', 1)[-1].lower() if '.' in upload.filename else ''
+            rows = read_rows(upload.read().decode('utf-8-sig'), fmt)
+        else:
+            rows = read_rows(request.get_data(as_text=True), 'json')
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not rows:
+        return jsonify({'success': False, 'error': 'No items to import'}), 400
+
+    try:
+        report = import_catalog(
+            rows,
+            dry_run=request.args.get('dry_run') == '1',
+            skip_invalid=request.args.get('skip_invalid') == '1'
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify(report), 200 if report['success'] else 400
+
+
+@admin_bp.route('/api/items/bulk', methods=['POST'])
+@login_required
+def bulk_update_items_api():
+    """
+    Change many items with set-based UPDATEs. Body: {"ids": [...]} and/or {"filter": {...}},
+    plus "set" (is_active, is_featured, category_id, sub_category_id) and/or
+    "price" ({"percent": -10} or {"amount": 5}); "dry_run": true returns the counts only.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        selection, changes, price = parse_bulk_request(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        report = bulk_update_items(selection, changes, price, dry_run=bool(data.get('dry_run')))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify(dict(report, success=True)), 200
+
+
 @admin_bp.route('/api/items/<int:item_id>', methods=['PUT'])
 @login_required
 def update_item(item_id):
@@ -561,12 +676,24 @@ def update_item(item_id):
             item.bulk_pricing = data['bulk_pricing']
         if 'variants' in data:
             item.variants = data['variants']
+        for field, value in parse_shipping_fields(data).items():
+            setattr(item, field, value)
+        
+        # Compiled pricing is cached per revision
+        pricing_changed = any(key in data for key in ('price_base', 'bulk_pricing', 'variants'))
+        if pricing_changed:
+            item.pricing_revision = (item.pricing_revision or 0) + 1
+            sync_variant_index(item)
         
         db.session.commit()
         
+        # Bring open carts holding this item up to date with the new prices
+        repriced = reprice_open_carts([item.id]) if pricing_changed else None
+        
         return jsonify({
             'success': True,
-            'message': f'Item "{item.name}" updated successfully'
+            'message': f'Item "{item.name}" updated successfully',
+            'repriced': repriced
         }), 200
         
     except Exception as e:
@@ -584,6 +711,7 @@ def delete_item(item_id):
         
         db.session.delete(item)
         db.session.commit()
+        pricing_engine.invalidate(item_id)
         
         return jsonify({
             'success': True,
@@ -678,4 +806,171 @@ def delete_media(item_id, media_index):
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({'success': False, 'error': str(e)}), 400
\ No newline at end of file
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
+@admin_bp.route('/api/shipping/cache-stats')
+@login_required
+def get_shipping_cache_stats():
+    """Shipping rate cache instrumentation for this worker (hit ratio, upstream calls, prefetch)."""
+    stats = get_rate_cache().stats()
+    stats['prefetch'] = get_rate_prefetcher().stats()
+    return jsonify(stats)
+
+
+@admin_bp.route('/api/payments/client-stats')
+@login_required
+def get_payment_client_stats():
+    """Square API call latency for this worker (create_payment, refund_payment, retrieve_payment)."""
+    return jsonify(get_square_processor().stats.snapshot())
+
+
+@admin_bp.route('/api/queries')
+@login_required
+def get_query_stats():
+    """Per-endpoint query counts and SQL time for this worker, worst first, with recent slow/N+1 findings."""
+    return jsonify(get_query_profiler().snapshot())
+
+
+@admin_bp.route('/api/queries/reset', methods=['POST'])
+@login_required
+def reset_query_stats():
+    """Clear this worker's query statistics."""
+    get_query_profiler().reset()
+    return jsonify({'success': True})
+
+
+@admin_bp.route('/api/outbox/stats')
+@login_required
+def get_outbox_stats():
+    """Post-payment work queue: events by status and the oldest pending event's age."""
+    return jsonify(outbox_stats())
+
+
+@admin_bp.route('/api/orders')
+@login_required
+def get_orders():
+    """
+    Orders newest first, one page at a time.
+    
+    Query args: status, payment_status, start_date, end_date (YYYY-MM-DD, inclusive),
+    order_number, customer_email, limit, cursor (next_cursor from the previous page).
+    """
+    try:
+        filters = parse_order_filters(request.args)
+        limit = int(request.args.get('limit', PAGE_SIZE))
+        orders, next_cursor = list_orders(filters, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({
+        'orders': [order.to_dict(include_items=True) for order in orders],
+        'next_cursor': next_cursor
+    })
+
+
+@admin_bp.route('/api/sales/stats')
+@login_required
+def get_sales_stats():
+    """Sales totals (today, 7 days, `days`-day period), daily series and top services, from the rollup tables."""
+    try:
+        days = int(request.args.get('days', 30))
+        top = int(request.args.get('top', 10))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'days and top must be integers'}), 400
+    if not 1 <= days <= 366 or not 1 <= top <= 100:
+        return jsonify({'success': False, 'error': 'days must be 1-366 and top 1-100'}), 400
+    return jsonify(sales_summary(days=days, top=top))
+
+
+@admin_bp.route('/api/orders/<int:order_id>')
+@login_required
+def get_order(order_id):
+    """Get one order with its items."""
+    order = order_with_items_query(order_id).first_or_404()
+    return jsonify(order.to_dict(include_items=True))
+
+
+def stream_ndjson(events):
+    """Stream progress dicts as newline-delimited JSON."""
+    return Response(
+        stream_with_context(json.dumps(event) + '\n' for event in events),
+        mimetype='application/x-ndjson'
+    )
+
+
+@admin_bp.route('/api/orders/refund', methods=['POST'])
+@login_required
+def batch_refund_orders():
+    """Refund a list of paid orders in full, streaming one NDJSON line per order and a summary."""
+    data = request.get_json(silent=True) or {}
+    order_ids = data.get('order_ids')
+    if not isinstance(order_ids, list) or not order_ids:
+        return jsonify({'success': False, 'error': 'order_ids must be a non-empty list'}), 400
+    try:
+        order_ids = list(dict.fromkeys(int(order_id) for order_id in order_ids))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'order_ids must be integers'}), 400
+    
+    config = current_app.config
+    return stream_ndjson(refund_orders(
+        get_square_processor(), order_ids,
+        workers=config.get('SQUARE_BATCH_WORKERS', 8), rate=config.get('SQUARE_BATCH_RATE', 10)
+    ))
+
+
+@admin_bp.route('/api/orders/reconcile', methods=['POST'])
+@login_required
+def batch_reconcile_orders():
+    """Check payment_status of orders placed between start_date and end_date (inclusive) against Square."""
+    data = request.get_json(silent=True) or {}
+    if not data.get('start_date') or not data.get('end_date'):
+        return jsonify({'success': False, 'error': 'start_date and end_date are required'}), 400
+    try:
+        start, end = parse_date_range(data['start_date'], data['end_date'])
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    config = current_app.config
+    return stream_ndjson(reconcile_payments(
+        get_square_processor(), start, end,
+        workers=config.get('SQUARE_BATCH_WORKERS', 8), rate=config.get('SQUARE_BATCH_RATE', 10)
+    ))
+
+
+@admin_bp.route('/api/export/<dataset>.<fmt>', methods=['GET'])
+@login_required
+def export_data(dataset, fmt):
+    """
+    Stream orders (with items), the catalog or categories as CSV or NDJSON.
+    Gzipped on the fly when the client accepts gzip (or ?gzip=1 for a .gz download).
+    Orders take the same filters as the order list.
+    """
+    if dataset not in EXPORTS or fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': f"Unknown export: {dataset}.{fmt}"}), 404
+    filters = None
+    if dataset == 'orders':
+        try:
+            filters = parse_order_filters(request.args)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+    download = request.args.get('gzip') == '1'
+    compress = download or 'gzip' in request.accept_encodings
+    filename = f"{dataset}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}" + ('.gz' if download else '')
+    response = Response(
+        stream_with_context(export_chunks(dataset, fmt, filters, compress=compress)),
+        mimetype='application/gzip' if download else EXPORT_FORMATS[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress and not download:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@admin_bp.route('/api/shipping/cache', methods=['DELETE'])
+@login_required
+def clear_shipping_cache():
+    """Clear cached shipping rate quotes."""
+    get_rate_cache().clear()
+    return jsonify({'success': True, 'message': 'Shipping rate cache cleared'}), 200
@@ -0,0 +1,238 @@
+"""
+Catalog maintenance helpers shared by the admin item endpoints.
+"""
+
+from sqlalchemy import and_, case, func, literal, or_, select, update
+
+from app import db
+from app.category_tree import subtree_ids
+from app.models import Category, Service, ServiceVariant
+from app.pricing import pricing_engine, reprice_open_carts
+
+
+def compute_min_price(price_base, variants):
+    """Lowest purchasable price of an item: base price or any available variant price."""
+    prices = [price_base] if price_base is not None else []
+    prices.extend(
+        float(variant['price'])
+        for variant in (variants or [])
+        if variant.get('price') is not None and variant.get('is_available', True)
+    )
+    return min(prices) if prices else None
+
+
+def sync_variant_index(service):
+    """
+    Rebuild a service's service_variants rows and min_price from its variants JSON.
+
+    Must be called whenever `variants` or `price_base` changes; the caller commits.
+
+    Raises:
+        ValueError: If a SKU is repeated or already used by another item
+    """
+    variants = service.variants or []
+
+    skus = [(variant.get('sku') or '').strip() for variant in variants]
+    used = [sku for sku in skus if sku]
+    if len(used) != len(set(used)):
+        raise ValueError('Each variant SKU must be unique')
+    if used:
+        query = ServiceVariant.query.filter(ServiceVariant.sku.in_(used))
+        if service.id is not None:
+            query = query.filter(ServiceVariant.service_id != service.id)
+        conflict = query.first()
+        if conflict:
+            raise ValueError(f'SKU "{conflict.sku}" is already used by another item')
+
+    if service.id is None:
+        db.session.flush()
+    else:
+        # Delete first so re-saving the same SKUs does not trip the unique index
+        ServiceVariant.query.filter_by(service_id=service.id).delete(synchronize_session=False)
+        db.session.expire(service, ['variant_index'])
+
+    db.session.add_all([
+        ServiceVariant(
+            service_id=service.id,
+            name=variant.get('name') or '',
+            sku=sku or None,
+            price=float(variant['price']) if variant.get('price') is not None else None,
+            is_available=variant.get('is_available', True),
+            position=position
+        )
+        for position, (variant, sku) in enumerate(zip(variants, skus))
+    ])
+    service.min_price = compute_min_price(service.price_base, variants)
+
+
+# Bulk operations ------------------------------------------------------------
+
+BULK_SET_FIELDS = ('is_active', 'is_featured', 'category_id', 'sub_category_id')
+BULK_FILTERS = ('category_id', 'is_active', 'is_featured', 'q')
+
+
+def _as_bool(value, name):
+    if not isinstance(value, bool):
+        raise ValueError(f'{name} must be true or false')
+    return value
+
+
+def parse_bulk_request(data):
+    """
+    Validate a bulk operation body. Returns (selection, changes, price), where
+    selection is a WHERE clause, changes maps columns to new values and price
+    is {'percent': p} or {'amount': a} (or None).
+
+    Raises:
+        ValueError: With a message for the client
+    """
+    conditions = []
+    ids = data.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not ids:
+            raise ValueError('ids must be a non-empty list')
+        try:
+            conditions.append(Service.id.in_({int(item_id) for item_id in ids}))
+        except (TypeError, ValueError):
+            raise ValueError('ids must be integers')
+
+    filters = data.get('filter') or {}
+    unknown = set(filters) - set(BULK_FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filter(s): {', '.join(sorted(unknown))}")
+    if filters.get('category_id') is not None:
+        subtree = subtree_ids(int(filters['category_id']))
+        conditions.append(or_(Service.category_id.in_(subtree), Service.sub_category_id.in_(subtree)))
+    for name in ('is_active', 'is_featured'):
+        if name in filters:
+            conditions.append(getattr(Service, name) == _as_bool(filters[name], name))
+    if (filters.get('q') or '').strip():
+        conditions.append(Service.name.ilike(f"%{filters['q'].strip()}%"))
+    if not conditions:
+        raise ValueError('Select items with ids or a filter')
+
+    changes = {}
+    for name, value in (data.get('set') or {}).items():
+        if name not in BULK_SET_FIELDS:
+            raise ValueError(f'Cannot bulk-set {name}')
+        if name in ('is_active', 'is_featured'):
+            changes[name] = _as_bool(value, name)
+        elif value is None and name == 'sub_category_id':
+            changes[name] = None
+        else:
+            if not db.session.get(Category, int(value)):
+                raise ValueError(f'Category {value} not found')
+            changes[name] = int(value)
+
+    price = data.get('price')
+    if price is not None:
+        if not isinstance(price, dict) or len(price) != 1 or not set(price) <= {'percent', 'amount'}:
+            raise ValueError('price must be {"percent": n} or {"amount": n}')
+        (kind, value), = price.items()
+        value = float(value)
+        if kind == 'percent' and value <= -100:
+            raise ValueError('percent must be greater than -100')
+        price = {kind: value}
+
+    if not changes and not price:
+        raise ValueError('Nothing to change: give "set" and/or "price"')
+    return and_(*conditions), changes, price
+
+
+def _adjusted(price, change):
+    """Python twin of _adjusted_sql for JSON-held tier/variant prices."""
+    if price is None or price == '':
+        return price
+    value = float(price) * (1 + change['percent'] / 100) if 'percent' in change else float(price) + change['amount']
+    return max(round(value, 2), 0.0)
+
+
+def _adjusted_sql(column, change):
+    """A price column after a percent/amount change, rounded to cents and floored at zero (NULL stays NULL)."""
+    value = column * (1 + change['percent'] / 100) if 'percent' in change else column + change['amount']
+    value = func.round(value, 2)
+    return case((value < 0, 0.0), else_=value)
+
+
+def bulk_update_items(selection, changes, price=None, dry_run=False):
+    """
+    Apply a bulk change to every item matching `selection` with set-based UPDATEs.
+
+    A price change moves price_base, bulk tier prices and variant prices,
+    bumps pricing_revision and recomputes min_price from the variant index;
+    open carts holding the items are repriced. Compiled pricing is dropped
+    once at the end. With dry_run, only the affected counts are returned.
+    """
+    counts = db.session.execute(
+        select(
+            func.count(),
+            func.sum(case((or_(*(getattr(Service, name).is_distinct_from(value) for name, value in changes.items())), 1),
+                          else_=0)) if changes else literal(0),
+            func.sum(case((Service.price_base.isnot(None), 1), else_=0)),
+        ).select_from(Service).where(selection)
+    ).one()
+    report = {'matched': counts[0], 'changed': (counts[1] or 0) if changes else 0,
+              'repriced_items': (counts[2] or 0) if price else 0, 'dry_run': dry_run}
+    if dry_run or not counts[0]:
+        report.setdefault('carts_repriced', 0)
+        return report
+
+    item_ids = []
+    try:
+        if price:
+            item_ids = db.session.scalars(select(Service.id).where(selection)).all()
+            # JSON copies of tier/variant prices are rewritten for the items that have any
+            rows = db.session.execute(
+                select(Service.id, Service.bulk_pricing, Service.variants).where(selection)
+            ).all()
+            json_updates = [
+                {
+                    'id': row.id,
+                    'bulk_pricing': [
+                        dict(tier, price=_adjusted(tier['price'], price)) if 'price' in tier else tier
+                        for tier in row.bulk_pricing or []
+                    ],
+                    'variants': [
+                        dict(variant, price=_adjusted(variant['price'], price)) if 'price' in variant else variant
+                        for variant in row.variants or []
+                    ],
+                }
+                for row in rows if row.bulk_pricing or row.variants
+            ]
+            if json_updates:
+                db.session.execute(update(Service), json_updates)
+            db.session.execute(
+                update(ServiceVariant)
+                .where(ServiceVariant.service_id.in_(select(Service.id).where(selection)))
+                .values(price=_adjusted_sql(ServiceVariant.price, price))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.execute(
+                update(Service).where(selection).values(
+                    price_base=_adjusted_sql(Service.price_base, price),
+                    pricing_revision=func.coalesce(Service.pricing_revision, 0) + 1,
+                ).execution_options(synchronize_session=False)
+            )
+            cheapest_variant = (
+                select(func.min(ServiceVariant.price))
+                .where(ServiceVariant.service_id == Service.id, ServiceVariant.is_available.isnot(False),
+                       ServiceVariant.price.isnot(None))
+                .scalar_subquery()
+            )
+            changes = dict(changes, min_price=case(
+                (Service.price_base.is_(None), cheapest_variant),
+                (cheapest_variant < Service.price_base, cheapest_variant),
+                else_=Service.price_base
+            ))
+        # Last, since it may change columns the selection filters on
+        report['updated'] = db.session.execute(
+            update(Service).where(selection).values(**changes).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    pricing_engine.invalidate()
+    report['carts_repriced'] = reprice_open_carts(item_ids)['carts_flagged'] if item_ids else 0
+    return report
@@ -0,0 +1,310 @@
+"""
+Bulk Catalog Import
+
+Creates and updates many items at once from CSV, JSON or NDJSON (the
+formats produced by the catalog export). Rows are matched to existing items
+by slug (derived from the name when absent), and categories may be given by
+slug or id.
+
+Everything is resolved and validated in memory before anything is written:
+existing slugs, categories and variant SKUs are loaded with one query each.
+Valid rows are then written with executemany batches (inserts, updates and
+service_variants rows), committing once per batch, and the pricing cache
+and open carts are refreshed once at the end.
+"""
+
+import csv
+import io
+import json
+from typing import Dict, List
+
+from slugify import slugify
+from sqlalchemy import delete, insert, select, update
+
+from app import db
+from app.catalog import compute_min_price
+from app.models import Category, Service, ServiceVariant
+from app.pricing import pricing_engine, reprice_open_carts
+
+BATCH_SIZE = 2000
+
+TEXT_FIELDS = ('name', 'description', 'long_description', 'image_url')
+BOOL_FIELDS = ('is_active', 'is_featured')
+DIMENSION_FIELDS = ('length_cm', 'width_cm', 'height_cm')
+JSON_FIELDS = ('bulk_pricing', 'variants', 'media_gallery')
+PRICING_FIELDS = ('price_base', 'bulk_pricing', 'variants')
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'off'}
+
+
+def read_rows(data, fmt) -> List[Dict]:
+    """
+    Rows from an uploaded file's text. `fmt` is csv, json (a list, or {"items": [...]}) or ndjson.
+
+    Raises:
+        ValueError: If the file cannot be parsed
+    """
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(data)))
+    try:
+        if fmt == 'ndjson':
+            rows = [json.loads(line) for line in data.splitlines() if line.strip()]
+            if not all(isinstance(row, dict) for row in rows):
+                raise ValueError('Each NDJSON line must be an object')
+            return rows
+        if fmt == 'json':
+            rows = json.loads(data)
+            rows = rows.get('items') if isinstance(rows, dict) else rows
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise ValueError('JSON must be a list of objects or {"items": [...]}')
+            return rows
+    except json.JSONDecodeError as e:
+        raise ValueError(f'Invalid JSON: {e}')
+    raise ValueError(f'Unknown format: {fmt}')
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _float(value, field, errors, minimum=0.0):
+    if _blank(value):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        errors.append(f'{field} must be a number')
+        return None
+    if number < minimum:
+        errors.append(f'{field} must be at least {minimum:g}')
+    return number
+
+
+def _bool(value, field, errors, default):
+    if _blank(value):
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    errors.append(f'{field} must be true or false')
+    return default
+
+
+def _json_list(value, field, errors):
+    if _blank(value):
+        return []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            errors.append(f'{field} must be a JSON list')
+            return []
+    if not isinstance(value, list) or not all(isinstance(entry, dict) for entry in value):
+        errors.append(f'{field} must be a list of objects')
+        return []
+    return value
+
+
+class CatalogImport:
+    """
+    One import run: call validate() (cheap, read-only) and then write().
+
+    After validate(), `errors` holds one {'row', 'slug', 'errors'} entry per
+    invalid row (row numbers are 1-based data rows), and `creates` / `updates`
+    hold the prepared column values of the valid rows.
+    """
+
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+        self.errors = []
+        self.creates = []
+        self.updates = []
+        self.variants = {}  # slug -> [variant dicts], for rows that set variants
+        self.repriced = []
+
+    def _lookups(self):
+        categories = db.session.execute(select(Category.id, Category.slug)).all()
+        self.category_ids = {slug: id for id, slug in categories}
+        self.category_ids.update({str(id): id for id, _ in categories})
+        self.existing = {
+            row.slug: row for row in db.session.execute(
+                select(Service.id, Service.slug, Service.price_base, Service.variants, Service.pricing_revision)
+            )
+        }
+        self.sku_owners = dict(db.session.execute(
+            select(ServiceVariant.sku, ServiceVariant.service_id).where(ServiceVariant.sku.isnot(None))
+        ).all())
+
+    def _category(self, row, field, errors, required):
+        value = row.get(field) if not _blank(row.get(field)) else row.get(f'{field}_id')
+        if _blank(value):
+            if required:
+                errors.append(f'{field} is required')
+            return None
+        category_id = self.category_ids.get(str(value).strip())
+        if category_id is None:
+            errors.append(f'Unknown {field}: {value}')
+        return category_id
+
+    def _prepare(self, row, existing, errors) -> Dict:
+        """Column values for the fields present in a row (all fields for a new item)."""
+        def present(field):
+            return existing is None or field in row
+
+        values = {}
+        for field in TEXT_FIELDS:
+            if present(field):
+                values[field] = (row.get(field) or '').strip() if field == 'name' else row.get(field) or ''
+        if present('price_base'):
+            values['price_base'] = _float(row.get('price_base'), 'price_base', errors)
+        if existing is None or any(key in row for key in ('category', 'category_id')):
+            values['category_id'] = self._category(row, 'category', errors, required=True)
+        if existing is None or any(key in row for key in ('sub_category', 'sub_category_id')):
+            values['sub_category_id'] = self._category(row, 'sub_category', errors, required=False)
+        for field in BOOL_FIELDS:
+            if present(field):
+                values[field] = _bool(row.get(field), field, errors, default=field == 'is_active')
+        if present('weight_kg'):
+            values['weight_kg'] = _float(row.get('weight_kg'), 'weight_kg', errors) or 0.5
+        for field in DIMENSION_FIELDS:
+            if present(field):
+                values[field] = _float(row.get(field), field, errors)
+        for field in JSON_FIELDS:
+            if present(field):
+                values[field] = _json_list(row.get(field), field, errors)
+
+        for tier in values.get('bulk_pricing', []):
+            if _blank(tier.get('min_quantity')) or _blank(tier.get('price')):
+                errors.append('Each bulk_pricing tier needs min_quantity and price')
+                break
+            _float(tier['min_quantity'], 'bulk_pricing min_quantity', errors, minimum=1)
+            _float(tier['price'], 'bulk_pricing price', errors)
+        for variant in values.get('variants', []):
+            _float(variant.get('price'), 'variant price', errors)
+        if 'name' in values and not values['name']:
+            errors.append('name is required')
+        return values
+
+    def validate(self) -> bool:
+        """Resolve and check every row. Returns True if all rows are valid."""
+        self._lookups()
+        seen_slugs = {}
+        seen_skus = {}
+        for number, row in enumerate(self.rows, start=1):
+            errors = []
+            slug = (row.get('slug') or '').strip() or slugify(row.get('name') or '')
+            existing = self.existing.get(slug)
+            if not slug:
+                errors.append('name or slug is required')
+            elif slug in seen_slugs:
+                errors.append(f'Duplicate slug "{slug}" (also row {seen_slugs[slug]})')
+            else:
+                seen_slugs[slug] = number
+
+            values = self._prepare(row, existing, errors)
+
+            if 'variants' in values:
+                skus = [(variant.get('sku') or '').strip() for variant in values['variants']]
+                for sku in filter(None, skus):
+                    owner = self.sku_owners.get(sku)
+                    if sku in seen_skus:
+                        errors.append(f'SKU "{sku}" is repeated (also row {seen_skus[sku]})')
+                    elif owner is not None and (existing is None or owner != existing.id):
+                        errors.append(f'SKU "{sku}" is already used by another item')
+                    seen_skus.setdefault(sku, number)
+
+            if errors:
+                self.errors.append({'row': number, 'slug': slug or None, 'errors': errors})
+                continue
+
+            values['slug'] = slug
+            if 'variants' in values:
+                self.variants[slug] = values['variants']
+            if existing is None:
+                values['min_price'] = compute_min_price(values['price_base'], values['variants'])
+                self.creates.append(values)
+            elif len(values) > 1:
+                values['id'] = existing.id
+                if any(field in values for field in PRICING_FIELDS):
+                    values['pricing_revision'] = (existing.pricing_revision or 0) + 1
+                    values['min_price'] = compute_min_price(
+                        values.get('price_base', existing.price_base), values.get('variants', existing.variants)
+                    )
+                    self.repriced.append(existing.id)
+                self.updates.append(values)
+        return not self.errors
+
+    def write(self) -> Dict[str, int]:
+        """Insert and update the valid rows in batches; returns counts. validate() must run first."""
+        ids = {}
+        try:
+            for start in range(0, len(self.creates), BATCH_SIZE):
+                batch = self.creates[start:start + BATCH_SIZE]
+                for id, slug in db.session.execute(insert(Service).returning(Service.id, Service.slug), batch):
+                    ids[slug] = id
+                self._write_variants(batch, ids)
+                db.session.commit()
+            for start in range(0, len(self.updates), BATCH_SIZE):
+                batch = self.updates[start:start + BATCH_SIZE]
+                # Group rows by the columns they set, so each group is one executemany
+                groups = {}
+                for values in batch:
+                    groups.setdefault(tuple(sorted(values)), []).append(values)
+                for rows in groups.values():
+                    db.session.execute(update(Service), rows)
+                self._write_variants(batch, {values['slug']: values['id'] for values in batch})
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        pricing_engine.invalidate()
+        repriced = reprice_open_carts(self.repriced) if self.repriced else None
+        return {'created': len(self.creates), 'updated': len(self.updates), 'failed': len(self.errors),
+                'carts_repriced': repriced['carts_flagged'] if repriced else 0}
+
+    def _write_variants(self, batch, ids):
+        """Replace service_variants rows for the items in a batch that set variants."""
+        service_ids = [ids[values['slug']] for values in batch if values['slug'] in self.variants]
+        if not service_ids:
+            return
+        db.session.execute(delete(ServiceVariant).where(ServiceVariant.service_id.in_(service_ids)))
+        rows = [
+            {
+                'service_id': ids[values['slug']],
+                'name': variant.get('name') or '',
+                'sku': (variant.get('sku') or '').strip() or None,
+                'price': float(variant['price']) if not _blank(variant.get('price')) else None,
+                'is_available': variant.get('is_available', True),
+                'position': position,
+            }
+            for values in batch if values['slug'] in self.variants
+            for position, variant in enumerate(self.variants[values['slug']])
+        ]
+        if rows:
+            db.session.execute(insert(ServiceVariant), rows)
+
+
+def import_catalog(rows, dry_run=False, skip_invalid=False) -> Dict:
+    """
+    Validate and import catalog rows.
+
+    Nothing is written if any row is invalid, unless skip_invalid is set (then
+    the valid rows are imported and the invalid ones reported). A dry run only
+    validates. Returns {'success', 'created', 'updated', 'failed', 'errors', ...}.
+    """
+    run = CatalogImport(rows)
+    valid = run.validate()
+    report = {'success': valid, 'rows': len(rows), 'created': len(run.creates), 'updated': len(run.updates),
+              'failed': len(run.errors), 'errors': run.errors, 'dry_run': dry_run}
+    if dry_run or (not valid and not skip_invalid):
+        if not dry_run:
+            report.update(created=0, updated=0)
+        return report
+    report.update(run.write(), success=True)
+    return report
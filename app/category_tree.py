@@ -0,0 +1,87 @@
+"""
+Category Tree Queries
+
+Categories form a tree through `parent_id`. The `category_paths` closure
+table (kept in sync by mapper events on Category, see app/models.py) stores
+every ancestor/descendant pair with its distance, so subtree listing,
+breadcrumbs and cycle checks are each one indexed query at any depth instead
+of a walk up or down the tree.
+"""
+
+from sqlalchemy import delete, func, insert, literal, select
+
+from app import db
+from app.models import Category, CategoryPath
+
+
+def subtree_ids(category_id):
+    """Select of the ids in a category's subtree (the category included), for use in IN filters."""
+    return select(CategoryPath.descendant_id).where(CategoryPath.ancestor_id == category_id)
+
+
+def descendants(category_id, include_self=False):
+    """Categories below a category, nearest first, then by sort order."""
+    query = (
+        Category.query.join(CategoryPath, CategoryPath.descendant_id == Category.id)
+        .filter(CategoryPath.ancestor_id == category_id)
+    )
+    if not include_self:
+        query = query.filter(CategoryPath.depth > 0)
+    return query.order_by(CategoryPath.depth, Category.order, Category.id).all()
+
+
+def breadcrumbs(category_id):
+    """The path from the root down to a category (inclusive)."""
+    return (
+        Category.query.join(CategoryPath, CategoryPath.ancestor_id == Category.id)
+        .filter(CategoryPath.descendant_id == category_id)
+        .order_by(CategoryPath.depth.desc())
+        .all()
+    )
+
+
+def is_in_subtree(category_id, root_id):
+    """True if `category_id` is `root_id` or one of its descendants."""
+    return db.session.scalar(
+        select(literal(True)).where(
+            CategoryPath.ancestor_id == root_id, CategoryPath.descendant_id == category_id
+        )
+    ) is not None
+
+
+def rebuild_category_paths():
+    """
+    Recompute the closure table from `categories.parent_id` with one recursive query.
+
+    Used to backfill databases created before the table existed. Depth is capped
+    at the number of categories so a pre-existing parent cycle cannot loop forever.
+    Returns the number of paths written.
+    """
+    categories = Category.__table__
+    paths = select(
+        categories.c.id.label('ancestor_id'), categories.c.id.label('descendant_id'), literal(0).label('depth')
+    ).cte('paths', recursive=True)
+    child = categories.alias('child')
+    paths = paths.union_all(
+        select(paths.c.ancestor_id, child.c.id, paths.c.depth + 1)
+        .where(child.c.parent_id == paths.c.descendant_id)
+        .where(paths.c.depth < select(func.count()).select_from(categories).scalar_subquery())
+    )
+
+    db.session.execute(delete(CategoryPath))
+    db.session.execute(insert(CategoryPath).from_select(
+        ['ancestor_id', 'descendant_id', 'depth'],
+        select(paths.c.ancestor_id, paths.c.descendant_id, func.min(paths.c.depth))
+        .group_by(paths.c.ancestor_id, paths.c.descendant_id)
+    ))
+    written = db.session.scalar(select(func.count()).select_from(CategoryPath))
+    db.session.commit()
+    return written
+
+
+def ensure_category_paths():
+    """Backfill the closure table if it is empty while categories exist."""
+    if db.session.scalar(select(CategoryPath.depth).limit(1)) is None and \
+            db.session.scalar(select(Category.id).limit(1)) is not None:
+        return rebuild_category_paths()
+    return 0
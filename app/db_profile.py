@@ -0,0 +1,68 @@
+"""
+SQLite Connection Profile
+
+With SQLite's defaults (rollback journal, synchronous=FULL) every write
+locks the whole file against readers and every commit waits for fsync, so
+under several workers cart and checkout writes queue up and catalog reads
+block behind them. The profile selected by SQLITE_PROFILE is applied to each
+new connection with PRAGMAs:
+
+  - journal_mode=WAL: readers keep reading while one writer appends to the log
+  - synchronous=NORMAL: fsync at checkpoints rather than on every commit (safe with WAL)
+  - busy_timeout: how long to wait for a competing writer before "database is locked"
+  - mmap_size, cache_size: serve reads from memory-mapped pages and a larger page cache
+  - temp_store=MEMORY: sorts and temporary indexes stay off disk
+
+Other databases are left untouched.
+"""
+
+import logging
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PROFILES = {
+    # SQLite's own defaults
+    'default': {},
+    # Several gunicorn workers sharing one database file
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,  # ms
+        'mmap_size': 256 * 1024 * 1024,  # bytes
+        'cache_size': -64000,  # negative = KiB, i.e. ~64 MB per connection
+        'temp_store': 'MEMORY',
+    },
+}
+
+
+def sqlite_pragmas(config):
+    """PRAGMAs for the configured profile, with SQLITE_PRAGMAS overriding single values."""
+    name = config.get('SQLITE_PROFILE', 'default')
+    if name not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PROFILE '{name}' (expected one of: {', '.join(SQLITE_PROFILES)})")
+    return {**SQLITE_PROFILES[name], **(config.get('SQLITE_PRAGMAS') or {})}
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    """Run the PRAGMAs on a raw sqlite3 connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def init_db_profile(app, db):
+    """Apply the configured profile to every new connection of the app's SQLite engines."""
+    pragmas = sqlite_pragmas(app.config)
+    if not pragmas:
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name != 'sqlite':
+                continue
+            event.listen(engine, 'connect', lambda dbapi_connection, record: apply_pragmas(dbapi_connection, pragmas))
+            logger.debug(f"SQLite profile {app.config.get('SQLITE_PROFILE')} on {engine.url}: {pragmas}")
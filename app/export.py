@@ -0,0 +1,240 @@
+"""
+Streaming Exports
+
+Admin exports of orders (with items), the catalog (with variants and bulk
+pricing) and categories as CSV or NDJSON. Rows are read with server-side
+batching (`yield_per`), serialized a batch at a time and optionally gzipped
+on the fly, so the response is produced incrementally and memory use stays
+flat however large the table is.
+
+The catalog CSV keeps variants and bulk pricing as JSON cells, so the file
+can be edited and loaded again with the bulk import.
+"""
+
+import csv
+import io
+import json
+import zlib
+from collections import defaultdict
+from datetime import date, datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.models import Category, Order, OrderItem, Service
+from app.orders import order_list_query
+
+BATCH_SIZE = 500
+
+ORDER_COLUMNS = [
+    'order_id', 'order_number', 'created_at', 'status', 'payment_status', 'customer_name', 'customer_email',
+    'customer_phone', 'customer_address', 'customer_city', 'customer_state', 'customer_zip', 'shipping_method',
+    'shipping_cost', 'subtotal', 'total_amount', 'square_payment_id', 'square_refund_id', 'tracking_number',
+    'item_service_id', 'item_service_name', 'item_quantity', 'item_unit_price', 'item_custom_options'
+]
+CATALOG_COLUMNS = [
+    'id', 'name', 'slug', 'category', 'sub_category', 'description', 'long_description', 'price_base',
+    'min_price', 'bulk_pricing', 'variants', 'image_url', 'is_active', 'is_featured', 'weight_kg',
+    'length_cm', 'width_cm', 'height_cm', 'created_at'
+]
+CATEGORY_COLUMNS = ['id', 'name', 'slug', 'parent_id', 'parent', 'description', 'order', 'is_active']
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+# --------------------------------------------------------------------- rows
+
+ORDER_FIELDS = [
+    'id', 'order_number', 'customer_email', 'customer_name', 'customer_phone', 'customer_address', 'customer_city',
+    'customer_state', 'customer_zip', 'shipping_method', 'shipping_service_name', 'shipping_cost',
+    'tracking_number', 'subtotal', 'total_amount', 'status', 'payment_status', 'square_payment_id',
+    'square_refund_id', 'receipt_url', 'created_at', 'updated_at'
+]
+ITEM_FIELDS = ['id', 'service_id', 'service_name', 'quantity', 'unit_price', 'custom_options']
+
+
+def order_records(filters=None):
+    """
+    One dict per order (the shape of Order.to_dict(include_items=True)), in id order.
+
+    Orders are read as plain rows in batches of BATCH_SIZE, and each batch's
+    items with one query over that batch's id range (same filters), so no ORM
+    objects are built and every statement has a constant handful of
+    parameters (SQLALCHEMY_RECORD_QUERIES keeps them for the whole request).
+    """
+    orders = order_list_query(filters or {}).order_by(None)
+    statement = (
+        orders.order_by(Order.id)
+        .with_entities(*(getattr(Order, name) for name in ORDER_FIELDS))
+        .statement
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+    item_columns = [getattr(OrderItem, name) for name in ITEM_FIELDS]
+    for batch in db.session.execute(statement).mappings().partitions():
+        batch_ids = orders.with_entities(Order.id).filter(Order.id.between(batch[0]['id'], batch[-1]['id']))
+        items = defaultdict(list)
+        for item in db.session.execute(
+            select(OrderItem.order_id, *item_columns)
+            .where(OrderItem.order_id.in_(batch_ids.scalar_subquery()))
+            .order_by(OrderItem.order_id, OrderItem.id)
+        ):
+            items[item.order_id].append(dict(
+                zip(ITEM_FIELDS, item[1:]), line_total=round((item.unit_price or 0) * (item.quantity or 0), 2)
+            ))
+        for order in batch:
+            record = dict(order)
+            for name in ('created_at', 'updated_at'):
+                record[name] = record[name].isoformat() if record[name] else None
+            record['items'] = items[order['id']]
+            yield record
+
+
+def order_csv_rows(filters=None):
+    """One CSV row per order item (order columns repeated); orders without items get one row."""
+    for order in order_records(filters):
+        base = [
+            order['id'], order['order_number'], order['created_at'], order['status'], order['payment_status'],
+            order['customer_name'], order['customer_email'], order['customer_phone'], order['customer_address'],
+            order['customer_city'], order['customer_state'], order['customer_zip'], order['shipping_method'],
+            order['shipping_cost'], order['subtotal'], order['total_amount'], order['square_payment_id'],
+            order['square_refund_id'], order['tracking_number']
+        ]
+        for item in order['items'] or [None]:
+            if item is None:
+                yield base + [None] * 5
+            else:
+                options = json.dumps(item['custom_options']) if item['custom_options'] else None
+                yield base + [item['service_id'], item['service_name'], item['quantity'], item['unit_price'], options]
+
+
+def _catalog_query():
+    parent = aliased(Category)
+    sub = aliased(Category)
+    return db.session.execute(
+        select(Service, parent.slug, sub.slug)
+        .outerjoin(parent, parent.id == Service.category_id)
+        .outerjoin(sub, sub.id == Service.sub_category_id)
+        .order_by(Service.id)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+
+
+def catalog_records():
+    """One dict per service, with category slugs, variants and bulk pricing."""
+    for service, category, sub_category in _catalog_query():
+        yield {
+            'id': service.id,
+            'name': service.name,
+            'slug': service.slug,
+            'category': category,
+            'sub_category': sub_category,
+            'description': service.description,
+            'long_description': service.long_description,
+            'price_base': service.price_base,
+            'min_price': service.min_price,
+            'bulk_pricing': service.bulk_pricing or [],
+            'variants': service.variants or [],
+            'image_url': service.image_url,
+            'is_active': service.is_active,
+            'is_featured': service.is_featured,
+            'weight_kg': service.weight_kg,
+            'length_cm': service.length_cm,
+            'width_cm': service.width_cm,
+            'height_cm': service.height_cm,
+            'created_at': service.created_at.isoformat() if service.created_at else None
+        }
+
+
+def catalog_csv_rows():
+    for record in catalog_records():
+        record['bulk_pricing'] = json.dumps(record['bulk_pricing'])
+        record['variants'] = json.dumps(record['variants'])
+        yield [record[column] for column in CATALOG_COLUMNS]
+
+
+def category_records():
+    """One dict per category, parents before children within id order."""
+    parent = aliased(Category)
+    rows = db.session.execute(
+        select(Category, parent.slug)
+        .outerjoin(parent, parent.id == Category.parent_id)
+        .order_by(Category.id)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+    for category, parent_slug in rows:
+        yield dict(category.to_dict(), parent=parent_slug)
+
+
+def category_csv_rows():
+    for record in category_records():
+        yield [record[column] for column in CATEGORY_COLUMNS]
+
+
+# Dataset -> (CSV header, CSV rows, NDJSON records); each takes the order filters only if it uses them
+EXPORTS = {
+    'orders': (ORDER_COLUMNS, order_csv_rows, order_records),
+    'catalog': (CATALOG_COLUMNS, catalog_csv_rows, catalog_records),
+    'categories': (CATEGORY_COLUMNS, category_csv_rows, category_records),
+}
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+# ------------------------------------------------------------ serialization
+
+def csv_chunks(header, rows, batch_size=BATCH_SIZE):
+    """CSV text, one chunk per batch of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(records, batch_size=BATCH_SIZE):
+    """NDJSON text, one chunk per batch of records."""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, default=_json_default))
+        if len(lines) >= batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip a stream of text chunks incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(dataset, fmt, filters=None, compress=False):
+    """Byte chunks of an export. Raises KeyError for an unknown dataset or format."""
+    header, csv_rows, records = EXPORTS[dataset]
+    args = (filters,) if dataset == 'orders' else ()
+    if fmt == 'csv':
+        chunks = csv_chunks(header, csv_rows(*args))
+    elif fmt == 'ndjson':
+        chunks = ndjson_chunks(records(*args))
+    else:
+        raise KeyError(fmt)
+    if compress:
+        return gzip_chunks(chunks)
+    return (chunk.encode() for chunk in chunks)
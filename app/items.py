@@ -0,0 +1,110 @@
+"""
+Admin Item Queries
+
+The admin item list is paged by id (keyset, like the order list) and
+projected: only the requested fields are selected, category names come from
+an outer join rather than lazy loads, and the large JSON columns are left
+out unless asked for (their lengths are available as *_count fields). Each
+page is a single SELECT whose size is bounded by `limit` and `fields`.
+"""
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.orm import aliased
+
+from app import db
+from app.category_tree import subtree_ids
+from app.models import Category, Service
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+_category = aliased(Category, name='category')
+_sub_category = aliased(Category, name='sub_category')
+
+# Public field name -> column expression
+ITEM_FIELDS = {
+    'id': Service.id,
+    'name': Service.name,
+    'slug': Service.slug,
+    'description': Service.description,
+    'long_description': Service.long_description,
+    'price_base': Service.price_base,
+    'min_price': Service.min_price,
+    'category_id': Service.category_id,
+    'sub_category_id': Service.sub_category_id,
+    'category_name': _category.name,
+    'sub_category_name': _sub_category.name,
+    'image_url': Service.image_url,
+    'is_active': Service.is_active,
+    'is_featured': Service.is_featured,
+    'weight_kg': Service.weight_kg,
+    'length_cm': Service.length_cm,
+    'width_cm': Service.width_cm,
+    'height_cm': Service.height_cm,
+    'media_gallery': Service.media_gallery,
+    'bulk_pricing': Service.bulk_pricing,
+    'variants': Service.variants,
+    'media_count': func.coalesce(func.json_array_length(Service.media_gallery), literal(0)),
+    'tier_count': func.coalesce(func.json_array_length(Service.bulk_pricing), literal(0)),
+    'variant_count': func.coalesce(func.json_array_length(Service.variants), literal(0)),
+    'created_at': Service.created_at,
+}
+DEFAULT_FIELDS = (
+    'id', 'name', 'description', 'price_base', 'category_id', 'sub_category_id', 'category_name',
+    'sub_category_name', 'image_url', 'is_active', 'is_featured', 'media_count', 'tier_count', 'variant_count',
+    'created_at'
+)
+JSON_FIELDS = ('media_gallery', 'bulk_pricing', 'variants')
+
+
+def parse_item_fields(value):
+    """Requested field names (always including id); raises ValueError for unknown names."""
+    if not value:
+        return list(DEFAULT_FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in ITEM_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return ['id'] + [name for name in dict.fromkeys(fields) if name != 'id']
+
+
+def list_items(fields, filters=None, cursor=None, limit=PAGE_SIZE):
+    """
+    One page of items with id greater than `cursor`, as dicts of the requested fields.
+
+    filters: category_id (matches items anywhere in that category's subtree), is_active, q (name contains).
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    filters = filters or {}
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = select(*(ITEM_FIELDS[name].label(name) for name in fields)).select_from(Service)
+    if 'category_name' in fields:
+        query = query.outerjoin(_category, _category.id == Service.category_id)
+    if 'sub_category_name' in fields:
+        query = query.outerjoin(_sub_category, _sub_category.id == Service.sub_category_id)
+
+    if filters.get('category_id') is not None:
+        subtree = subtree_ids(filters['category_id'])
+        query = query.where(Service.category_id.in_(subtree) | Service.sub_category_id.in_(subtree))
+    if filters.get('is_active') is not None:
+        query = query.where(Service.is_active == filters['is_active'])
+    if filters.get('q'):
+        query = query.where(Service.name.ilike(f"%{filters['q']}%"))
+    if cursor:
+        try:
+            query = query.where(Service.id > int(cursor))
+        except ValueError:
+            raise ValueError('Invalid cursor')
+
+    rows = db.session.execute(query.order_by(Service.id).limit(limit + 1)).mappings().all()
+    items = []
+    for row in rows[:limit]:
+        item = dict(row)
+        for name in JSON_FIELDS:
+            if name in item:
+                item[name] = item[name] or []
+        if item.get('created_at'):
+            item['created_at'] = item['created_at'].isoformat()
+        items.append(item)
+    next_cursor = str(items[-1]['id']) if len(rows) > limit else None
+    return items, next_cursor
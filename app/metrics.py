@@ -0,0 +1,118 @@
+"""
+Prometheus Metrics
+
+Request middleware and upstream call timers feeding these metrics, exposed
+in the Prometheus text format at /metrics:
+
+  http_requests_total{method, endpoint, status}                    counter
+  http_request_duration_seconds{method, endpoint}                  histogram
+  http_requests_in_progress                                        gauge
+  http_request_db_seconds{method, endpoint}                        histogram (SQL time per request)
+  upstream_request_duration_seconds{service, operation, outcome}   histogram (Square, Canada Post)
+
+Under gunicorn every worker is a separate process. When
+PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it) each worker
+writes its values to memory-mapped files in that directory and /metrics,
+whichever worker serves it, adds them up across all workers. Without it the
+metrics cover the current process only.
+
+prometheus_client is optional: without it nothing is recorded and /metrics
+answers 503.
+"""
+
+import os
+import time
+
+from flask import Response, current_app, g, jsonify, request
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+    )
+    HAS_PROMETHEUS = True
+except ImportError:
+    HAS_PROMETHEUS = False
+
+if HAS_PROMETHEUS:
+    REQUESTS = Counter(
+        'http_requests_total', 'HTTP requests by endpoint and status code', ['method', 'endpoint', 'status']
+    )
+    LATENCY = Histogram(
+        'http_request_duration_seconds', 'Time to build the response', ['method', 'endpoint'],
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    )
+    IN_PROGRESS = Gauge(
+        'http_requests_in_progress', 'Requests being handled right now', multiprocess_mode='livesum'
+    )
+    DB_TIME = Histogram(
+        'http_request_db_seconds', 'Time spent in SQL per request', ['method', 'endpoint'],
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+    )
+    UPSTREAM_LATENCY = Histogram(
+        'upstream_request_duration_seconds', 'Calls to external APIs', ['service', 'operation', 'outcome'],
+        buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30)
+    )
+
+
+def observe_upstream(service, operation, seconds, ok):
+    """Record one call to an external API (e.g. 'square', 'create_payment')."""
+    if HAS_PROMETHEUS:
+        UPSTREAM_LATENCY.labels(service, operation, 'ok' if ok else 'error').observe(seconds)
+
+
+def _start_request():
+    if request.endpoint in ('static', 'metrics'):
+        return
+    g._metrics_started = time.perf_counter()
+    IN_PROGRESS.inc()
+
+
+def _record_status(response):
+    g._metrics_status = response.status_code
+    return response
+
+
+def _finish_request(error=None):
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return
+    IN_PROGRESS.dec()
+    method, endpoint = request.method, request.endpoint or 'unmatched'
+    REQUESTS.labels(method, endpoint, str(g.pop('_metrics_status', 500))).inc()
+    LATENCY.labels(method, endpoint).observe(time.perf_counter() - started)
+    # Filled in by the query profiler's after_request hook
+    profile = g.get('query_profile')
+    if profile is not None:
+        DB_TIME.labels(method, endpoint).observe(profile.sql_ms / 1000)
+
+
+def metrics():
+    """Prometheus scrape endpoint (aggregated across workers in multiprocess mode)."""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+    if not HAS_PROMETHEUS:
+        return jsonify({'success': False, 'error': 'prometheus_client is not installed'}), 503
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+
+def init_metrics(app):
+    """Register the request hooks and the /metrics endpoint."""
+    app.add_url_rule('/metrics', 'metrics', metrics)
+    if not HAS_PROMETHEUS or not app.config.get('METRICS_ENABLED', True):
+        return
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+
+
+def mark_worker_dead(pid):
+    """Drop a dead worker's live gauges from the shared files (gunicorn child_exit)."""
+    if HAS_PROMETHEUS and os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import delete, event, func, insert, inspect, select, true, update
 from app import db
 
 class Category(db.Model):
@@ -49,6 +50,71 @@ class Category(db.Model):
         return data
 
 
+class CategoryPath(db.Model):
+    """Closure table for the category tree: one row per (ancestor, descendant) pair, including (id, id, 0)."""
+    __tablename__ = 'category_paths'
+    __table_args__ = (
+        db.Index('ix_category_paths_descendant_depth', 'descendant_id', 'depth'),
+    )
+    
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)  # 0 = self, 1 = parent/child, ...
+    
+    def __repr__(self):
+        return f'<CategoryPath {self.ancestor_id}->{self.descendant_id} ({self.depth})>'
+
+
+@event.listens_for(Category, 'after_insert')
+def _add_category_paths(mapper, connection, target):
+    """Link a new category to itself and to every ancestor of its parent."""
+    paths = CategoryPath.__table__
+    connection.execute(insert(paths).values(ancestor_id=target.id, descendant_id=target.id, depth=0))
+    if target.parent_id is not None:
+        connection.execute(insert(paths).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(paths.c.ancestor_id, target.id, paths.c.depth + 1).where(paths.c.descendant_id == target.parent_id)
+        ))
+
+
+@event.listens_for(Category, 'after_update')
+def _move_category_paths(mapper, connection, target):
+    """Re-link a category's whole subtree when its parent changes."""
+    paths = CategoryPath.__table__
+    current_parent = connection.scalar(
+        select(paths.c.ancestor_id).where(paths.c.descendant_id == target.id, paths.c.depth == 1)
+    )
+    if current_parent == target.parent_id:
+        return
+    subtree = select(paths.c.descendant_id).where(paths.c.ancestor_id == target.id)
+    if target.parent_id is not None and connection.scalar(
+        select(paths.c.depth).where(paths.c.ancestor_id == target.id, paths.c.descendant_id == target.parent_id)
+    ) is not None:
+        raise ValueError('A category cannot be moved under itself or one of its sub-categories')
+
+    # Detach the subtree from its old ancestors, then attach it below the new parent
+    connection.execute(delete(paths).where(
+        paths.c.descendant_id.in_(subtree), paths.c.ancestor_id.not_in(subtree)
+    ))
+    if target.parent_id is not None:
+        above, below = paths.alias('above'), paths.alias('below')
+        connection.execute(insert(paths).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(above.c.ancestor_id, below.c.descendant_id, above.c.depth + below.c.depth + 1)
+            .select_from(above.join(below, true()))
+            .where(above.c.descendant_id == target.parent_id, below.c.ancestor_id == target.id)
+        ))
+
+
+@event.listens_for(Category, 'after_delete')
+def _remove_category_paths(mapper, connection, target):
+    """Drop every path that starts or ends at a deleted category."""
+    paths = CategoryPath.__table__
+    connection.execute(delete(paths).where(
+        (paths.c.descendant_id == target.id) | (paths.c.ancestor_id == target.id)
+    ))
+
+
 class Service(db.Model):
     """Service/Product model for e-commerce."""
     __tablename__ = 'services'
@@ -69,9 +135,15 @@ class Service(db.Model):
     bulk_pricing = db.Column(db.JSON, default=list)  # Stores bulk pricing tiers: [{'min_quantity': 10, 'price': 450}]
     variants = db.Column(db.JSON, default=list)  # Stores product variants: [{'name': 'Small', 'price': 100, 'description': '...', 'sku': '...', 'is_available': True}]
     weight_kg = db.Column(db.Float, default=0.5)  # Approximate weight in kg for shipping (default 0.5kg)
+    length_cm = db.Column(db.Float, nullable=True)  # Optional packed dimensions for multi-parcel packing
+    width_cm = db.Column(db.Float, nullable=True)
+    height_cm = db.Column(db.Float, nullable=True)
+    pricing_revision = db.Column(db.Integer, default=0)  # Bumped when price_base/bulk_pricing/variants/options change
+    min_price = db.Column(db.Float, nullable=True, index=True)  # Lowest of price_base and available variant prices ("From $X")
     
     # Relationships
     service_options = db.relationship('ServiceOption', backref='service', lazy=True, cascade='all, delete-orphan')
+    variant_index = db.relationship('ServiceVariant', backref='service', lazy=True, cascade='all, delete-orphan')
 
     
     def __repr__(self):
@@ -83,19 +155,8 @@ class Service(db.Model):
     
     def get_price_for_quantity(self, quantity):
         """Get price based on quantity, considering bulk discounts. Returns None if quote required."""
-        if self.price_base is None:
-            return None
-            
-        if not self.bulk_pricing:
-            return self.price_base
-        
-        applicable_tier = None
-        for tier in sorted(self.bulk_pricing, key=lambda x: x['min_quantity'], reverse=True):
-            if quantity >= tier['min_quantity']:
-                applicable_tier = tier
-                break
-        
-        return applicable_tier['price'] if applicable_tier else self.price_base
+        from app.pricing import pricing_engine
+        return pricing_engine.compile(self).tier_price(quantity)
 
 
 class ServiceOption(db.Model):
@@ -113,6 +174,49 @@ class ServiceOption(db.Model):
         return f'<ServiceOption {self.option_name}>'
 
 
+@event.listens_for(ServiceOption, 'after_insert')
+@event.listens_for(ServiceOption, 'after_update')
+@event.listens_for(ServiceOption, 'after_delete')
+def _bump_option_pricing_revision(mapper, connection, target):
+    """Option price adjustments are part of compiled pricing, so any option change bumps its service's revision."""
+    services = Service.__table__
+    service_ids = {target.service_id}
+    history = inspect(target).attrs.service_id.history
+    service_ids.update(history.deleted or ())  # An option moved to another service changes both
+    connection.execute(
+        update(services)
+        .where(services.c.id.in_([service_id for service_id in service_ids if service_id is not None]))
+        .values(pricing_revision=func.coalesce(services.c.pricing_revision, 0) + 1)
+    )
+
+
+class ServiceVariant(db.Model):
+    """Normalized, indexed copy of Service.variants (kept in sync by the admin item endpoints)."""
+    __tablename__ = 'service_variants'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False, index=True)
+    name = db.Column(db.String(255), nullable=False)
+    sku = db.Column(db.String(100), unique=True, nullable=True)  # Optional, but unique across the catalog
+    price = db.Column(db.Float, nullable=True)  # None = Contact for Quote
+    is_available = db.Column(db.Boolean, default=True)
+    position = db.Column(db.Integer, default=0)  # Index in Service.variants
+    
+    def __repr__(self):
+        return f'<ServiceVariant {self.sku or self.name}>'
+    
+    def to_dict(self):
+        """Convert variant to dictionary."""
+        return {
+            'id': self.id,
+            'service_id': self.service_id,
+            'name': self.name,
+            'sku': self.sku,
+            'price': self.price,
+            'is_available': self.is_available
+        }
+
+
 class Cart(db.Model):
     """Shopping cart for users."""
     __tablename__ = 'carts'
@@ -121,6 +225,9 @@ class Cart(db.Model):
     session_id = db.Column(db.String(255), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    cached_total = db.Column(db.Float, default=0)  # Kept in sync by the pricing engine and repricing job
+    prices_changed = db.Column(db.Boolean, default=False)  # Set when a repricing job changed a line; cleared when shown
+    revision = db.Column(db.Integer, default=0)  # Bumped whenever lines or prices change (payment idempotency)
     
     # Relationships
     items = db.relationship('CartItem', backref='cart', lazy=True, cascade='all, delete-orphan')
@@ -170,15 +277,55 @@ class Order(db.Model):
     subtotal = db.Column(db.Float, nullable=False, default=0)
     total_amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(50), default='pending')  # pending, processing, completed, cancelled
-    payment_status = db.Column(db.String(50), default='unpaid')  # unpaid, paid, failed
+    payment_status = db.Column(db.String(50), default='unpaid')  # unpaid, pending, paid, failed, refunded, partially_refunded
     square_payment_id = db.Column(db.String(255))
+    square_refund_id = db.Column(db.String(255))
     square_order_id = db.Column(db.String(255))
+    receipt_url = db.Column(db.String(500))  # Filled in after checkout by the outbox worker
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
     
+    # Admin listing pages newest first by (created_at, id), optionally within a status or customer
+    __table_args__ = (
+        db.Index('ix_orders_created_at_id', 'created_at', 'id'),
+        db.Index('ix_orders_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('ix_orders_payment_status_created_at_id', 'payment_status', 'created_at', 'id'),
+        db.Index('ix_orders_customer_email_created_at_id', 'customer_email', 'created_at', 'id'),
+    )
+    
+    def to_dict(self, include_items=False):
+        """Convert order to dictionary."""
+        data = {
+            'id': self.id,
+            'order_number': self.order_number,
+            'customer_email': self.customer_email,
+            'customer_name': self.customer_name,
+            'customer_phone': self.customer_phone,
+            'customer_address': self.customer_address,
+            'customer_city': self.customer_city,
+            'customer_state': self.customer_state,
+            'customer_zip': self.customer_zip,
+            'shipping_method': self.shipping_method,
+            'shipping_service_name': self.shipping_service_name,
+            'shipping_cost': self.shipping_cost,
+            'tracking_number': self.tracking_number,
+            'subtotal': self.subtotal,
+            'total_amount': self.total_amount,
+            'status': self.status,
+            'payment_status': self.payment_status,
+            'square_payment_id': self.square_payment_id,
+            'square_refund_id': self.square_refund_id,
+            'receipt_url': self.receipt_url,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        if include_items:
+            data['items'] = [item.to_dict() for item in self.items]
+        return data
+    
     def __repr__(self):
         return f'<Order {self.order_number}>'
 
@@ -188,7 +335,7 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
     service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
     service_name = db.Column(db.String(255), nullable=False)
     quantity = db.Column(db.Integer, default=1)
@@ -198,5 +345,115 @@ class OrderItem(db.Model):
     # Relationships
     service = db.relationship('Service', backref='order_items')
     
+    def to_dict(self):
+        """Convert order item to dictionary."""
+        return {
+            'id': self.id,
+            'service_id': self.service_id,
+            'service_name': self.service_name,
+            'quantity': self.quantity,
+            'unit_price': self.unit_price,
+            'custom_options': self.custom_options,
+            'line_total': round(self.unit_price * (self.quantity or 0), 2)
+        }
+    
     def get_subtotal(self):
         return self.unit_price * self.quantity
+
+
+class PaymentAttempt(db.Model):
+    """Ledger of checkout payment attempts, keyed by a deterministic idempotency key."""
+    __tablename__ = 'payment_attempts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    idempotency_key = db.Column(db.String(64), unique=True, nullable=False)  # cart identity + revision + amount
+    square_idempotency_key = db.Column(db.String(45), nullable=False)  # Reused for retries of the same charge
+    cart_id = db.Column(db.Integer, nullable=False)  # Carts are deleted after payment, so no foreign key
+    cart_session_id = db.Column(db.String(255), nullable=False, index=True)
+    cart_revision = db.Column(db.Integer, default=0)
+    amount_cents = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, succeeded, failed (declined), error (outcome unknown)
+    tries = db.Column(db.Integer, default=1)
+    square_payment_id = db.Column(db.String(255))
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
+    response = db.Column(db.JSON)  # Recorded JSON response, replayed for duplicate submits
+    response_status = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<PaymentAttempt {self.idempotency_key} {self.status}>'
+
+
+class OutboxEvent(db.Model):
+    """Work to do after a transaction commits (written in the same transaction, drained by outbox_worker.py)."""
+    __tablename__ = 'outbox_events'
+    __table_args__ = (
+        db.Index('ix_outbox_events_status_available_at', 'status', 'available_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(100), nullable=False)  # e.g., 'payment.completed'
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, processing, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)  # Not retried before this time
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.event_type} {self.status}>'
+
+
+class DailySales(db.Model):
+    """Sales totals per day (UTC, by order date), kept up to date by app/sales.py."""
+    __tablename__ = 'daily_sales'
+    
+    day = db.Column(db.Date, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)  # Order totals, shipping included
+    shipping = db.Column(db.Float, nullable=False, default=0)
+    items_sold = db.Column(db.Integer, nullable=False, default=0)
+    refunds = db.Column(db.Integer, nullable=False, default=0)  # Orders refunded in full
+    refunded_amount = db.Column(db.Float, nullable=False, default=0)
+    
+    def to_dict(self):
+        """Convert daily totals to dictionary."""
+        return {
+            'day': self.day.isoformat(),
+            'orders': self.orders,
+            'revenue': round(self.revenue, 2),
+            'shipping': round(self.shipping, 2),
+            'items_sold': self.items_sold,
+            'refunds': self.refunds,
+            'refunded_amount': round(self.refunded_amount, 2),
+            'net_revenue': round(self.revenue - self.refunded_amount, 2)
+        }
+
+
+class ServiceSales(db.Model):
+    """All-time sales totals per service, kept up to date by app/sales.py."""
+    __tablename__ = 'service_sales'
+    
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), primary_key=True)
+    service_name = db.Column(db.String(255), nullable=False)  # Name at the time of the latest sale
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)  # Line totals, shipping excluded
+    refunded_quantity = db.Column(db.Integer, nullable=False, default=0)
+    refunded_revenue = db.Column(db.Float, nullable=False, default=0)
+    
+    def to_dict(self):
+        """Convert service totals to dictionary."""
+        return {
+            'service_id': self.service_id,
+            'service_name': self.service_name,
+            'orders': self.orders,
+            'quantity': self.quantity - self.refunded_quantity,
+            'revenue': round(self.revenue - self.refunded_revenue, 2),
+            'refunded_quantity': self.refunded_quantity,
+            'refunded_revenue': round(self.refunded_revenue, 2)
+        }
@@ -0,0 +1,118 @@
+"""
+Admin Order Queries
+
+Order listing for the admin uses keyset pagination on (created_at, id),
+newest first: each page continues from the last row of the previous page
+through a composite index instead of an OFFSET, so page 1000 costs the same
+as page 1 however many orders there are. Filters on status and
+payment_status have their own (column, created_at, id) indexes for the same
+reason, and order_number / customer_email lookups are indexed equality
+matches. Order items for a page are loaded with one extra IN query.
+"""
+
+import base64
+from datetime import datetime, timedelta
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models import Order
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+ORDER_STATUSES = ('pending', 'processing', 'completed', 'cancelled')
+PAYMENT_STATUSES = ('unpaid', 'pending', 'paid', 'failed', 'refunded', 'partially_refunded')
+
+
+def encode_cursor(order):
+    """Opaque cursor pointing just past this order."""
+    raw = f'{order.created_at.isoformat()}|{order.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor; raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, order_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def parse_date_range(start_date, end_date):
+    """
+    [start, end) datetimes for inclusive YYYY-MM-DD dates; either may be empty.
+    Raises ValueError with a message for the client.
+    """
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+        end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1) if end_date else None
+    except ValueError:
+        raise ValueError('start_date and end_date must be YYYY-MM-DD')
+    if start and end and end <= start:
+        raise ValueError('end_date must not be before start_date')
+    return start, end
+
+
+def parse_order_filters(args):
+    """Validated list filters from request args. Raises ValueError with a message for the client."""
+    filters = {}
+    status = args.get('status')
+    if status:
+        if status not in ORDER_STATUSES:
+            raise ValueError(f"status must be one of: {', '.join(ORDER_STATUSES)}")
+        filters['status'] = status
+    payment_status = args.get('payment_status')
+    if payment_status:
+        if payment_status not in PAYMENT_STATUSES:
+            raise ValueError(f"payment_status must be one of: {', '.join(PAYMENT_STATUSES)}")
+        filters['payment_status'] = payment_status
+    for name in ('order_number', 'customer_email'):
+        value = (args.get(name) or '').strip()
+        if value:
+            filters[name] = value
+    filters['start'], filters['end'] = parse_date_range(args.get('start_date'), args.get('end_date'))
+    return filters
+
+
+def order_list_query(filters):
+    """Filtered orders, newest first, each filter backed by an index."""
+    query = Order.query
+    if filters.get('order_number'):
+        query = query.filter(Order.order_number == filters['order_number'])
+    if filters.get('customer_email'):
+        query = query.filter(Order.customer_email == filters['customer_email'])
+    if filters.get('status'):
+        query = query.filter(Order.status == filters['status'])
+    if filters.get('payment_status'):
+        query = query.filter(Order.payment_status == filters['payment_status'])
+    if filters.get('start'):
+        query = query.filter(Order.created_at >= filters['start'])
+    if filters.get('end'):
+        query = query.filter(Order.created_at < filters['end'])
+    return query.order_by(Order.created_at.desc(), Order.id.desc())
+
+
+def list_orders(filters, cursor=None, limit=PAGE_SIZE, with_items=True):
+    """
+    One page of orders after `cursor` (None for the first page).
+
+    Returns (orders, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = order_list_query(filters)
+    if cursor:
+        created_at, order_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Order.created_at, Order.id) < tuple_(created_at, order_id))
+    if with_items:
+        query = query.options(selectinload(Order.items))
+    orders = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(orders[limit - 1]) if len(orders) > limit else None
+    return orders[:limit], next_cursor
+
+
+def order_with_items_query(order_id):
+    """One order and its items in a single joined query."""
+    return Order.query.options(joinedload(Order.items)).filter(Order.id == order_id)
@@ -0,0 +1,227 @@
+"""
+Transactional Outbox
+
+Work that follows a payment (fetching the Square receipt, notifications,
+inventory, ...) does not run on the checkout request. `enqueue()` adds an
+`outbox_events` row in the same transaction as the order, so the work is
+recorded exactly when the order is, and `outbox_worker.py` drains the table
+in a separate process with retries and exponential backoff.
+
+Handlers are registered per event type with @outbox_handler. An event can
+run more than once (a worker dying mid-way, a lease expiring), so handlers
+must be idempotent.
+"""
+
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Dict
+
+from flask import current_app
+from sqlalchemy import and_, func, or_, select, update
+
+from app import db
+from app.models import Order, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+HANDLERS: Dict[str, Callable[[Dict], None]] = {}
+
+
+def outbox_handler(event_type):
+    """Register the function that processes an event type."""
+    def register(func):
+        if event_type in HANDLERS:
+            raise ValueError(f'Duplicate outbox handler for {event_type}')
+        HANDLERS[event_type] = func
+        return func
+    return register
+
+
+def enqueue(event_type, payload):
+    """Add an event to the current transaction; it is only visible to workers once committed."""
+    event = OutboxEvent(event_type=event_type, payload=payload, status='pending', available_at=datetime.utcnow())
+    db.session.add(event)
+    return event
+
+
+def _claimable(now, lease_seconds):
+    """Pending events that are due, plus processing events whose lease has expired (the worker died or stalled)."""
+    return or_(
+        and_(OutboxEvent.status == 'pending', OutboxEvent.available_at <= now),
+        and_(OutboxEvent.status == 'processing', OutboxEvent.locked_at < now - timedelta(seconds=lease_seconds))
+    )
+
+
+def claim_events(worker_id, batch_size=20, lease_seconds=300):
+    """Atomically lock up to batch_size due events for this worker and return them."""
+    now = datetime.utcnow()
+    candidates = (
+        select(OutboxEvent.id)
+        .where(_claimable(now, lease_seconds))
+        .order_by(OutboxEvent.id)
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    claimed = db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id.in_(candidates), _claimable(now, lease_seconds))
+        .values(status='processing', locked_by=worker_id, locked_at=now, attempts=OutboxEvent.attempts + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return []
+    return (
+        OutboxEvent.query
+        .filter_by(status='processing', locked_by=worker_id, locked_at=now)
+        .order_by(OutboxEvent.id)
+        .all()
+    )
+
+
+def renew_leases(events, worker_id):
+    """Restart the lease on claimed events that haven't run yet; returns the ids this worker still holds.
+
+    Called before each handler so that a batch of slow handlers doesn't outlast
+    the lease on its later events. An event missing from the result already
+    expired and was reclaimed by another worker, and must be left alone.
+    """
+    ids = [event.id for event in events]
+    db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id.in_(ids), OutboxEvent.status == 'processing', OutboxEvent.locked_by == worker_id)
+        .values(locked_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    held = set(db.session.scalars(
+        select(OutboxEvent.id).where(OutboxEvent.id.in_(ids), OutboxEvent.locked_by == worker_id)
+    ))
+    db.session.commit()
+    return held
+
+
+def retry_delay(attempts, base=2.0, cap=600.0):
+    """Exponential backoff with jitter, in seconds."""
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _finish(event, worker_id, **values):
+    """Record an event's outcome if this worker still holds its lease. Returns whether it did."""
+    finished = db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id == event.id, OutboxEvent.status == 'processing', OutboxEvent.locked_by == worker_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if not finished:
+        logger.warning(f"Outbox event {event.id} was reclaimed by another worker before its outcome was recorded")
+    return bool(finished)
+
+
+def process_event(event, worker_id, max_attempts=8):
+    """
+    Run one claimed event's handler and record the outcome.
+
+    Returns True on success and False on failure, or None if the lease was lost
+    while the handler ran (the worker that reclaimed the event records it).
+    """
+    handler = HANDLERS.get(event.event_type)
+    try:
+        if handler is None:
+            raise LookupError(f'No outbox handler for {event.event_type}')
+        handler(event.payload)
+    except Exception as e:
+        db.session.rollback()
+        error = f'{type(e).__name__}: {e}'
+        if event.attempts >= max_attempts or handler is None:
+            values = {'status': 'failed'}
+            message = f"Outbox event {event.id} ({event.event_type}) failed permanently: {e}"
+        else:
+            values = {'status': 'pending', 'available_at': datetime.utcnow() + timedelta(seconds=retry_delay(event.attempts))}
+            message = f"Outbox event {event.id} ({event.event_type}) failed, will retry: {e}"
+        if not _finish(event, worker_id, last_error=error, locked_by=None, **values):
+            return None
+        if values['status'] == 'failed':
+            logger.error(message)
+        else:
+            logger.warning(message)
+        return False
+    if not _finish(event, worker_id, status='done', processed_at=datetime.utcnow(), last_error=None):
+        return None
+    return True
+
+
+def drain(worker_id, batch_size=None, max_events=None):
+    """Process due events until none are left (or max_events). Returns (processed, failed)."""
+    config = current_app.config
+    batch_size = batch_size or config.get('OUTBOX_BATCH_SIZE', 20)
+    processed = failed = 0
+    while max_events is None or processed + failed < max_events:
+        events = claim_events(worker_id, batch_size, config.get('OUTBOX_LEASE_SECONDS', 300))
+        if not events:
+            break
+        for position, event in enumerate(events):
+            if event.id not in renew_leases(events[position:], worker_id):
+                logger.warning(f"Outbox event {event.id} was reclaimed by another worker, skipping")
+                continue
+            outcome = process_event(event, worker_id, config.get('OUTBOX_MAX_ATTEMPTS', 8))
+            if outcome:
+                processed += 1
+            elif outcome is not None:
+                failed += 1
+    return processed, failed
+
+
+def run_worker(worker_id, stop_event, poll_interval=None, batch_size=None):
+    """Drain the outbox until stop_event is set, sleeping between empty polls."""
+    poll_interval = poll_interval or current_app.config.get('OUTBOX_POLL_INTERVAL', 1.0)
+    logger.info(f"Outbox worker {worker_id} started")
+    while not stop_event.is_set():
+        try:
+            processed, failed = drain(worker_id, batch_size)
+        except Exception as e:
+            # e.g. the database is locked; try again on the next poll
+            db.session.rollback()
+            logger.warning(f"Outbox worker {worker_id} poll failed: {e}")
+            processed = failed = 0
+        if not processed and not failed:
+            stop_event.wait(poll_interval)
+        db.session.remove()
+    logger.info(f"Outbox worker {worker_id} stopped")
+
+
+def outbox_stats():
+    """Event counts by status and the age of the oldest pending event."""
+    counts = dict(
+        db.session.query(OutboxEvent.status, func.count(OutboxEvent.id))
+        .group_by(OutboxEvent.status)
+        .all()
+    )
+    oldest = db.session.query(func.min(OutboxEvent.created_at)).filter(OutboxEvent.status == 'pending').scalar()
+    return {
+        'pending': counts.get('pending', 0),
+        'processing': counts.get('processing', 0),
+        'done': counts.get('done', 0),
+        'failed': counts.get('failed', 0),
+        'oldest_pending_seconds': round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0.0,
+    }
+
+
+# ------------------------------------------------------------------ handlers
+
+@outbox_handler('payment.completed')
+def fetch_payment_receipt(payload):
+    """Look up the Square payment for a new order and store its receipt URL."""
+    from app.payment import get_square_processor
+
+    order = db.session.get(Order, payload['order_id'])
+    if order is None or order.receipt_url:
+        return
+    result = get_square_processor().get_payment(payload['square_payment_id'])
+    if not result['success']:
+        raise RuntimeError(result.get('error', 'Could not retrieve payment'))
+    order.receipt_url = result.get('receipt_url')
+    db.session.commit()
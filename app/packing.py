@@ -0,0 +1,119 @@
+"""
+Parcel Packing
+
+Splits cart lines into parcels that respect Canada Post parcel limits so heavy
+orders can be quoted and shipped as several parcels instead of being rejected.
+
+Uses first-fit-decreasing by unit weight. Identical units from the same cart
+line are placed in batches, so packing cost grows with the number of parcels
+rather than the total quantity.
+"""
+
+import math
+from typing import Dict, List, Optional
+
+# Canada Post domestic parcel limits
+MAX_PARCEL_WEIGHT_KG = 30.0
+MAX_PARCEL_LENGTH_CM = 200.0
+MAX_LENGTH_PLUS_GIRTH_CM = 300.0
+MAX_PARCEL_VOLUME_CM3 = 100.0 * 60.0 * 50.0  # Largest box we pack into (fits the limits above)
+
+MIN_PARCEL_WEIGHT_KG = 0.5  # Canada Post minimum billable weight
+
+
+class PackingError(ValueError):
+    """Raised when an item can't be shipped as a parcel at all."""
+
+
+class Parcel:
+    """A parcel being filled: running weight, volume and contents."""
+
+    __slots__ = ('weight_kg', 'volume_cm3', 'contents')
+
+    def __init__(self):
+        self.weight_kg = 0.0
+        self.volume_cm3 = 0.0
+        self.contents = {}  # line index -> units
+
+    def to_dict(self) -> Dict:
+        return {
+            'weight_kg': round(max(self.weight_kg, MIN_PARCEL_WEIGHT_KG), 3),
+            'volume_cm3': round(self.volume_cm3, 1),
+            'items': sum(self.contents.values())
+        }
+
+
+def _unit_volume(item: Dict) -> Optional[float]:
+    """Volume of one unit, or None if dimensions are unknown. Validates carrier limits."""
+    dims = [item.get('length_cm'), item.get('width_cm'), item.get('height_cm')]
+    if not all(dims):
+        return None
+    length, width, height = sorted((float(d) for d in dims), reverse=True)
+    if length > MAX_PARCEL_LENGTH_CM or length + 2 * (width + height) > MAX_LENGTH_PLUS_GIRTH_CM:
+        raise PackingError(f"{item.get('name', 'Item')} exceeds Canada Post size limits")
+    return length * width * height
+
+
+def pack_parcels(
+    items: List[Dict],
+    max_weight_kg: float = MAX_PARCEL_WEIGHT_KG,
+    max_volume_cm3: float = MAX_PARCEL_VOLUME_CM3
+) -> List[Parcel]:
+    """
+    Pack cart lines into parcels (first-fit-decreasing by unit weight).
+
+    Args:
+        items: Dicts with 'weight_kg', 'quantity' and optional 'length_cm',
+               'width_cm', 'height_cm' and 'name'
+        max_weight_kg: Weight limit per parcel
+        max_volume_cm3: Volume limit per parcel (only applied to items with dimensions)
+
+    Returns: List of Parcel objects (at least one)
+
+    Raises:
+        PackingError: If a single unit exceeds the parcel limits
+    """
+    units = []
+    for index, item in enumerate(items):
+        weight = item.get('weight_kg')
+        weight = 0.5 if weight is None else float(weight)  # Default 0.5kg if not specified
+        quantity = int(item.get('quantity', 1) or 0)
+        if quantity <= 0:
+            continue
+        volume = _unit_volume(item)
+        if weight > max_weight_kg:
+            raise PackingError(f"{item.get('name', 'Item')} exceeds the {max_weight_kg:g} kg parcel limit")
+        if volume is not None and volume > max_volume_cm3:
+            raise PackingError(f"{item.get('name', 'Item')} is too large to pack")
+        units.append((weight, volume or 0.0, quantity, index))
+
+    # Heaviest units first
+    units.sort(key=lambda unit: (unit[0], unit[1]), reverse=True)
+
+    parcels: List[Parcel] = []
+    for weight, volume, remaining, index in units:
+        for parcel in parcels:
+            if remaining == 0:
+                break
+            remaining -= _place(parcel, weight, volume, remaining, index, max_weight_kg, max_volume_cm3)
+        while remaining > 0:
+            parcel = Parcel()
+            parcels.append(parcel)
+            remaining -= _place(parcel, weight, volume, remaining, index, max_weight_kg, max_volume_cm3)
+
+    return parcels or [Parcel()]
+
+
+def _place(parcel, weight, volume, count, index, max_weight_kg, max_volume_cm3) -> int:
+    """Put as many of `count` identical units as fit into a parcel; return how many."""
+    fit = count
+    if weight > 0:
+        fit = min(fit, math.floor(round((max_weight_kg - parcel.weight_kg) / weight, 9)))
+    if volume > 0:
+        fit = min(fit, math.floor(round((max_volume_cm3 - parcel.volume_cm3) / volume, 9)))
+    if fit <= 0:
+        return 0
+    parcel.weight_kg += weight * fit
+    parcel.volume_cm3 += volume * fit
+    parcel.contents[index] = parcel.contents.get(index, 0) + fit
+    return fit
@@ -1,30 +1,167 @@
 """
 Square Payment Integration Module
 Handles all Square payment processing for the e-commerce platform
+
+One SquarePaymentProcessor is created per worker process from app config at
+startup and reused for every request. Its HTTP client keeps a bounded pool of
+keep-alive connections to Square, applies explicit timeouts and is safe to
+share between threads. Latency of each Square call is recorded per operation.
+
+The Square SDK and its HTTP stack are large, so they are imported and the
+client is built when the first call is made rather than when the app boots;
+workers that never take a payment never load them.
 """
 
-from square import Square
-from flask import current_app
+import os
+import threading
+import time
 import uuid
 import logging
+from collections import deque
+
+from flask import current_app
+
+from app.metrics import observe_upstream
 
 logger = logging.getLogger(__name__)
 
 
+def _api_error():
+    """The Square SDK's API error class (imports the SDK on first use)."""
+    from square.core.api_error import ApiError
+    return ApiError
+
+
+class CallStats:
+    """Thread-safe latency and error counters per Square operation."""
+    
+    SAMPLE_SIZE = 1000  # recent calls kept per operation for percentiles
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops = {}
+    
+    def record(self, operation, elapsed_ms, ok):
+        with self._lock:
+            op = self._ops.get(operation)
+            if op is None:
+                op = self._ops[operation] = {
+                    'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'samples': deque(maxlen=self.SAMPLE_SIZE)
+                }
+            op['calls'] += 1
+            op['errors'] += 0 if ok else 1
+            op['total_ms'] += elapsed_ms
+            op['max_ms'] = max(op['max_ms'], elapsed_ms)
+            op['samples'].append(elapsed_ms)
+    
+    def snapshot(self):
+        """Counters plus mean/p50/p95 latency (ms) for each operation."""
+        with self._lock:
+            ops = {name: dict(op, samples=sorted(op['samples'])) for name, op in self._ops.items()}
+        result = {}
+        for name, op in ops.items():
+            samples = op.pop('samples')
+            op['avg_ms'] = round(op['total_ms'] / op['calls'], 1) if op['calls'] else 0.0
+            op['p50_ms'] = round(samples[len(samples) // 2], 1) if samples else 0.0
+            op['p95_ms'] = round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1) if samples else 0.0
+            op['total_ms'] = round(op['total_ms'], 1)
+            op['max_ms'] = round(op['max_ms'], 1)
+            result[name] = op
+        return result
+
+
 class SquarePaymentProcessor:
     """Handles Square payment processing."""
     
-    def __init__(self):
-        """Initialize Square client with app configuration."""
-        access_token = current_app.config.get('SQUARE_ACCESS_TOKEN')
-        environment = current_app.config.get('SQUARE_ENVIRONMENT', 'sandbox')
+    CURRENCY = 'USD'
+    
+    def __init__(self, access_token, environment='sandbox', timeout=15.0, connect_timeout=5.0,
+                 max_connections=10, base_url=None):
+        """
+        Configure the Square SDK client over a pooled HTTP client (both created on first use).
         
-        # Create Square SDK client
-        self.client = Square(
-            access_token=access_token,
-            environment=environment
+        Args:
+            access_token (str): Square access token
+            environment (str): 'production' or 'sandbox'
+            timeout (float): Read/write timeout per request in seconds
+            connect_timeout (float): Connection timeout in seconds
+            max_connections (int): Connection pool size (shared by all threads)
+            base_url (str): Override the Square API URL (optional)
+        """
+        self.environment = environment
+        self.access_token = access_token
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.base_url = base_url
+        self.http_client = None
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.stats = CallStats()
+    
+    @property
+    def client(self):
+        """The Square SDK client, created (and the SDK imported) on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import httpx
+                    from square import Square
+                    from square.environment import SquareEnvironment
+                    self.http_client = httpx.Client(
+                        timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                        limits=httpx.Limits(max_connections=self.max_connections,
+                                            max_keepalive_connections=self.max_connections)
+                    )
+                    self._client = Square(
+                        token=self.access_token,
+                        environment=(SquareEnvironment.PRODUCTION if self.environment == 'production'
+                                     else SquareEnvironment.SANDBOX),
+                        base_url=self.base_url,
+                        timeout=self.timeout,
+                        httpx_client=self.http_client
+                    )
+        return self._client
+    
+    @classmethod
+    def from_config(cls, config):
+        """Build a processor from Flask app configuration."""
+        return cls(
+            access_token=config.get('SQUARE_ACCESS_TOKEN'),
+            environment=config.get('SQUARE_ENVIRONMENT', 'sandbox'),
+            timeout=config.get('SQUARE_TIMEOUT', 15.0),
+            connect_timeout=config.get('SQUARE_CONNECT_TIMEOUT', 5.0),
+            max_connections=config.get('SQUARE_MAX_CONNECTIONS', 10),
+            base_url=config.get('SQUARE_BASE_URL') or None
         )
     
+    def close(self):
+        """Close pooled connections."""
+        if self.http_client is not None:
+            self.http_client.close()
+    
+    def _call(self, operation, method, *args, **kwargs):
+        """Call the Square SDK, recording latency and success for the operation."""
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = method(*args, **kwargs)
+            ok = not getattr(response, 'errors', None)
+            return response
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats.record(operation, elapsed_ms, ok)
+            observe_upstream('square', operation, elapsed_ms / 1000, ok)
+            logger.debug(f"Square {operation} took {elapsed_ms:.1f} ms")
+    
+    @staticmethod
+    def _error_details(error):
+        body = getattr(error, 'body', None)
+        if isinstance(body, dict) and body.get('errors'):
+            return body['errors']
+        return str(body or error)
+    
     def process_payment(self, amount_cents, source_id, idempotency_key=None):
         """
         Process a payment through Square.
@@ -41,42 +178,40 @@ class SquarePaymentProcessor:
             if not idempotency_key:
                 idempotency_key = str(uuid.uuid4())
             
-            # Create payment body
-            payment_body = {
-                'source_id': source_id,
-                'amount_money': {
-                    'amount': amount_cents,
-                    'currency': 'USD'
-                },
-                'idempotency_key': idempotency_key
-            }
-            
             # Call Square API
-            result = self.client.payments.create_payment(payment_body)
+            result = self._call(
+                'create_payment',
+                self.client.payments.create,
+                source_id=source_id,
+                idempotency_key=idempotency_key,
+                amount_money={'amount': amount_cents, 'currency': self.CURRENCY}
+            )
             
-            if result.is_success():
-                payment = result.result.payment
-                return {
-                    'success': True,
-                    'payment_id': payment.id,
-                    'status': payment.status,
-                    'amount': payment.amount_money.amount,
-                    'receipt_url': getattr(payment, 'receipt_url', None)
-                }
-            elif result.is_client_error():
-                logger.error(f"Client error: {result.errors}")
+            payment = result.payment
+            return {
+                'success': True,
+                'payment_id': payment.id,
+                'status': payment.status,
+                'amount': payment.amount_money.amount,
+                'receipt_url': getattr(payment, 'receipt_url', None)
+            }
+        
+        except _api_error() as e:
+            details = self._error_details(e)
+            if e.status_code is not None and 400 <= e.status_code < 500:
+                logger.error(f"Client error: {details}")
                 return {
                     'success': False,
                     'error': 'Invalid payment information',
-                    'details': result.errors
-                }
-            else:
-                logger.error(f"Server error: {result.errors}")
-                return {
-                    'success': False,
-                    'error': 'Payment processing error',
-                    'details': result.errors
+                    'details': details,
+                    'declined': True  # Square rejected it; a retry needs a new idempotency key
                 }
+            logger.error(f"Server error: {details}")
+            return {
+                'success': False,
+                'error': 'Payment processing error',
+                'details': details
+            }
         
         except Exception as e:
             logger.error(f"Exception during payment processing: {str(e)}")
@@ -86,45 +221,54 @@ class SquarePaymentProcessor:
                 'details': str(e)
             }
     
-    def refund_payment(self, payment_id, amount_cents=None):
+    def refund_payment(self, payment_id, amount_cents=None, idempotency_key=None):
         """
         Refund a Square payment.
         
         Args:
             payment_id (str): Square payment ID
             amount_cents (int): Amount to refund in cents (optional, full refund if not provided)
+            idempotency_key (str): Unique key for idempotency (optional)
         
         Returns:
             dict: Refund result
         """
         try:
-            refund_body = {
-                'idempotency_key': str(uuid.uuid4())
-            }
-            
-            if amount_cents:
-                refund_body['amount_money'] = {
-                    'amount': amount_cents,
-                    'currency': 'USD'
-                }
+            if not amount_cents:
+                # Full refund: Square needs the amount, so look up the payment
+                payment = self.get_payment(payment_id)
+                if not payment['success']:
+                    return {
+                        'success': False,
+                        'error': 'Refund failed',
+                        'details': payment.get('details')
+                    }
+                amount_cents = payment['amount']
             
-            result = self.client.refunds.refund_payment(payment_id, refund_body)
+            result = self._call(
+                'refund_payment',
+                self.client.refunds.refund_payment,
+                idempotency_key=idempotency_key or str(uuid.uuid4()),
+                payment_id=payment_id,
+                amount_money={'amount': amount_cents, 'currency': self.CURRENCY}
+            )
             
-            if result.is_success():
-                refund = result.result.refund
-                return {
-                    'success': True,
-                    'refund_id': refund.id,
-                    'status': refund.status,
-                    'amount': refund.amount_money.amount
-                }
-            else:
-                logger.error(f"Refund error: {result.errors}")
-                return {
-                    'success': False,
-                    'error': 'Refund failed',
-                    'details': result.errors
-                }
+            refund = result.refund
+            return {
+                'success': True,
+                'refund_id': refund.id,
+                'status': refund.status,
+                'amount': refund.amount_money.amount
+            }
+        
+        except _api_error() as e:
+            details = self._error_details(e)
+            logger.error(f"Refund error: {details}")
+            return {
+                'success': False,
+                'error': 'Refund failed',
+                'details': details
+            }
         
         except Exception as e:
             logger.error(f"Exception during refund: {str(e)}")
@@ -145,24 +289,27 @@ class SquarePaymentProcessor:
             dict: Payment details
         """
         try:
-            result = self.client.payments.retrieve_payment(payment_id)
+            result = self._call('retrieve_payment', self.client.payments.get, payment_id)
             
-            if result.is_success():
-                payment = result.result.payment
-                return {
-                    'success': True,
-                    'payment_id': payment.id,
-                    'status': payment.status,
-                    'amount': payment.amount_money.amount,
-                    'receipt_url': getattr(payment, 'receipt_url', None)
-                }
-            else:
-                logger.error(f"Get payment error: {result.errors}")
-                return {
-                    'success': False,
-                    'error': 'Could not retrieve payment',
-                    'details': result.errors
-                }
+            payment = result.payment
+            refunded = getattr(payment, 'refunded_money', None)
+            return {
+                'success': True,
+                'payment_id': payment.id,
+                'status': payment.status,
+                'amount': payment.amount_money.amount,
+                'refunded_amount': refunded.amount if refunded is not None else 0,
+                'receipt_url': getattr(payment, 'receipt_url', None)
+            }
+        
+        except _api_error() as e:
+            details = self._error_details(e)
+            logger.error(f"Get payment error: {details}")
+            return {
+                'success': False,
+                'error': 'Could not retrieve payment',
+                'details': details
+            }
         
         except Exception as e:
             logger.error(f"Exception retrieving payment: {str(e)}")
@@ -173,6 +320,24 @@ class SquarePaymentProcessor:
             }
 
 
+_processor_lock = threading.Lock()
+
+
+def init_square_processor(app):
+    """Create this worker's Square processor from app configuration."""
+    processor = SquarePaymentProcessor.from_config(app.config)
+    app.extensions['square_processor'] = (processor, os.getpid())
+    return processor
+
+
 def get_square_processor():
-    """Factory function to get Square payment processor."""
-    return SquarePaymentProcessor()
+    """Get the shared Square payment processor for this worker."""
+    app = current_app._get_current_object()
+    processor, pid = app.extensions['square_processor']
+    if pid != os.getpid():
+        # Forked after create_app (gunicorn --preload): don't share the parent's sockets
+        with _processor_lock:
+            processor, pid = app.extensions['square_processor']
+            if pid != os.getpid():
+                processor = init_square_processor(app)
+    return processor
@@ -0,0 +1,107 @@
+"""
+Payment Attempt Ledger
+
+Makes checkout payments idempotent. Every submit for the same cart contents
+and amount maps to one deterministic key (cart identity + cart revision +
+amount) and one `payment_attempts` row:
+
+- A retry of a completed attempt replays its recorded response with one
+  indexed lookup and no Square call
+- A duplicate that arrives while the first attempt is still charging is told
+  to retry shortly (the request does not wait, so no worker is held)
+- A retry after an unknown outcome (timeout, server error, crashed worker)
+  reuses the same Square idempotency key, so Square never charges twice;
+  only a declined card gets a fresh Square key for the next try
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import PaymentAttempt
+
+# Square idempotency keys are limited to 45 characters
+KEY_LENGTH = 40
+
+
+def payment_idempotency_key(cart, amount_cents):
+    """Deterministic key for paying this revision of this cart for this amount."""
+    # created_at guards against SQLite reusing the id of a deleted cart
+    identity = f'{cart.id}:{cart.created_at.isoformat() if cart.created_at else ""}:{cart.revision or 0}:{amount_cents}'
+    return hashlib.sha256(identity.encode()).hexdigest()[:KEY_LENGTH]
+
+
+def claim_payment_attempt(cart, amount_cents, stale_after):
+    """
+    Find or create the attempt for this cart revision and amount.
+
+    Returns (attempt, state) where state is:
+        'charge'   - this request owns the attempt and should call Square
+        'recorded' - the attempt has a recorded result; replay it
+        'in_flight' - another request is charging it right now; retry later
+    """
+    key = payment_idempotency_key(cart, amount_cents)
+    attempt = PaymentAttempt.query.filter_by(idempotency_key=key).first()
+
+    if attempt is None:
+        attempt = PaymentAttempt(
+            idempotency_key=key,
+            square_idempotency_key=key,
+            cart_id=cart.id,
+            cart_session_id=cart.session_id,
+            cart_revision=cart.revision or 0,
+            amount_cents=amount_cents,
+            status='pending'
+        )
+        db.session.add(attempt)
+        try:
+            db.session.commit()
+            return attempt, 'charge'
+        except IntegrityError:
+            # A concurrent duplicate inserted it first; any other constraint failure is a real error
+            db.session.rollback()
+            attempt = PaymentAttempt.query.filter_by(idempotency_key=key).first()
+            if attempt is None:
+                raise
+
+    if attempt.status == 'succeeded':
+        return attempt, 'recorded'
+    if attempt.status == 'pending' and attempt.updated_at > datetime.utcnow() - timedelta(seconds=stale_after):
+        return attempt, 'in_flight'
+
+    # Declined, unknown outcome or abandoned: take the attempt over, unless another request just did
+    tries = (attempt.tries or 1) + 1
+    square_key = f'{key}-{tries}' if attempt.status == 'failed' else attempt.square_idempotency_key
+    taken = PaymentAttempt.query.filter_by(
+        id=attempt.id, status=attempt.status, updated_at=attempt.updated_at
+    ).update({
+        'status': 'pending',
+        'tries': tries,
+        'square_idempotency_key': square_key,
+        'updated_at': datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    db.session.refresh(attempt)
+    if not taken:
+        # Another request took it over first: replay only a success, anything else is theirs to finish
+        return attempt, 'recorded' if attempt.status == 'succeeded' else 'in_flight'
+    return attempt, 'charge'
+
+
+def record_payment_attempt(attempt, status, response, response_status, square_payment_id=None, order_id=None):
+    """Record an attempt's final result; the caller commits (with the order, on success)."""
+    attempt.status = status
+    attempt.response = response
+    attempt.response_status = response_status
+    attempt.square_payment_id = square_payment_id or attempt.square_payment_id
+    attempt.order_id = order_id
+    attempt.updated_at = datetime.utcnow()
+
+
+def find_completed_attempt(cart_session_id, amount_cents):
+    """Latest successful attempt for a cart session and amount (the cart is gone after payment)."""
+    return PaymentAttempt.query.filter_by(
+        cart_session_id=cart_session_id, amount_cents=amount_cents, status='succeeded'
+    ).order_by(PaymentAttempt.id.desc()).first()
@@ -0,0 +1,214 @@
+"""
+Batch Payment Operations
+
+Admin tools that touch many Square payments at once: refunding a list of
+orders and reconciling order payment status against Square for a date
+range. Square calls fan out across a bounded thread pool behind a
+token-bucket rate limit. Progress is yielded as each call finishes, and
+order updates are written in bulk every few results instead of one commit
+per order.
+
+Worker threads only talk to Square; all database access stays on the
+calling (request) thread. Only `workers` calls are queued at a time, so a
+client that disconnects mid-stream stops the batch after the calls already
+in flight; results buffered so far are still written.
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List
+
+from sqlalchemy import update
+
+from app import db
+from app.models import Order
+from app.sales import record_payment_status_changes
+
+# Square payment status -> Order.payment_status
+SQUARE_PAYMENT_STATUSES = {
+    'COMPLETED': 'paid',
+    'APPROVED': 'pending',
+    'PENDING': 'pending',
+    'CANCELED': 'failed',
+    'FAILED': 'failed',
+}
+
+
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` acquisitions per second (bursts up to `burst`)."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def fan_out(items: Iterable, call: Callable, workers: int = 8, rate: float = 10.0) -> Iterator:
+    """
+    Run call(item) on a bounded pool, rate limited; yield (item, result) as calls finish.
+
+    Items are submitted as earlier calls finish, never more than `workers` at a
+    time. Closing the generator cancels the rest: only calls already running
+    complete, and their results are dropped.
+    """
+    limiter = RateLimiter(rate, burst=workers)
+    items = iter(items)
+
+    def limited(item):
+        limiter.acquire()
+        return call(item)
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='square-batch')
+    pending = {}
+    try:
+        for item in items:
+            pending[pool.submit(limited, item)] = item
+            if len(pending) >= workers:
+                break
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item = pending.pop(future)
+                for next_item in items:
+                    pending[pool.submit(limited, next_item)] = next_item
+                    break
+                yield item, future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _flush(updates: List[Dict], changes: Dict):
+    """Write pending order updates with one executemany, adjust sales rollups, and commit together."""
+    if updates:
+        record_payment_status_changes(changes)
+        db.session.execute(update(Order), updates)
+        db.session.commit()
+        updates.clear()
+        changes.clear()
+
+
+def refund_orders(processor, order_ids, workers=8, rate=10.0, flush_every=50) -> Iterator[Dict]:
+    """
+    Refund paid orders in full. Yields one progress dict per order, then a summary.
+
+    Refund idempotency keys are derived from the order, so running the same
+    batch again never refunds an order twice.
+    """
+    orders = Order.query.filter(Order.id.in_(order_ids)).all() if order_ids else []
+    found = {order.id for order in orders}
+    eligible = [o for o in orders if o.payment_status == 'paid' and o.square_payment_id]
+    total = len(order_ids)
+    done = refunded = failed = 0
+    updates, changes = [], {}
+
+    # Orders that can't be refunded are reported without calling Square
+    for order_id in order_ids:
+        if order_id not in found:
+            done += 1
+            failed += 1
+            yield {'type': 'progress', 'done': done, 'total': total, 'order_id': order_id,
+                   'success': False, 'error': 'Order not found'}
+    for order in orders:
+        if order not in eligible:
+            done += 1
+            failed += 1
+            yield {'type': 'progress', 'done': done, 'total': total, 'order_id': order.id,
+                   'order_number': order.order_number, 'success': False,
+                   'error': f'Order is not refundable (payment status: {order.payment_status})'}
+
+    jobs = [
+        (order.id, order.order_number, order.square_payment_id, int(round(order.total_amount * 100)))
+        for order in eligible
+    ]
+
+    def call(job):
+        order_id, _, payment_id, amount_cents = job
+        return processor.refund_payment(payment_id, amount_cents, idempotency_key=f'refund-order-{order_id}')
+
+    try:
+        for (order_id, order_number, _, _), result in fan_out(jobs, call, workers, rate):
+            done += 1
+            if result['success']:
+                refunded += 1
+                updates.append({'id': order_id, 'payment_status': 'refunded', 'status': 'cancelled',
+                                'square_refund_id': result['refund_id'], 'updated_at': datetime.utcnow()})
+                changes[order_id] = ('paid', 'refunded')
+            else:
+                failed += 1
+            yield {'type': 'progress', 'done': done, 'total': total, 'order_id': order_id,
+                   'order_number': order_number, 'success': result['success'],
+                   'refund_id': result.get('refund_id'), 'error': None if result['success'] else result.get('error')}
+            if len(updates) >= flush_every:
+                _flush(updates, changes)
+    finally:
+        # Also on a client disconnect: these refunds went through at Square
+        _flush(updates, changes)
+    yield {'type': 'summary', 'total': total, 'refunded': refunded, 'failed': failed}
+
+
+def square_payment_status(result) -> str:
+    """Order.payment_status implied by a get_payment result."""
+    status = SQUARE_PAYMENT_STATUSES.get(result['status'], 'pending')
+    if status == 'paid' and result.get('refunded_amount'):
+        return 'refunded' if result['refunded_amount'] >= result['amount'] else 'partially_refunded'
+    return status
+
+
+def reconcile_payments(processor, start, end, workers=8, rate=10.0, flush_every=50) -> Iterator[Dict]:
+    """
+    Compare payment_status of orders created in [start, end) with Square and fix mismatches.
+    Yields one progress dict per order, then a summary.
+    """
+    rows = (
+        db.session.query(Order.id, Order.order_number, Order.square_payment_id, Order.payment_status)
+        .filter(Order.created_at >= start, Order.created_at < end, Order.square_payment_id.isnot(None))
+        .order_by(Order.id)
+        .all()
+    )
+    total = len(rows)
+    done = matched = corrected = failed = 0
+    updates, changes = [], {}
+
+    try:
+        for row, result in fan_out(rows, lambda row: processor.get_payment(row.square_payment_id), workers, rate):
+            done += 1
+            progress = {'type': 'progress', 'done': done, 'total': total, 'order_id': row.id,
+                        'order_number': row.order_number, 'success': result['success']}
+            if not result['success']:
+                failed += 1
+                progress['error'] = result.get('error')
+            else:
+                square_status = square_payment_status(result)
+                progress.update({'square_status': result['status'], 'payment_status': square_status,
+                                 'changed': square_status != row.payment_status})
+                if square_status != row.payment_status:
+                    corrected += 1
+                    progress['previous_status'] = row.payment_status
+                    updates.append({'id': row.id, 'payment_status': square_status, 'updated_at': datetime.utcnow()})
+                    changes[row.id] = (row.payment_status, square_status)
+                else:
+                    matched += 1
+            yield progress
+            if len(updates) >= flush_every:
+                _flush(updates, changes)
+    finally:
+        _flush(updates, changes)
+    yield {'type': 'summary', 'total': total, 'matched': matched, 'corrected': corrected, 'failed': failed}
@@ -0,0 +1,317 @@
+"""
+Pricing Engine
+Compiles each service's bulk tiers, option adjustments and variant prices into
+sorted lookup arrays once per pricing revision, and prices cart lines with bisect.
+"""
+
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import and_, case, func, or_, select, update
+
+from app import db
+from app.models import Cart, CartItem, Service
+
+
+def _revision_of(service):
+    """Token that changes whenever a service's pricing data may have changed."""
+    return (service.pricing_revision or 0, service.created_at)
+
+
+class CompiledPricing:
+    """Immutable, pre-sorted pricing data for one service revision."""
+
+    __slots__ = ('service_id', 'revision', 'base_price', 'tier_quantities',
+                 'tier_prices', 'option_adjustments', 'variant_prices')
+
+    def __init__(self, service):
+        self.service_id = service.id
+        self.revision = _revision_of(service)
+        self.base_price = service.price_base
+
+        # Bulk tiers sorted ascending by min_quantity so bisect finds the best tier
+        tiers = sorted(
+            (int(tier['min_quantity']), float(tier['price']))
+            for tier in (service.bulk_pricing or [])
+            if tier.get('min_quantity') is not None and tier.get('price') is not None
+        )
+        self.tier_quantities = tuple(qty for qty, _ in tiers)
+        self.tier_prices = tuple(price for _, price in tiers)
+
+        # Option adjustments keyed by the form field name used on the detail page
+        self.option_adjustments = {
+            f'option_{option.id}': (option.price_adjustment or 0, bool(option.is_available))
+            for option in service.service_options
+        }
+
+        # Variants can be selected by name or by SKU
+        self.variant_prices = {}
+        for variant in (service.variants or []):
+            entry = (variant.get('price'), variant.get('is_available', True))
+            if variant.get('name'):
+                self.variant_prices[variant['name']] = entry
+            if variant.get('sku'):
+                self.variant_prices[variant['sku']] = entry
+
+    def tier_price(self, quantity):
+        """Base unit price for a quantity, considering bulk tiers. None if quote required."""
+        if self.base_price is None:
+            return None
+        index = bisect_right(self.tier_quantities, quantity) - 1
+        return self.tier_prices[index] if index >= 0 else self.base_price
+
+    def tier_ratio(self, quantity):
+        """Bulk discount for a quantity as a fraction of the base price (1.0 = no discount)."""
+        if not self.base_price:
+            return 1.0
+        index = bisect_right(self.tier_quantities, quantity) - 1
+        return self.tier_prices[index] / self.base_price if index >= 0 else 1.0
+
+    def unit_price(self, quantity, options=None):
+        """
+        Unit price for a cart line.
+
+        Args:
+            quantity (int): Quantity used to select the bulk tier
+            options (dict): Selected options, e.g. {'variant': 'Small', 'option_3': 'PLA'}
+
+        Returns:
+            float or None: Unit price, or None if the selection requires a quote
+
+        Raises:
+            ValueError: If an unknown or unavailable variant/option is selected
+        """
+        options = options or {}
+
+        variant_key = options.get('variant')
+        if variant_key:
+            if variant_key not in self.variant_prices:
+                raise ValueError(f'Unknown variant: {variant_key}')
+            price, is_available = self.variant_prices[variant_key]
+            if not is_available:
+                raise ValueError(f'Variant "{variant_key}" is not available')
+            if price is None:
+                return None
+            # Bulk pricing applies to the chosen variant's price proportionally
+            price = float(price) * self.tier_ratio(quantity)
+        else:
+            price = self.tier_price(quantity)
+            if price is None:
+                return None
+
+        for key, value in options.items():
+            if not value or key not in self.option_adjustments:
+                continue
+            adjustment, is_available = self.option_adjustments[key]
+            if not is_available:
+                raise ValueError('Selected option is not available')
+            price += adjustment
+
+        return round(price, 2)
+
+
+class PricingEngine:
+    """Per-process cache of compiled pricing, keyed by service id and revision."""
+
+    def __init__(self):
+        self._compiled: Dict[int, CompiledPricing] = {}
+        self._lock = threading.Lock()
+
+    def compile(self, service) -> CompiledPricing:
+        """Get compiled pricing for a service, recompiling only if its revision changed."""
+        compiled = self._compiled.get(service.id)
+        if compiled is not None and compiled.revision == _revision_of(service):
+            return compiled
+
+        compiled = CompiledPricing(service)
+        with self._lock:
+            self._compiled[service.id] = compiled
+        return compiled
+
+    def invalidate(self, service_id=None):
+        """Drop compiled pricing for one service, or for all services."""
+        with self._lock:
+            if service_id is None:
+                self._compiled.clear()
+            else:
+                self._compiled.pop(service_id, None)
+
+    def price_line(self, service, quantity, options=None) -> Optional[float]:
+        """Price a single line. Returns None if the item requires a quote."""
+        return self.compile(service).unit_price(quantity, options)
+
+    def reprice_cart(self, cart) -> bool:
+        """
+        Reprice every line of a cart in one batch.
+
+        Bulk tiers are selected on the combined quantity of each service across
+        the cart, so splitting an order over several lines keeps the discount.
+        All services are loaded with a single query. Lines whose price can no
+        longer be determined (now quote-only or unavailable) keep their price.
+
+        The cart's cached total is refreshed as well; the caller commits.
+
+        Returns:
+            bool: True if any line's price changed
+        """
+        items = list(cart.items)
+        if not items:
+            return False
+
+        service_ids = {item.service_id for item in items}
+        services = {
+            service.id: service
+            for service in Service.query.filter(Service.id.in_(service_ids)).all()
+        }
+
+        quantities = defaultdict(int)
+        for item in items:
+            quantities[item.service_id] += item.quantity or 0
+
+        changed = False
+        for item in items:
+            service = services.get(item.service_id)
+            if service is None:
+                continue
+            try:
+                price = self.price_line(service, quantities[item.service_id], item.custom_options)
+            except ValueError:
+                continue
+            if price is not None and price != item.price_at_time:
+                item.price_at_time = price
+                changed = True
+
+        if changed:
+            cart.revision = (cart.revision or 0) + 1
+        cart.cached_total = round(sum(item.get_subtotal() for item in items), 2)
+        return changed
+
+
+# Process-wide engine shared by all requests in a worker
+pricing_engine = PricingEngine()
+
+
+def _line_price_expression(compiled):
+    """
+    SQL expression computing a cart line's new unit price from compiled pricing.
+
+    Mirrors CompiledPricing.unit_price: bulk tiers on the combined quantity of the
+    service in the cart, variant prices by name/SKU, plus option adjustments.
+    Lines that cannot be priced (quote-only, unknown or unavailable selections)
+    evaluate to their current price and are therefore left untouched.
+    """
+    line = CartItem.__table__
+    other = line.alias('other_line')
+    combined_quantity = (
+        select(func.coalesce(func.sum(other.c.quantity), 0))
+        .where(other.c.cart_id == line.c.cart_id, other.c.service_id == line.c.service_id)
+        .scalar_subquery()
+    )
+
+    def selected(key):
+        return func.coalesce(line.c.custom_options[key].as_string(), '') != ''
+
+    variant = line.c.custom_options['variant'].as_string()
+    adjustment = 0
+    blocked = []
+    for key, (price_adjustment, is_available) in compiled.option_adjustments.items():
+        if not is_available:
+            blocked.append(selected(key))
+        elif price_adjustment:
+            adjustment = adjustment + case((selected(key), price_adjustment), else_=0)
+
+    branches = []
+    variant_prices = {
+        key: float(price)
+        for key, (price, is_available) in compiled.variant_prices.items()
+        if is_available and price is not None
+    }
+    tiers = list(reversed(list(zip(compiled.tier_quantities, compiled.tier_prices))))
+    if variant_prices:
+        variant_price = case(*((variant == key, price) for key, price in variant_prices.items()))
+        if tiers and compiled.base_price:
+            variant_price = variant_price * case(
+                *((combined_quantity >= quantity, price / compiled.base_price) for quantity, price in tiers),
+                else_=1.0,
+            )
+        branches.append((variant.in_(list(variant_prices)), variant_price + adjustment))
+    if compiled.base_price is not None:
+        tier_price = case(
+            *((combined_quantity >= quantity, price) for quantity, price in tiers),
+            else_=compiled.base_price,
+        ) if tiers else compiled.base_price
+        branches.append((func.coalesce(variant, '') == '', tier_price + adjustment))
+
+    if not branches:
+        return line.c.price_at_time
+    if blocked:
+        branches.insert(0, (or_(*blocked), line.c.price_at_time))
+    return func.round(case(*branches, else_=line.c.price_at_time), 2)
+
+
+def reprice_open_carts(service_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+    """
+    Bring every open cart line for the given services up to date with current pricing.
+
+    Runs two set-based UPDATEs per service (flag affected carts, rewrite line
+    prices) and one final UPDATE refreshing cached totals, instead of loading
+    and saving cart lines one by one. Pass None to reprice every service that
+    appears in a cart.
+
+    Returns:
+        dict: {'services': n, 'lines_updated': n, 'carts_flagged': n}
+    """
+    line = CartItem.__table__
+    carts = Cart.__table__
+
+    # Only services that are actually in a cart need any work
+    in_carts = select(line.c.service_id).distinct()
+    query = Service.query
+    if service_ids is None:
+        query = query.filter(Service.id.in_(in_carts))
+    else:
+        service_ids = set(service_ids)
+        if not service_ids:
+            return {'services': 0, 'lines_updated': 0, 'carts_flagged': 0}
+        query = query.filter(Service.id.in_(
+            [service_id for service_id in db.session.scalars(in_carts) if service_id in service_ids]
+        ))
+    services = query.all()
+
+    lines_updated = 0
+    carts_flagged = 0
+    try:
+        for service in services:
+            new_price = _line_price_expression(pricing_engine.compile(service))
+            stale = and_(line.c.service_id == service.id, line.c.price_at_time != new_price)
+
+            carts_flagged += db.session.execute(
+                update(carts)
+                .where(carts.c.id.in_(select(line.c.cart_id).where(stale)))
+                .values(prices_changed=True, revision=func.coalesce(carts.c.revision, 0) + 1)
+            ).rowcount
+            lines_updated += db.session.execute(
+                update(line).where(stale).values(price_at_time=new_price)
+            ).rowcount
+
+        if services:
+            line_totals = line.alias('line_totals')
+            db.session.execute(
+                update(carts)
+                .where(carts.c.id.in_(
+                    select(line.c.cart_id).where(line.c.service_id.in_([s.id for s in services]))
+                ))
+                .values(cached_total=(
+                    select(func.round(func.coalesce(func.sum(line_totals.c.price_at_time * line_totals.c.quantity), 0), 2))
+                    .where(line_totals.c.cart_id == carts.c.id)
+                    .scalar_subquery()
+                ))
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {'services': len(services), 'lines_updated': lines_updated, 'carts_flagged': carts_flagged}
@@ -0,0 +1,177 @@
+"""
+Query Profiler
+
+Reads the queries Flask-SQLAlchemy records during each request
+(SQLALCHEMY_RECORD_QUERIES) and:
+
+  - adds X-Query-Count, X-Query-Time-Ms and X-Query-Repeats response headers
+    in debug mode or for a logged-in admin,
+  - logs statements slower than QUERY_SLOW_MS,
+  - flags likely N+1 patterns: the same statement shape (parameters and IN
+    lists collapsed) run QUERY_REPEAT_THRESHOLD or more times in one request,
+  - keeps per-endpoint stats over the last QUERY_PROFILE_WINDOW seconds for
+    the admin Queries page.
+
+Stats are kept per worker process, like the Square client and rate cache stats.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from flask import current_app, g, request, session
+from flask_sqlalchemy.record_queries import get_recorded_queries
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_VALUE_ROWS = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """A statement with literals, parameter lists and multi-row VALUES collapsed, for grouping repeats."""
+    shape = _STRING.sub('?', statement)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(?)', shape)
+    shape = _VALUE_ROWS.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class RequestProfile:
+    """Query statistics for one request."""
+
+    __slots__ = ('endpoint', 'query_count', 'sql_ms', 'slow', 'repeats')
+
+    def __init__(self, endpoint, queries, slow_ms, repeat_threshold):
+        self.endpoint = endpoint
+        self.query_count = len(queries)
+        self.sql_ms = sum(query.duration for query in queries) * 1000
+        self.slow = [query for query in queries if query.duration * 1000 >= slow_ms]
+
+        shapes = Counter()
+        first = {}
+        for query in queries:
+            shape = statement_shape(query.statement)
+            shapes[shape] += 1
+            first.setdefault(shape, query)
+        # (shape, times run, where it was first run from), most repeated first
+        self.repeats = [
+            (shape, count, first[shape].location)
+            for shape, count in shapes.most_common() if count >= repeat_threshold
+        ]
+
+
+class QueryProfiler:
+    """Rolling per-endpoint query statistics and recent slow/N+1 findings for this worker."""
+
+    SAMPLE_SIZE = 1000  # recent requests kept per endpoint
+    ISSUE_SIZE = 100  # recent slow queries and N+1 findings kept
+
+    def __init__(self, window=900):
+        self.window = window
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._issues = deque(maxlen=self.ISSUE_SIZE)
+
+    def record(self, profile, request_ms):
+        now = time.time()
+        with self._lock:
+            samples = self._endpoints.get(profile.endpoint)
+            if samples is None:
+                samples = self._endpoints[profile.endpoint] = deque(maxlen=self.SAMPLE_SIZE)
+            samples.append((now, profile.query_count, profile.sql_ms, request_ms, len(profile.repeats)))
+            for shape, count, location in profile.repeats:
+                self._issues.append({'time': now, 'endpoint': profile.endpoint, 'kind': 'repeated',
+                                     'statement': shape, 'count': count, 'location': location})
+            for query in profile.slow:
+                self._issues.append({'time': now, 'endpoint': profile.endpoint, 'kind': 'slow',
+                                     'statement': _WHITESPACE.sub(' ', query.statement).strip(),
+                                     'ms': round(query.duration * 1000, 1), 'location': query.location})
+
+    def snapshot(self):
+        """Per-endpoint stats within the window, worst (most total SQL time) first, plus recent issues."""
+        cutoff = time.time() - self.window
+        with self._lock:
+            endpoints = {name: [s for s in samples if s[0] >= cutoff] for name, samples in self._endpoints.items()}
+            issues = [issue for issue in self._issues if issue['time'] >= cutoff]
+
+        rows = []
+        for name, samples in endpoints.items():
+            if not samples:
+                continue
+            counts = [s[1] for s in samples]
+            sql = sorted(s[2] for s in samples)
+            rows.append({
+                'endpoint': name,
+                'requests': len(samples),
+                'avg_queries': round(sum(counts) / len(counts), 1),
+                'max_queries': max(counts),
+                'avg_sql_ms': round(sum(sql) / len(sql), 1),
+                'p95_sql_ms': round(sql[min(len(sql) - 1, int(len(sql) * 0.95))], 1),
+                'total_sql_ms': round(sum(sql), 1),
+                'avg_request_ms': round(sum(s[3] for s in samples) / len(samples), 1),
+                'repeat_requests': sum(1 for s in samples if s[4]),
+            })
+        rows.sort(key=lambda row: row['total_sql_ms'], reverse=True)
+        return {'window_seconds': self.window, 'endpoints': rows, 'issues': issues[::-1]}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._issues.clear()
+
+
+def init_query_profiler(app):
+    """Profile each request's recorded queries (requires SQLALCHEMY_RECORD_QUERIES)."""
+    profiler = QueryProfiler(window=app.config.get('QUERY_PROFILE_WINDOW', 900))
+    app.extensions['query_profiler'] = profiler
+    if not app.config.get('SQLALCHEMY_RECORD_QUERIES'):
+        return profiler
+
+    slow_ms = app.config.get('QUERY_SLOW_MS', 100)
+    repeat_threshold = app.config.get('QUERY_REPEAT_THRESHOLD', 5)
+
+    @app.before_request
+    def start_query_profile():
+        # The app context (and its recorded queries) can outlive one request, e.g. in tests
+        g._query_profile_start = (len(get_recorded_queries()), time.perf_counter())
+
+    @app.after_request
+    def finish_query_profile(response):
+        start = g.pop('_query_profile_start', None)
+        if start is None or request.endpoint in (None, 'static'):
+            return response
+        first_query, started = start
+        profile = RequestProfile(f'{request.method} {request.endpoint}', get_recorded_queries()[first_query:],
+                                 slow_ms, repeat_threshold)
+        g.query_profile = profile
+        profiler.record(profile, (time.perf_counter() - started) * 1000)
+
+        for query in profile.slow:
+            logger.warning(f"Slow query ({query.duration * 1000:.0f} ms) in {profile.endpoint} at {query.location}: "
+                           f"{_WHITESPACE.sub(' ', query.statement).strip()[:500]}")
+        for shape, count, location in profile.repeats:
+            logger.warning(f"Possible N+1 in {profile.endpoint}: {count} x {shape[:300]} (first at {location})")
+
+        if current_app.debug or _is_admin():
+            response.headers['X-Query-Count'] = str(profile.query_count)
+            response.headers['X-Query-Time-Ms'] = f'{profile.sql_ms:.1f}'
+            response.headers['X-Query-Repeats'] = str(len(profile.repeats))
+        return response
+
+    return profiler
+
+
+def _is_admin():
+    """Admin check that leaves the session (and the Vary: Cookie header) alone for visitors without one."""
+    return current_app.config['SESSION_COOKIE_NAME'] in request.cookies and bool(session.get('admin_logged_in'))
+
+
+def get_query_profiler():
+    """Get this worker's query profiler."""
+    return current_app.extensions['query_profiler']
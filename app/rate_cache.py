@@ -0,0 +1,373 @@
+"""
+Shipping Rate Quote Cache
+
+Caches Canada Post rate quotes so repeated checkout lookups don't block a
+worker on the upstream API. Quotes are keyed by normalized destination,
+weight bucket and the domestic_only flag:
+
+- In-memory LRU with a TTL, bounded to a maximum number of entries
+- Fallback to a quote for the same FSA (first 3 characters of the postal code)
+- Optional SQLite file tier shared by all gunicorn workers on the host
+- Single-flight: a lookup for a quote that is already being fetched (e.g. by
+  a background prefetch) waits for that call instead of making its own
+"""
+
+import copy
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import current_app
+
+from app.packing import MAX_PARCEL_WEIGHT_KG
+
+logger = logging.getLogger(__name__)
+
+
+class RateQuoteCache:
+    """TTL + LRU cache of shipping rate quotes with an optional on-disk tier."""
+
+    def __init__(self, ttl=900, max_entries=2048, disk_path=None, weight_bucket_kg=0.25, fsa_fallback=True,
+                 max_weight_kg=MAX_PARCEL_WEIGHT_KG):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.weight_bucket_kg = weight_bucket_kg
+        self.max_weight_kg = max_weight_kg
+        self.fsa_fallback = fsa_fallback
+
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}  # full key -> upstream call in progress
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'fsa_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'upstream_calls': 0,
+            'upstream_errors': 0,
+            'upstream_time_ms': 0.0,
+            'prefetches': 0,
+            'coalesced': 0,
+        }
+
+        if self.disk_path:
+            self._init_disk()
+
+    # ---------------------------------------------------------------- keys
+
+    @staticmethod
+    def normalize_postal_code(postal_code: str) -> str:
+        return (postal_code or '').strip().upper().replace(' ', '')
+
+    def weight_bucket(self, weight_kg: float) -> float:
+        """
+        Round a weight up to its bucket; the bucket weight is what gets quoted.
+
+        A bucket never rounds a parcel within the carrier's weight limit up past it.
+        """
+        if weight_kg <= 0:
+            return weight_kg
+        bucket = round(math.ceil(round(weight_kg / self.weight_bucket_kg, 6)) * self.weight_bucket_kg, 3)
+        if weight_kg <= self.max_weight_kg < bucket:
+            return self.max_weight_kg
+        return bucket
+
+    def make_keys(self, destination_postal_code: str, weight_kg: float, domestic_only: bool) -> Tuple[str, str]:
+        """Return (full postal code key, FSA key) for a quote."""
+        postal = self.normalize_postal_code(destination_postal_code)
+        suffix = f'{self.weight_bucket(weight_kg)}|{int(bool(domestic_only))}'
+        return f'{postal}|{suffix}', f'{postal[:3]}*|{suffix}'
+
+    # ------------------------------------------------------------ memory tier
+
+    def _memory_get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _memory_set(self, key: str, value: Dict, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # -------------------------------------------------------------- disk tier
+
+    def _connect(self):
+        return sqlite3.connect(self.disk_path, timeout=1.0)
+
+    def _init_disk(self):
+        try:
+            with self._connect() as conn:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS rate_quotes '
+                    '(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, payload TEXT NOT NULL)'
+                )
+                conn.execute('CREATE INDEX IF NOT EXISTS ix_rate_quotes_expires_at ON rate_quotes (expires_at)')
+        except sqlite3.Error as e:
+            logger.warning(f"Disabling on-disk rate cache at {self.disk_path}: {e}")
+            self.disk_path = None
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, Dict]]:
+        if not self.disk_path:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT expires_at, payload FROM rate_quotes WHERE key = ? AND expires_at >= ?',
+                    (key, time.time())
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Rate cache disk read failed: {e}")
+            return None
+        return (row[0], json.loads(row[1])) if row else None
+
+    def _disk_set(self, items, expires_at: float):
+        if not self.disk_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO rate_quotes (key, expires_at, payload) VALUES (?, ?, ?)',
+                    [(key, expires_at, json.dumps(value)) for key, value in items]
+                )
+                # Keep the shared tier bounded: drop expired rows, then the oldest beyond the limit
+                conn.execute('DELETE FROM rate_quotes WHERE expires_at < ?', (time.time(),))
+                conn.execute(
+                    'DELETE FROM rate_quotes WHERE key IN ('
+                    'SELECT key FROM rate_quotes ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries * 4,)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Rate cache disk write failed: {e}")
+
+    # ----------------------------------------------------------------- public
+
+    def _lookup(self, key: str) -> Tuple[Optional[Dict], Optional[str]]:
+        value = self._memory_get(key)
+        if value is not None:
+            return value, 'memory'
+        entry = self._disk_get(key)
+        if entry is not None:
+            expires_at, value = entry
+            self._memory_set(key, value, expires_at)
+            return value, 'disk'
+        return None, None
+
+    def get(self, destination_postal_code: str, weight_kg: float, domestic_only: bool = True) -> Optional[Dict]:
+        """Return a cached quote (copy) or None. Tries the full postal code, then its FSA."""
+        full_key, fsa_key = self.make_keys(destination_postal_code, weight_kg, domestic_only)
+
+        value, tier = self._lookup(full_key)
+        status = 'hit'
+        if value is None and self.fsa_fallback:
+            value, tier = self._lookup(fsa_key)
+            status = 'fsa'
+
+        with self._lock:
+            if value is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['fsa_hits' if status == 'fsa' else 'hits'] += 1
+            if tier == 'disk':
+                self._stats['disk_hits'] += 1
+
+        result = copy.deepcopy(value)
+        result['destination'] = destination_postal_code
+        result['weight_kg'] = weight_kg
+        result['cache_status'] = status
+        return result
+
+    def set(self, destination_postal_code: str, weight_kg: float, domestic_only: bool, result: Dict):
+        """Store a successful live quote under both its postal code and FSA keys."""
+        if not result.get('success') or result.get('is_fallback') or result.get('is_demo') or result.get('is_estimate'):
+            return
+        full_key, fsa_key = self.make_keys(destination_postal_code, weight_kg, domestic_only)
+        value = copy.deepcopy(result)
+        value.pop('cache_status', None)
+        expires_at = time.time() + self.ttl
+
+        items = [(full_key, value)]
+        if self.fsa_fallback:
+            items.append((fsa_key, value))
+        for key, item in items:
+            self._memory_set(key, item, expires_at)
+        self._disk_set(items, expires_at)
+
+    def contains(self, destination_postal_code: str, weight_kg: float, domestic_only: bool = True) -> bool:
+        """True if a quote is cached for the postal code or its FSA. Doesn't count as a lookup."""
+        full_key, fsa_key = self.make_keys(destination_postal_code, weight_kg, domestic_only)
+        if self._lookup(full_key)[0] is not None:
+            return True
+        return self.fsa_fallback and self._lookup(fsa_key)[0] is not None
+
+    def _begin_fetch(self, key: str) -> Tuple[Future, bool]:
+        """Return (future for the key's upstream call, True if the caller must make that call)."""
+        with self._lock:
+            pending = self._inflight.get(key)
+            if pending is not None:
+                return pending, False
+            pending = self._inflight[key] = Future()
+            return pending, True
+
+    def _fetch(self, destination_postal_code, weight_kg, domestic_only, fetch, pending=None) -> Dict:
+        """
+        Call the upstream for the bucket weight, record its latency and cache the result.
+        `pending` is the in-flight future from _begin_fetch to complete (None = untracked call).
+        """
+        key = self.make_keys(destination_postal_code, weight_kg, domestic_only)[0]
+        if pending is None:
+            pending = Future()
+        try:
+            started = time.perf_counter()
+            result = fetch(destination_postal_code, self.weight_bucket(weight_kg), domestic_only)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            with self._lock:
+                self._stats['upstream_calls'] += 1
+                self._stats['upstream_time_ms'] += elapsed_ms
+                if not result.get('success') or result.get('is_fallback'):
+                    self._stats['upstream_errors'] += 1
+
+            self.set(destination_postal_code, weight_kg, domestic_only, result)
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        else:
+            pending.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is pending:
+                    del self._inflight[key]
+
+    def get_or_fetch(
+        self,
+        destination_postal_code: str,
+        weight_kg: float,
+        domestic_only: bool,
+        fetch: Callable[[str, float, bool], Dict],
+        wait: float = 10.0
+    ) -> Dict:
+        """
+        Return a cached quote, or call fetch(postal_code, bucket_weight, domestic_only)
+        and cache its result if successful.
+
+        If the same quote is already being fetched (a prefetch, or another
+        request), wait for that call instead of repeating it: up to `wait`
+        seconds, then fetch anyway.
+        """
+        cached = self.get(destination_postal_code, weight_kg, domestic_only)
+        if cached is not None:
+            return cached
+
+        key = self.make_keys(destination_postal_code, weight_kg, domestic_only)[0]
+        pending, leader = self._begin_fetch(key)
+        status = 'miss'
+        result = None
+        if not leader:
+            try:
+                result = pending.result(timeout=wait)
+                status = 'coalesced'
+                with self._lock:
+                    self._stats['coalesced'] += 1
+            except FuturesTimeoutError:
+                logger.info(f"In-flight rate quote for {key} is slow; fetching it again")
+            except Exception:
+                pass  # the other call failed; try for ourselves
+            pending = None
+
+        if result is None:
+            result = self._fetch(destination_postal_code, weight_kg, domestic_only, fetch, pending)
+        # Shared with any waiting callers, so hand back a copy
+        result = copy.deepcopy(result)
+        result['destination'] = destination_postal_code
+        result['weight_kg'] = weight_kg
+        result['cache_status'] = status
+        return result
+
+    def reserve(self, destination_postal_code: str, weight_kg: float, domestic_only: bool) -> Optional[Future]:
+        """
+        Mark a quote as being fetched, so lookups wait for it from now on. Returns the
+        future to complete, or None if the quote is already in flight.
+        """
+        pending, leader = self._begin_fetch(self.make_keys(destination_postal_code, weight_kg, domestic_only)[0])
+        return pending if leader else None
+
+    def warm(
+        self,
+        destination_postal_code: str,
+        weight_kg: float,
+        domestic_only: bool,
+        fetch: Callable[[str, float, bool], Dict]
+    ) -> bool:
+        """Fetch and cache a quote ahead of time unless one is cached or being fetched. Returns True if fetched."""
+        if self.contains(destination_postal_code, weight_kg, domestic_only):
+            return False
+        pending = self.reserve(destination_postal_code, weight_kg, domestic_only)
+        if pending is None:
+            return False
+        self._fetch(destination_postal_code, weight_kg, domestic_only, fetch, pending)
+        with self._lock:
+            self._stats['prefetches'] += 1
+        return True
+
+    def clear(self):
+        """Drop all cached quotes (memory and disk)."""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute('DELETE FROM rate_quotes')
+            except sqlite3.Error as e:
+                logger.warning(f"Rate cache disk clear failed: {e}")
+
+    def stats(self) -> Dict:
+        """Per-process counters plus derived hit ratio and mean upstream latency."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['fsa_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['fsa_hits']) / lookups, 4) if lookups else 0.0
+        stats['upstream_avg_ms'] = (
+            round(stats['upstream_time_ms'] / stats['upstream_calls'], 1) if stats['upstream_calls'] else 0.0
+        )
+        stats['upstream_time_ms'] = round(stats['upstream_time_ms'], 1)
+        stats['ttl'] = self.ttl
+        stats['max_entries'] = self.max_entries
+        stats['disk_tier'] = bool(self.disk_path)
+        return stats
+
+
+def init_rate_cache(app):
+    """Create the per-process rate cache from app configuration."""
+    app.extensions['rate_cache'] = RateQuoteCache(
+        ttl=app.config.get('SHIPPING_RATE_CACHE_TTL', 900),
+        max_entries=app.config.get('SHIPPING_RATE_CACHE_SIZE', 2048),
+        disk_path=app.config.get('SHIPPING_RATE_CACHE_PATH') or None,
+        weight_bucket_kg=app.config.get('SHIPPING_RATE_WEIGHT_BUCKET_KG', 0.25),
+        fsa_fallback=app.config.get('SHIPPING_RATE_CACHE_FSA_FALLBACK', True),
+    )
+    return app.extensions['rate_cache']
+
+
+def get_rate_cache() -> RateQuoteCache:
+    """Get the rate cache for the current app."""
+    return current_app.extensions['rate_cache']
@@ -0,0 +1,120 @@
+"""
+Speculative Shipping Rate Prefetch
+
+Quotes a cart's parcels for an already-known destination in the background,
+so the checkout shipping lookup is usually answered from a warm rate cache
+instead of waiting on the Canada Post round trip.
+
+Prefetches run on a small per-worker thread pool. Quotes already cached or
+already being fetched are skipped, and the number of queued prefetches is
+bounded so a burst of cart updates can't pile up upstream calls. A running
+prefetch is reserved in the rate cache, so a checkout lookup for the same
+quote waits for it rather than calling Canada Post a second time; a queued one
+is not, so a lookup never waits on a prefetch that hasn't started.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class RatePrefetcher:
+    """Background warm-up of the rate quote cache."""
+
+    def __init__(self, rate_cache, workers=4, max_pending=64):
+        self.rate_cache = rate_cache
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._stats = {
+            'scheduled': 0,
+            'skipped': 0,
+            'dropped': 0,
+            'failed': 0,
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Recreated after fork: worker threads don't survive into gunicorn workers
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='rate-prefetch')
+            self._executor_pid = pid
+            self._pending = set()
+        return self._executor
+
+    def prefetch(
+        self,
+        destination_postal_code: str,
+        parcel_weights: Iterable[float],
+        domestic_only: bool,
+        fetch: Callable[[str, float, bool], Dict]
+    ) -> int:
+        """
+        Queue quotes for every parcel weight that isn't cached or in flight.
+        Returns the number of quotes scheduled; never blocks on the upstream.
+        """
+        scheduled = 0
+        for weight_kg in set(parcel_weights):
+            key = self.rate_cache.make_keys(destination_postal_code, weight_kg, domestic_only)[0]
+            if self.rate_cache.contains(destination_postal_code, weight_kg, domestic_only):
+                with self._lock:
+                    self._stats['skipped'] += 1
+                continue
+            with self._lock:
+                executor = self._get_executor()
+                if key in self._pending:
+                    self._stats['skipped'] += 1
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    self._stats['dropped'] += 1
+                    continue
+                self._pending.add(key)
+                self._stats['scheduled'] += 1
+            executor.submit(self._warm, key, destination_postal_code, weight_kg, domestic_only, fetch)
+            scheduled += 1
+        return scheduled
+
+    def _warm(self, key, destination_postal_code, weight_kg, domestic_only, fetch):
+        try:
+            # warm() reserves the quote only now, and skips it if a lookup cached or started it meanwhile
+            if not self.rate_cache.warm(destination_postal_code, weight_kg, domestic_only, fetch):
+                with self._lock:
+                    self._stats['skipped'] += 1
+        except Exception as e:
+            logger.warning(f"Shipping rate prefetch failed for {destination_postal_code}: {e}")
+            with self._lock:
+                self._stats['failed'] += 1
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+
+def init_rate_prefetcher(app):
+    """Create the per-process prefetcher on top of the app's rate cache."""
+    app.extensions['rate_prefetcher'] = RatePrefetcher(
+        app.extensions['rate_cache'],
+        workers=app.config.get('SHIPPING_RATE_PREFETCH_WORKERS', 4),
+        max_pending=app.config.get('SHIPPING_RATE_PREFETCH_MAX_PENDING', 64),
+    )
+    return app.extensions['rate_prefetcher']
+
+
+def get_rate_prefetcher() -> RatePrefetcher:
+    """Get the rate prefetcher for the current app."""
+    return current_app.extensions['rate_prefetcher']
@@ -0,0 +1,177 @@
+"""
+Offline Shipping Rate Tables
+
+Quotes shipping from a local carrier rate table instead of the live API.
+A table maps postal code prefixes (FSA, or a shorter prefix) to a zone, and
+each zone x weight break to a price per service. Prices are stored in one
+flat `array('d')` laid out [zone][weight break][service], so a quote is a
+dictionary lookup, one bisect and a contiguous slice holding every
+service's price at once.
+
+Table file format (JSON), see instance/rate_table.json:
+{
+    "services": [{"code": "DOM.RP", "name": "Regular Parcel", "guaranteed_days": "3-5", ...}],
+    "weight_breaks_kg": [0.5, 1.0, ...],         # ascending; price applies up to the break
+    "zones": {"1": "Local", ...},
+    "default_zone": "4",                         # optional, for unmapped prefixes
+    "fsa_zones": {"N9J": "1", "N9": "1", "N": "2", ...},
+    "rates": {"1": {"DOM.RP": [8.12, ...], ...}, ...}
+}
+"""
+
+import json
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class RateTable:
+    """Compact, read-only zone/weight/service rate table."""
+
+    def __init__(self, services: List[Dict], weight_breaks: Sequence[float], zone_codes: List[str],
+                 prefix_zones: Dict[str, int], prices: array, default_zone: Optional[int] = None,
+                 origin: Optional[str] = None):
+        self.services = services
+        self.service_codes = [service['code'] for service in services]
+        self.weight_breaks = array('d', weight_breaks)
+        self.zone_codes = zone_codes
+        self.prefix_zones = prefix_zones
+        self.prices = prices
+        self.default_zone = default_zone
+        self.origin = origin
+        self._row_size = len(services)
+        self._zone_size = len(self.weight_breaks) * self._row_size
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RateTable':
+        """Build a table from its JSON structure, validating the shape of every rate row."""
+        services = data['services']
+        weight_breaks = [float(w) for w in data['weight_breaks_kg']]
+        if weight_breaks != sorted(weight_breaks):
+            raise ValueError('weight_breaks_kg must be ascending')
+        zone_codes = list(data['zones'])
+        zone_index = {code: index for index, code in enumerate(zone_codes)}
+
+        prices = array('d')
+        for zone in zone_codes:
+            zone_rates = data['rates'][zone]
+            rows = [zone_rates[service['code']] for service in services]
+            if any(len(row) != len(weight_breaks) for row in rows):
+                raise ValueError(f'Zone {zone}: every service needs one price per weight break')
+            # Interleave so each weight break holds all service prices contiguously
+            for break_prices in zip(*rows):
+                prices.extend(float(price) for price in break_prices)
+
+        prefix_zones = {
+            prefix.upper().replace(' ', ''): zone_index[zone]
+            for prefix, zone in data.get('fsa_zones', {}).items()
+        }
+        default_zone = data.get('default_zone')
+        return cls(
+            services=services,
+            weight_breaks=weight_breaks,
+            zone_codes=zone_codes,
+            prefix_zones=prefix_zones,
+            prices=prices,
+            default_zone=zone_index[default_zone] if default_zone is not None else None,
+            origin=data.get('origin')
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'RateTable':
+        """Load a rate table from a JSON file."""
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+    @property
+    def max_weight_kg(self) -> float:
+        return self.weight_breaks[-1]
+
+    def zone_for(self, postal_code: str) -> Optional[int]:
+        """Zone index for a postal code: longest matching prefix (FSA first), else the default zone."""
+        postal = (postal_code or '').strip().upper().replace(' ', '')
+        for length in (3, 2, 1):
+            zone = self.prefix_zones.get(postal[:length])
+            if zone is not None:
+                return zone
+        return self.default_zone
+
+    def lookup(self, postal_code: str, weight_kg: float) -> Optional[Tuple[int, array]]:
+        """Return (zone index, prices for every service), or None if not covered."""
+        zone = self.zone_for(postal_code)
+        if zone is None or weight_kg <= 0:
+            return None
+        weight_index = bisect_left(self.weight_breaks, weight_kg)
+        if weight_index == len(self.weight_breaks):
+            return None
+        offset = zone * self._zone_size + weight_index * self._row_size
+        return zone, self.prices[offset:offset + self._row_size]
+
+    def lookup_many(self, postal_code: str, weights_kg: Sequence[float]) -> List[Optional[array]]:
+        """Prices for several weights to the same destination (e.g. every parcel of a shipment)."""
+        zone = self.zone_for(postal_code)
+        if zone is None:
+            return [None] * len(weights_kg)
+        base = zone * self._zone_size
+        breaks, row = self.weight_breaks, self._row_size
+        results = []
+        for weight in weights_kg:
+            index = bisect_left(breaks, weight)
+            if weight <= 0 or index == len(breaks):
+                results.append(None)
+            else:
+                start = base + index * row
+                results.append(self.prices[start:start + row])
+        return results
+
+    def quote(self, destination_postal_code: str, weight_kg: float) -> Dict[str, any]:
+        """
+        Quote from the table, in the same shape as CanadaPostShippingService.get_shipping_rates.
+        """
+        result = {
+            'success': False,
+            'error': None,
+            'origin': self.origin,
+            'destination': destination_postal_code,
+            'weight_kg': weight_kg,
+            'options': [],
+            'source': 'rate_table'
+        }
+
+        found = self.lookup(destination_postal_code, weight_kg)
+        if found is None:
+            if weight_kg > self.max_weight_kg:
+                result['error'] = f'Weight exceeds {self.max_weight_kg:g} kg maximum for parcels'
+            else:
+                result['error'] = 'No shipping rates available for this destination'
+            return result
+
+        zone, prices = found
+        result['zone'] = self.zone_codes[zone]
+        result['options'] = sorted((
+            {
+                'service_code': service['code'],
+                'service_name': service['name'],
+                'price': price,
+                'guaranteed_days': service.get('guaranteed_days', 'N/A'),
+                'est_delivery_date': service.get('est_delivery_date', 'N/A')
+            }
+            for service, price in zip(self.services, prices)
+        ), key=lambda x: x['price'])
+        result['success'] = True
+        return result
+
+
+def init_rate_table(app):
+    """Load the configured rate table (if any) and attach it to the shipping service."""
+    from app.shipping import CanadaPostShippingService
+
+    path = app.config.get('SHIPPING_RATE_TABLE_PATH')
+    table = None
+    if path:
+        try:
+            table = RateTable.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            app.logger.warning(f"Could not load shipping rate table {path}: {e}")
+    CanadaPostShippingService.rate_table = table
+    return table
@@ -0,0 +1,269 @@
+"""
+Sales Rollups
+
+`daily_sales` (one row per order day) and `service_sales` (one row per
+service) hold pre-aggregated totals, so the dashboard and stats API read a
+handful of rows instead of scanning `orders` / `order_items`.
+
+The rollups are updated in the same transaction as the change they count:
+`record_order_sale` when checkout creates a paid order, and
+`record_payment_status_changes` when batch refunds or reconciliation change
+payment_status. An order counts as a sale while its payment_status is
+paid, partially_refunded or refunded, and additionally as a refund (against
+its order day) once refunded in full. `rebuild_sales_rollups` recomputes
+everything from the orders table (see backfill_sales.py).
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, case, delete, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import selectinload
+
+from app import db
+from app.models import DailySales, Order, OrderItem, ServiceSales
+
+SOLD_STATUSES = ('paid', 'partially_refunded', 'refunded')
+REFUNDED_STATUS = 'refunded'
+
+DAILY_COUNTERS = ('orders', 'revenue', 'shipping', 'items_sold', 'refunds', 'refunded_amount')
+SERVICE_COUNTERS = ('orders', 'quantity', 'revenue', 'refunded_quantity', 'refunded_revenue')
+
+
+class SalesDelta:
+    """Accumulated changes to daily and per-service totals, written with one upsert per table."""
+
+    def __init__(self):
+        self.daily = defaultdict(lambda: dict.fromkeys(DAILY_COUNTERS, 0))
+        self.services = defaultdict(lambda: dict.fromkeys(SERVICE_COUNTERS, 0))
+        self.service_names = {}
+
+    def add_order(self, created_at, total_amount, shipping_cost, lines, payment_status, sign=1):
+        """Add (sign=1) or remove (sign=-1) an order's contribution for a payment status."""
+        if payment_status not in SOLD_STATUSES:
+            return
+        refunded = payment_status == REFUNDED_STATUS
+        day = self.daily[created_at.date()]
+        day['orders'] += sign
+        day['revenue'] += sign * (total_amount or 0)
+        day['shipping'] += sign * (shipping_cost or 0)
+        day['items_sold'] += sign * sum(quantity for _, _, quantity, _ in lines)
+        if refunded:
+            day['refunds'] += sign
+            day['refunded_amount'] += sign * (total_amount or 0)
+
+        for service_id in {service_id for service_id, _, _, _ in lines}:
+            self.services[service_id]['orders'] += sign
+        for service_id, service_name, quantity, unit_price in lines:
+            service = self.services[service_id]
+            service['quantity'] += sign * quantity
+            service['revenue'] += sign * quantity * unit_price
+            if refunded:
+                service['refunded_quantity'] += sign * quantity
+                service['refunded_revenue'] += sign * quantity * unit_price
+            self.service_names[service_id] = service_name
+
+    def apply(self):
+        """Upsert the accumulated deltas (the caller commits)."""
+        daily = [{'day': day, **values} for day, values in self.daily.items() if any(values.values())]
+        services = [
+            {'service_id': service_id, 'service_name': self.service_names[service_id], **values}
+            for service_id, values in self.services.items() if any(values.values())
+        ]
+        if daily:
+            _upsert_increment(DailySales, ['day'], DAILY_COUNTERS, daily)
+        if services:
+            _upsert_increment(ServiceSales, ['service_id'], SERVICE_COUNTERS, services, replace=('service_name',))
+
+
+def _upsert_increment(model, keys, counters, rows, replace=()):
+    """INSERT ... ON CONFLICT DO UPDATE SET counter = counter + excluded.counter, as one executemany."""
+    dialect = db.session.get_bind().dialect.name
+    upsert = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}.get(dialect)
+    if upsert is None:
+        _increment_or_insert(model, keys, counters, rows, replace)
+        return
+    stmt = upsert(model)
+    table = model.__table__
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={
+            **{name: table.c[name] + stmt.excluded[name] for name in counters},
+            **{name: stmt.excluded[name] for name in replace},
+        }
+    )
+    db.session.execute(stmt, rows)
+
+
+def _increment_or_insert(model, keys, counters, rows, replace=()):
+    """
+    Portable version of _upsert_increment for databases without ON CONFLICT: look up
+    (and lock, where supported) the existing rows, then one UPDATE executemany for
+    those and one INSERT for the rest, in the caller's transaction.
+    """
+    table = model.__table__
+    existing = set(db.session.execute(
+        select(*[table.c[name] for name in keys])
+        .where(or_(*[and_(*[table.c[name] == row[name] for name in keys]) for row in rows]))
+        .with_for_update()
+    ).all())
+    updates, inserts = [], []
+    for row in rows:
+        if tuple(row[name] for name in keys) in existing:
+            updates.append({f'_{name}': row[name] for name in (*keys, *counters, *replace)})
+        else:
+            inserts.append(row)
+    if updates:
+        db.session.execute(
+            table.update()
+            .where(*[table.c[name] == bindparam(f'_{name}') for name in keys])
+            .values({
+                **{name: table.c[name] + bindparam(f'_{name}') for name in counters},
+                **{name: bindparam(f'_{name}') for name in replace},
+            }),
+            updates
+        )
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+
+def _order_lines(items):
+    return [(item.service_id, item.service_name, item.quantity or 0, item.unit_price or 0) for item in items]
+
+
+def record_order_sale(order, items):
+    """Count a new paid order; `items` are the order_items rows (dicts) inserted with it."""
+    delta = SalesDelta()
+    lines = [(item['service_id'], item['service_name'], item['quantity'] or 0, item['unit_price']) for item in items]
+    delta.add_order(order.created_at, order.total_amount, order.shipping_cost, lines, order.payment_status)
+    delta.apply()
+
+
+def record_payment_status_changes(changes):
+    """
+    Move orders between rollup states. `changes` maps order id -> (old payment_status, new payment_status);
+    orders and their items are loaded in two queries. The caller commits with the status update.
+    """
+    relevant = {
+        order_id: (old, new) for order_id, (old, new) in changes.items()
+        if (old in SOLD_STATUSES, old == REFUNDED_STATUS) != (new in SOLD_STATUSES, new == REFUNDED_STATUS)
+    }
+    if not relevant:
+        return
+    delta = SalesDelta()
+    orders = Order.query.options(selectinload(Order.items)).filter(Order.id.in_(relevant)).all()
+    for order in orders:
+        old, new = relevant[order.id]
+        lines = _order_lines(order.items)
+        delta.add_order(order.created_at, order.total_amount, order.shipping_cost, lines, old, sign=-1)
+        delta.add_order(order.created_at, order.total_amount, order.shipping_cost, lines, new)
+    delta.apply()
+
+
+def rebuild_sales_rollups():
+    """Recompute both rollup tables from orders and order_items with set-based queries. Returns row counts."""
+    refunded = Order.payment_status == REFUNDED_STATUS
+    sold = Order.payment_status.in_(SOLD_STATUSES)
+    day = func.date(Order.created_at)
+
+    items_per_order = (
+        db.session.query(OrderItem.order_id, func.sum(OrderItem.quantity).label('quantity'))
+        .group_by(OrderItem.order_id)
+        .subquery()
+    )
+    daily = (
+        db.session.query(
+            day,
+            func.count(Order.id),
+            func.sum(Order.total_amount),
+            func.sum(func.coalesce(Order.shipping_cost, 0)),
+            func.sum(func.coalesce(items_per_order.c.quantity, 0)),
+            func.sum(case((refunded, 1), else_=0)),
+            func.sum(case((refunded, Order.total_amount), else_=0)),
+        )
+        .outerjoin(items_per_order, items_per_order.c.order_id == Order.id)
+        .filter(sold)
+        .group_by(day)
+        .all()
+    )
+
+    line_total = OrderItem.quantity * OrderItem.unit_price
+    services = (
+        db.session.query(
+            OrderItem.service_id,
+            func.count(func.distinct(OrderItem.order_id)),
+            func.sum(OrderItem.quantity),
+            func.sum(line_total),
+            func.sum(case((refunded, OrderItem.quantity), else_=0)),
+            func.sum(case((refunded, line_total), else_=0)),
+        )
+        .join(Order, Order.id == OrderItem.order_id)
+        .filter(sold)
+        .group_by(OrderItem.service_id)
+        .all()
+    )
+    # Each service's most recent line name, like the incremental path
+    last_lines = (
+        db.session.query(func.max(OrderItem.id).label('id'))
+        .group_by(OrderItem.service_id)
+        .subquery()
+    )
+    names = dict(
+        db.session.query(OrderItem.service_id, OrderItem.service_name)
+        .join(last_lines, last_lines.c.id == OrderItem.id)
+        .all()
+    )
+
+    db.session.execute(delete(DailySales))
+    db.session.execute(delete(ServiceSales))
+    if daily:
+        db.session.execute(DailySales.__table__.insert(), [
+            dict(zip(('day', *DAILY_COUNTERS), (_as_date(row[0]), *row[1:]))) for row in daily
+        ])
+    if services:
+        db.session.execute(ServiceSales.__table__.insert(), [
+            dict(zip(('service_id', *SERVICE_COUNTERS), row), service_name=names[row[0]]) for row in services
+        ])
+    db.session.commit()
+    return {'days': len(daily), 'services': len(services)}
+
+
+def _as_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if isinstance(value, str) else value
+
+
+def sales_summary(days=30, top=10, today=None):
+    """Dashboard figures from the rollups: today, the last 7 days, the `days`-day period, its daily series and top services."""
+    today = today or datetime.utcnow().date()
+    since = today - timedelta(days=days - 1)
+    rows = DailySales.query.filter(DailySales.day >= since).order_by(DailySales.day).all()
+    by_day = {row.day: row.to_dict() for row in rows}
+    series = [by_day.get(since + timedelta(days=n)) or _empty_day(since + timedelta(days=n)) for n in range(days)]
+
+    def total(window):
+        window_days = series[-window:]
+        totals = {name: sum(day[name] for day in window_days) for name in
+                  ('orders', 'revenue', 'items_sold', 'refunds', 'refunded_amount', 'net_revenue')}
+        totals = {name: round(value, 2) if isinstance(value, float) else value for name, value in totals.items()}
+        totals['average_order'] = round(totals['revenue'] / totals['orders'], 2) if totals['orders'] else 0.0
+        return totals
+
+    top_services = (
+        ServiceSales.query
+        .order_by((ServiceSales.revenue - ServiceSales.refunded_revenue).desc())
+        .limit(top)
+        .all()
+    )
+    return {
+        'days': days,
+        'today': total(1),
+        'last_7_days': total(min(7, days)),
+        'period': total(days),
+        'daily': series,
+        'top_services': [service.to_dict() for service in top_services],
+    }
+
+
+def _empty_day(day):
+    return DailySales(day=day, **dict.fromkeys(DAILY_COUNTERS, 0)).to_dict()
@@ -0,0 +1,113 @@
+"""
+Database schema management.
+
+`db.create_all()` creates missing tables but never alters existing ones, so
+columns (and indexes) added to a model after its table was first created
+would be missing from deployed databases. `upgrade_schema` adds them in place.
+
+Both reflect every table, which is slow to repeat on each worker boot.
+`prepare_schema` therefore stores a fingerprint of the models' tables,
+columns and indexes after upgrading, and later boots only compare it.
+"""
+
+import hashlib
+from datetime import datetime
+
+from sqlalchemy import delete, exc, insert, inspect, select, text
+from app import db
+
+schema_version = db.Table(
+    'schema_version',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('fingerprint', db.String(64), nullable=False),
+    db.Column('upgraded_at', db.DateTime)
+)
+
+
+def add_missing_columns():
+    """Add model columns that are missing from existing tables (SQLite-safe ALTERs)."""
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if default is not None:
+                    ddl += f' DEFAULT {int(default) if isinstance(default, bool) else repr(default)}'
+                conn.execute(text(ddl))
+                added.append(f'{table.name}.{column.name}')
+
+            # Indexes declared on existing tables are skipped by create_all too
+            existing_indexes = {idx['name'] for idx in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+                    added.append(index.name)
+
+    return added
+
+
+def upgrade_schema():
+    """Create missing tables, add missing columns and backfill derived tables."""
+    from app.category_tree import ensure_category_paths
+
+    db.create_all()
+    added = add_missing_columns()
+    if ensure_category_paths():
+        added.append('category_paths (backfilled)')
+    return added
+
+
+def schema_fingerprint():
+    """Hash of every table, column (name and type) and index declared by the models."""
+    parts = []
+    for table in db.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f'{column.name}:{column.type}' for column in table.columns)
+        parts.extend(sorted(
+            f'{index.name}({",".join(column.name for column in index.columns)})' for index in table.indexes
+        ))
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+
+def schema_is_current():
+    """True if the stored fingerprint matches the models (one query, no reflection)."""
+    try:
+        stored = db.session.scalar(select(schema_version.c.fingerprint).where(schema_version.c.id == 1))
+    except exc.DBAPIError:
+        # No schema_version table yet
+        db.session.rollback()
+        return False
+    return stored == schema_fingerprint()
+
+
+def prepare_schema(check='version'):
+    """
+    Bring the schema up to date at startup.
+
+    Args:
+        check (str): 'version' upgrades only when the stored fingerprint differs
+            from the models; 'full' always runs upgrade_schema
+
+    Returns:
+        list or None: What upgrade_schema added, or None if the schema was current
+    """
+    if check == 'version' and schema_is_current():
+        return None
+    added = upgrade_schema()
+    db.session.execute(delete(schema_version))
+    db.session.execute(insert(schema_version).values(
+        id=1, fingerprint=schema_fingerprint(), upgraded_at=datetime.utcnow()
+    ))
+    db.session.commit()
+    return added
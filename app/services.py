@@ -1,7 +1,18 @@
-from flask import Blueprint, render_template, request, jsonify, make_response
-from app.models import Service, Cart, CartItem, Order, OrderItem, Category, db
+from flask import Blueprint, render_template, request, jsonify, make_response, current_app
+from app.models import Service, ServiceVariant, Cart, CartItem, Order, OrderItem, Category, PaymentAttempt, db
 from app.payment import get_square_processor
+from app.payment_attempts import (
+    claim_payment_attempt, record_payment_attempt, find_completed_attempt
+)
 from app.shipping import CanadaPostShippingService
+from app.packing import pack_parcels, PackingError
+from app.category_tree import breadcrumbs, subtree_ids
+from app.pricing import pricing_engine
+from app.rate_cache import get_rate_cache
+from app.rate_prefetch import get_rate_prefetcher
+from app.outbox import enqueue
+from app.sales import record_order_sale
+from sqlalchemy import delete, insert
 import uuid
 from datetime import datetime
 import json
@@ -43,11 +54,30 @@ def load_content():
     return {}
 
 
+# Catalog sort orders (min_price is indexed; quote-only items sort last)
+CATALOG_SORTS = {
+    'price_asc': (Service.min_price.is_(None), Service.min_price.asc()),
+    'price_desc': (Service.min_price.is_(None), Service.min_price.desc()),
+    'newest': (Service.created_at.desc(),),
+    'name': (Service.name.asc(),),
+}
+
+
+def _in_subtree(category_id):
+    """Active services filed under a category or anywhere below it."""
+    subtree = subtree_ids(category_id)
+    return Service.query.filter_by(is_active=True).filter(
+        Service.category_id.in_(subtree) | Service.sub_category_id.in_(subtree)
+    )
+
+
 @services_bp.route('/')
 def catalog():
     """Display all services/products."""
     category_param = request.args.get('category')
     subcategory_param = request.args.get('subcategory')
+    sort_param = request.args.get('sort')
+    order_by = CATALOG_SORTS.get(sort_param, ())
     content = load_content()
     categories = load_categories()
     
@@ -59,23 +89,24 @@ def catalog():
         # Filtering by subcategory
         subcategory = Category.query.filter_by(slug=subcategory_param, is_active=True).first()
         if subcategory:
-            services = Service.query.filter_by(category_id=subcategory.id, is_active=True).all()
+            services = _in_subtree(subcategory.id).order_by(*order_by).all()
             selected_subcategory = subcategory_param
-            parent_category = subcategory.parent
+            # The top-level category, however deep the subcategory is nested
+            parent_category = breadcrumbs(subcategory.id)[0] if subcategory.parent_id else None
             selected_category = parent_category.slug if parent_category else None
         else:
-            services = Service.query.filter_by(is_active=True).all()
+            services = Service.query.filter_by(is_active=True).order_by(*order_by).all()
     elif category_param:
         # Find category by slug
         category = Category.query.filter_by(slug=category_param, parent_id=None, is_active=True).first()
         if category:
-            services = Service.query.filter_by(category_id=category.id, is_active=True).all()
+            services = _in_subtree(category.id).order_by(*order_by).all()
             selected_category = category_param
             parent_category = category
         else:
-            services = Service.query.filter_by(is_active=True).all()
+            services = Service.query.filter_by(is_active=True).order_by(*order_by).all()
     else:
-        services = Service.query.filter_by(is_active=True).all()
+        services = Service.query.filter_by(is_active=True).order_by(*order_by).all()
     
     return render_template('services/catalog.html', 
                          services=services,
@@ -83,6 +114,7 @@ def catalog():
                          selected_category=selected_category,
                          selected_subcategory=selected_subcategory,
                          parent_category=parent_category,
+                         selected_sort=sort_param if sort_param in CATALOG_SORTS else None,
                          content=content)
 
 
@@ -94,16 +126,43 @@ def service_detail(slug):
     return render_template('services/detail.html', service=service, content=content)
 
 
+@services_bp.route('/api/variants/<sku>')
+def get_variant_by_sku(sku):
+    """Look up a product variant by SKU."""
+    variant = ServiceVariant.query.filter_by(sku=sku.strip()).first()
+    if not variant or not variant.service.is_active:
+        return jsonify({'success': False, 'error': 'Variant not found'}), 404
+    
+    data = variant.to_dict()
+    data['service_name'] = variant.service.name
+    data['service_slug'] = variant.service.slug
+    return jsonify({'success': True, 'variant': data})
+
+
 @services_bp.route('/add-to-cart', methods=['POST'])
 def add_to_cart():
     """Add service to cart."""
     data = request.get_json()
     service_id = data.get('service_id')
-    quantity = data.get('quantity', 1)
     options = data.get('options', {})
     
+    try:
+        quantity = int(data.get('quantity', 1))
+    except (ValueError, TypeError):
+        return jsonify({'success': False, 'error': 'Invalid quantity'}), 400
+    if quantity < 1:
+        return jsonify({'success': False, 'error': 'Quantity must be at least 1'}), 400
+    
     service = Service.query.get_or_404(service_id)
     
+    # Calculate price (bulk tier, selected variant and option adjustments)
+    try:
+        price = pricing_engine.price_line(service, quantity, options)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if price is None:
+        return jsonify({'success': False, 'error': f'{service.name} requires a quote'}), 400
+    
     # Get or create cart (using session ID)
     session_id = request.cookies.get('cart_session')
     if not session_id:
@@ -115,30 +174,31 @@ def add_to_cart():
         db.session.add(cart)
         db.session.commit()
     
-    # Calculate price
-    price = service.price_base
-    for option_key, option_value in options.items():
-        # Add logic to adjust price based on selected options
-        pass
-    
     # Add item to cart
     cart_item = CartItem(
-        cart_id=cart.id,
+        cart=cart,
         service_id=service_id,
         quantity=quantity,
         custom_options=options,
         price_at_time=price
     )
     db.session.add(cart_item)
+    cart.revision = (cart.revision or 0) + 1
+    
+    # Bulk tiers apply to the combined quantity, so other lines may change too
+    pricing_engine.reprice_cart(cart)
     db.session.commit()
     
     response_data = {
         'success': True,
         'message': f'{service.name} added to cart',
-        'cart_total': cart.get_total(),
+        'cart_total': cart.cached_total,
         'cart_count': len(cart.items)
     }
     
+    # Cart weight changed: warm shipping quotes for a destination we already know
+    prefetch_shipping_rates(cart, known_destination_postal_code())
+    
     # Create response with cookie
     response = make_response(jsonify(response_data))
     response.set_cookie('cart_session', session_id, max_age=2592000, secure=False, httponly=False, samesite='Lax')
@@ -155,7 +215,14 @@ def view_cart():
     if session_id:
         cart = Cart.query.filter_by(session_id=session_id).first()
     
-    return render_template('services/cart.html', cart=cart, content=content)
+    # Show a notice once if prices changed since items were added
+    prices_changed = False
+    if cart:
+        prices_changed = pricing_engine.reprice_cart(cart) or bool(cart.prices_changed)
+        cart.prices_changed = False
+        db.session.commit()
+    
+    return render_template('services/cart.html', cart=cart, content=content, prices_changed=prices_changed)
 
 
 @services_bp.route('/cart-count', methods=['GET'])
@@ -163,17 +230,81 @@ def get_cart_count():
     """Get the current cart item count."""
     session_id = request.cookies.get('cart_session')
     cart_count = 0
+    cart_total = 0
     
     if session_id:
         cart = Cart.query.filter_by(session_id=session_id).first()
         if cart:
             cart_count = len(cart.items)
+            cart_total = cart.cached_total or 0
     
     return jsonify({
-        'cart_count': cart_count
+        'cart_count': cart_count,
+        'cart_total': cart_total
     })
 
 
+def make_rate_fetcher(backend, estimate_after, rate_cache):
+    """
+    Build a fetch(postal_code, weight_kg, domestic_only) for the configured rate backend.
+    Live results that arrive after an estimate was returned are still cached.
+    """
+    def fetch(destination_postal_code, weight_kg, domestic_only):
+        return CanadaPostShippingService.get_rates(
+            destination_postal_code,
+            weight_kg,
+            domestic_only,
+            backend=backend,
+            estimate_after=estimate_after,
+            on_late_result=lambda result: rate_cache.set(
+                destination_postal_code, weight_kg, domestic_only, result
+            )
+        )
+    return fetch
+
+
+def cart_parcel_weights(cart):
+    """Split cart items into parcels within Canada Post limits; return each parcel's weight."""
+    cart_items_data = [
+        {
+            'name': item.service.name,
+            'weight_kg': item.service.weight_kg,
+            'quantity': item.quantity,
+            'length_cm': item.service.length_cm,
+            'width_cm': item.service.width_cm,
+            'height_cm': item.service.height_cm
+        }
+        for item in cart.items
+    ]
+    return [parcel.to_dict()['weight_kg'] for parcel in pack_parcels(cart_items_data)]
+
+
+def known_destination_postal_code():
+    """Shipping postal code from the customer's last rate lookup, else their previous order."""
+    postal_code = request.cookies.get('shipping_postal_code', '').strip()
+    if not postal_code:
+        order_number = request.cookies.get('last_order')
+        order = Order.query.filter_by(order_number=order_number).first() if order_number else None
+        postal_code = (order.customer_zip or '').strip() if order else ''
+    if postal_code and CanadaPostShippingService._is_canadian_postal_code(postal_code):
+        return postal_code
+    return None
+
+
+def prefetch_shipping_rates(cart, destination_postal_code, domestic_only=True):
+    """Quote the cart's parcels in the background so checkout hits a warm rate cache."""
+    backend = current_app.config.get('SHIPPING_RATE_BACKEND', 'live')
+    if not destination_postal_code or backend == 'table' or not current_app.config.get('SHIPPING_RATE_PREFETCH'):
+        return 0
+    try:
+        parcel_weights = cart_parcel_weights(cart)
+    except PackingError:
+        return 0
+    # Wait for live quotes in the background rather than caching nothing on a slow upstream
+    fetch = make_rate_fetcher(backend, None, get_rate_cache())
+    return get_rate_prefetcher().prefetch(destination_postal_code, parcel_weights, domestic_only, fetch)
+
+
 @services_bp.route('/api/shipping-rates', methods=['POST'])
 def get_shipping_rates():
     """
@@ -205,32 +336,38 @@ def get_shipping_rates():
                 'error': 'Cart is empty'
             }), 400
         
-        # Calculate total weight from cart items
-        cart_items_data = [
-            {
-                'weight_kg': item.service.weight_kg,
-                'quantity': item.quantity
-            }
-            for item in cart.items
-        ]
-        total_weight = CanadaPostShippingService.calculate_total_weight(cart_items_data)
+        # Split cart items into parcels within Canada Post limits
+        try:
+            parcel_weights = cart_parcel_weights(cart)
+        except PackingError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        # Quote every parcel concurrently (rate table, or cached quote else real API with estimates)
+        rate_cache = get_rate_cache()
+        backend = current_app.config.get('SHIPPING_RATE_BACKEND', 'live')
+        estimate_after = current_app.config.get('SHIPPING_RATE_ESTIMATE_AFTER')
+        fetch = make_rate_fetcher(backend, estimate_after, rate_cache)
         
-        # Get shipping rates (try real API first, fallback to demo)
-        rates = CanadaPostShippingService.get_shipping_rates(
+        # A quote already being fetched is waited for, not repeated, but never past one read timeout
+        wait = estimate_after if estimate_after is not None else CanadaPostShippingService.READ_TIMEOUT
+        
+        def quote_parcel(postal_code, weight_kg, domestic):
+            if backend == 'table':
+                return fetch(postal_code, weight_kg, domestic)
+            return rate_cache.get_or_fetch(postal_code, weight_kg, domestic, fetch, wait=wait)
+        
+        rates = CanadaPostShippingService.get_multi_parcel_rates(
             destination_postal_code,
-            total_weight,
-            domestic_only
+            parcel_weights,
+            domestic_only,
+            quote=quote_parcel
         )
         
-        # If no API credentials, use demo rates
-        if not rates['success'] and 'credentials not configured' in (rates.get('error') or ''):
-            rates = CanadaPostShippingService.get_demo_shipping_rates(
-                destination_postal_code,
-                total_weight
-            )
-            rates['is_demo'] = True
-        
-        return jsonify(rates)
+        # Remember the destination so later cart changes can prefetch its quotes
+        response = make_response(jsonify(rates))
+        if rates.get('success'):
+            response.set_cookie('shipping_postal_code', destination_postal_code.upper(), max_age=2592000, secure=False, httponly=True, samesite='Lax')
+        return response
     
     except Exception as e:
         return jsonify({
@@ -252,8 +389,16 @@ def checkout():
     if not cart or len(cart.items) == 0:
         return render_template('services/cart_empty.html', content=content)
     
+    # Show the same notice as the cart page; the flag is cleared once the new prices are shown
+    prices_changed = pricing_engine.reprice_cart(cart) or bool(cart.prices_changed)
+    cart.prices_changed = False
+    db.session.commit()
+    
+    # Start quoting shipping while the customer fills in the form
+    known_postal_code = known_destination_postal_code()
+    prefetch_shipping_rates(cart, known_postal_code)
+    
     # Pass Square configuration to template
-    from flask import current_app
     square_app_id = current_app.config.get('SQUARE_APPLICATION_ID')
     square_location_id = current_app.config.get('SQUARE_LOCATION_ID', '')
     cart_total_cents = int(cart.get_total() * 100)
@@ -263,14 +408,29 @@ def checkout():
                          content=content,
                          square_app_id=square_app_id,
                          square_location_id=square_location_id,
-                         cart_total_cents=cart_total_cents)
+                         cart_total_cents=cart_total_cents,
+                         known_postal_code=known_postal_code,
+                         prices_changed=prices_changed)
+
+
+def payment_attempt_response(attempt):
+    """Replay the recorded response of a finished payment attempt."""
+    response = make_response(jsonify(attempt.response), attempt.response_status or 200)
+    if attempt.status == 'succeeded':
+        # Lets the next cart prefetch shipping quotes for this address
+        response.set_cookie('last_order', attempt.response['order_number'], max_age=2592000, secure=False, httponly=True, samesite='Lax')
+    return response
 
 
 @services_bp.route('/process-payment', methods=['POST'])
 def process_payment():
-    """Process payment through Square."""
+    """Process payment through Square (idempotent per cart revision and amount)."""
+    attempt = None
     try:
         data = request.get_json()
+        amount_cents = data.get('amount')
+        if not isinstance(amount_cents, int) or isinstance(amount_cents, bool) or amount_cents <= 0:
+            return jsonify({'success': False, 'error': 'amount must be a positive number of cents'}), 400
         
         # Get cart
         session_id = request.cookies.get('cart_session')
@@ -279,8 +439,41 @@ def process_payment():
         
         cart = Cart.query.filter_by(session_id=session_id).first()
         if not cart or len(cart.items) == 0:
+            # The cart is deleted once paid: a retry of that payment gets its recorded result
+            completed = find_completed_attempt(session_id, amount_cents)
+            if completed:
+                return payment_attempt_response(completed)
             return jsonify({'success': False, 'error': 'Cart is empty'}), 400
         
+        # Never charge for stale prices: the customer must review the new total first
+        if pricing_engine.reprice_cart(cart) or cart.prices_changed:
+            cart.prices_changed = True
+            db.session.commit()
+            return jsonify({
+                'success': False,
+                'error': 'Prices in your cart have changed. Please review your order and try again.',
+                'prices_changed': True
+            }), 409
+        
+        # One ledger entry per cart revision and amount: duplicates replay or retry later instead of charging again
+        attempt, state = claim_payment_attempt(
+            cart, amount_cents, stale_after=current_app.config.get('PAYMENT_ATTEMPT_STALE_AFTER', 30)
+        )
+        if state == 'in_flight':
+            # Don't hold this worker while another request charges the card
+            attempt = None
+            retry_after = current_app.config.get('PAYMENT_ATTEMPT_RETRY_AFTER', 2)
+            response = jsonify({
+                'success': False,
+                'error': 'This payment is still being processed. Please wait a moment.',
+                'in_progress': True,
+                'retry_after': retry_after
+            })
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 409
+        if state == 'recorded':
+            return payment_attempt_response(attempt)
+        
         # Extract customer information
         customer_name = data.get('customer_name')
         customer_email = data.get('customer_email')
@@ -290,25 +483,28 @@ def process_payment():
         customer_state = data.get('customer_state')
         customer_zip = data.get('customer_zip')
         nonce = data.get('nonce')
-        amount_cents = data.get('amount')
         
         # Extract shipping information
         shipping_method = data.get('shipping_method', 'DOM.RP')
         shipping_service_name = data.get('shipping_service_name', 'Regular Parcel')
         shipping_cost = float(data.get('shipping_cost', 0))
         
-        # Process payment with Square
+        # Process payment with Square (a retry of an unknown outcome reuses the Square key)
         processor = get_square_processor()
         payment_result = processor.process_payment(
             amount_cents=amount_cents,
-            source_id=nonce
+            source_id=nonce,
+            idempotency_key=attempt.square_idempotency_key
         )
         
         if not payment_result['success']:
-            return jsonify({
+            response_data = {
                 'success': False,
                 'error': payment_result.get('error', 'Payment failed')
-            }), 400
+            }
+            record_payment_attempt(attempt, 'failed' if payment_result.get('declined') else 'error', response_data, 400)
+            db.session.commit()
+            return jsonify(response_data), 400
         
         # Calculate subtotal (amount without shipping)
         cart_subtotal = cart.get_total()
@@ -336,33 +532,57 @@ def process_payment():
         db.session.add(order)
         db.session.flush()
         
-        # Add order items from cart
-        for cart_item in cart.items:
-            order_item = OrderItem(
-                order_id=order.id,
-                service_id=cart_item.service_id,
-                service_name=cart_item.service.name,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.price_at_time,
-                custom_options=cart_item.custom_options
-            )
-            db.session.add(order_item)
+        # Add order items from cart (one executemany)
+        order_items = [
+            {
+                'order_id': order.id,
+                'service_id': cart_item.service_id,
+                'service_name': cart_item.service.name,
+                'quantity': cart_item.quantity,
+                'unit_price': cart_item.price_at_time,
+                'custom_options': cart_item.custom_options
+            }
+            for cart_item in cart.items
+        ]
+        db.session.execute(insert(OrderItem), order_items)
+        
+        # Dashboard sales totals change with the order, in the same transaction
+        record_order_sale(order, order_items)
         
         # Clear cart
-        CartItem.query.filter_by(cart_id=cart.id).delete()
-        db.session.delete(cart)
+        cart_id = cart.id
+        db.session.expunge(cart)
+        db.session.execute(delete(CartItem).where(CartItem.cart_id == cart_id))
+        db.session.execute(delete(Cart).where(Cart.id == cart_id))
         
-        db.session.commit()
+        # Post-payment work (receipt lookup, ...) runs in the outbox worker, not on this request
+        enqueue('payment.completed', {
+            'order_id': order.id,
+            'order_number': order_number,
+            'square_payment_id': payment_result['payment_id']
+        })
         
-        return jsonify({
+        # Record the result with the order, in the same transaction
+        record_payment_attempt(attempt, 'succeeded', {
             'success': True,
             'order_id': order.id,
             'order_number': order_number,
             'message': 'Payment successful!'
-        })
+        }, 200, square_payment_id=payment_result['payment_id'], order_id=order.id)
+        
+        db.session.commit()
+        
+        return payment_attempt_response(attempt)
     
     except Exception as e:
         db.session.rollback()
+        if attempt is not None and attempt.status == 'pending':
+            # Outcome unknown: let the next retry go ahead at once, with the same Square key
+            try:
+                PaymentAttempt.query.filter_by(id=attempt.id, status='pending').update({'status': 'error'})
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
         return jsonify({
             'success': False,
             'error': f'Error processing payment: {str(e)}'
@@ -8,15 +8,81 @@ This module handles communication with the Canada Post API to:
 """
 
 import os
+import logging
+import threading
+import time
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
     HAS_REQUESTS = True
 except ImportError:
     HAS_REQUESTS = False
 
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from decimal import Decimal
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
+
+from app.metrics import observe_upstream
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Minimal thread-safe circuit breaker.
+    
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open).
+    A successful trial closes the circuit; a failed one re-opens it.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+    
+    def allow(self) -> bool:
+        """Whether a call to the upstream may be attempted now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning("Canada Post circuit breaker opened")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+    
+    def reset(self):
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
 
 
 class CanadaPostShippingService:
@@ -33,7 +99,7 @@ class CanadaPostShippingService:
     - INTL.XIP: Xpresspost International
     """
     
-    API_ENDPOINT = "https://ct.canadapost.ca/getnrates"
+    API_ENDPOINT = os.environ.get('CANADA_POST_API_ENDPOINT', "https://ct.canadapost.ca/getnrates")
     USERNAME = os.environ.get('CANADA_POST_USERNAME', '')
     PASSWORD = os.environ.get('CANADA_POST_PASSWORD', '')
     CUSTOMER_NUMBER = os.environ.get('CANADA_POST_CUSTOMER_NUMBER', '')
@@ -41,6 +107,35 @@ class CanadaPostShippingService:
     # Origin postal code (where packages ship from)
     ORIGIN_POSTAL_CODE = "N9J1V6"  # User's location
     
+    # HTTP client settings (connect, read) in seconds
+    CONNECT_TIMEOUT = float(os.environ.get('CANADA_POST_CONNECT_TIMEOUT', 3.05))
+    READ_TIMEOUT = float(os.environ.get('CANADA_POST_READ_TIMEOUT', 8))
+    MAX_RETRIES = int(os.environ.get('CANADA_POST_MAX_RETRIES', 2))
+    RETRY_BACKOFF = 0.25  # seconds, doubled per retry plus jitter
+    RETRY_BACKOFF_MAX = 1.0  # seconds, cap on any single backoff sleep
+    POOL_SIZE = 10
+    
+    # Upstream health: after 5 consecutive failures, serve fallback quotes for 30s
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30.0)
+    
+    _session = None
+    _session_pid = None
+    _session_lock = threading.Lock()
+    
+    # Thread pool for quoting multi-parcel shipments concurrently
+    QUOTE_WORKERS = int(os.environ.get('CANADA_POST_QUOTE_WORKERS', 8))
+    _executor = None
+    _executor_pid = None
+    
+    # Separate pool for live calls raced against a deadline (avoids nested waits on _executor)
+    _hedge_executor = None
+    _hedge_executor_pid = None
+    
+    # Offline zone/weight rate table (app.rate_table.RateTable), loaded at startup if configured
+    rate_table = None
+    
+    BACKENDS = ('live', 'table')
+    
     # Service codes and display names (all services - user can filter)
     DOMESTIC_SERVICES = {
         'DOM.RP': 'Regular Parcel',
@@ -69,6 +164,64 @@ class CanadaPostShippingService:
             )
         return (cls.USERNAME, cls.PASSWORD)
     
+    @classmethod
+    def _get_session(cls):
+        """
+        Get the per-process pooled HTTP session (keep-alive, retries).
+        
+        Rate quotes are idempotent, so POSTs are retried on connection errors
+        and 429/5xx responses with short jittered exponential backoff. Read
+        timeouts are not retried: an upstream that is slow to answer would hold
+        the worker for READ_TIMEOUT per attempt, so one timeout goes straight to
+        the fallback quote and counts towards the circuit breaker.
+        A new session is created after fork so workers never share sockets.
+        """
+        pid = os.getpid()
+        if cls._session is not None and cls._session_pid == pid:
+            return cls._session
+        
+        with cls._session_lock:
+            if cls._session is None or cls._session_pid != pid:
+                retry_options = dict(
+                    total=cls.MAX_RETRIES,
+                    connect=cls.MAX_RETRIES,
+                    read=0,
+                    other=0,
+                    status=cls.MAX_RETRIES,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset({'POST'}),
+                    backoff_factor=cls.RETRY_BACKOFF,
+                    backoff_max=cls.RETRY_BACKOFF_MAX,
+                    # A long Retry-After would block the request; the breaker handles extended outages
+                    respect_retry_after_header=False,
+                    raise_on_status=False
+                )
+                try:
+                    retry = Retry(backoff_jitter=cls.RETRY_BACKOFF, **retry_options)
+                except TypeError:
+                    # urllib3 < 2 has no jitter support and a fixed 120 s backoff cap
+                    retry_options.pop('backoff_max')
+                    retry = Retry(**retry_options)
+                
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=cls.POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'Content-Type': 'application/xml'})
+                cls._session = session
+                cls._session_pid = pid
+        return cls._session
+    
+    @classmethod
+    def reset_session(cls):
+        """Close the pooled session and reset the circuit breaker (tests, config changes)."""
+        with cls._session_lock:
+            if cls._session is not None:
+                cls._session.close()
+            cls._session = None
+            cls._session_pid = None
+        cls.breaker.reset()
+    
     @classmethod
     def _is_canadian_postal_code(cls, postal_code: str) -> bool:
         """Check if postal code is Canadian format (A1A 1A1)."""
@@ -83,6 +236,12 @@ class CanadaPostShippingService:
             postal_code[5].isdigit()
         )
     
+    @classmethod
+    def _enabled_options(cls, options: List[Dict], domestic_only: bool) -> List[Dict]:
+        """Keep the services we offer: domestic only, or every enabled service."""
+        enabled = cls.ENABLED_DOMESTIC if domestic_only else cls.ENABLED_DOMESTIC | cls.ENABLED_INTERNATIONAL
+        return [option for option in options if option['service_code'] in enabled]
+    
     @classmethod
     def _parse_api_response(cls, xml_response: str) -> List[Dict]:
         """
@@ -223,30 +382,43 @@ class CanadaPostShippingService:
                 </quote>
             </eparcel>'''
             
-            # Make API request
-            response = requests.post(
-                cls.API_ENDPOINT,
-                auth=cls._get_auth(),
-                data=request_xml,
-                headers={'Content-Type': 'application/xml'},
-                timeout=10
-            )
+            # Serve estimated quotes while the upstream is unhealthy
+            if not cls.breaker.allow():
+                return cls.get_fallback_shipping_rates(
+                    destination_postal_code, weight_kg, 'Canada Post is temporarily unavailable'
+                )
             
-            response.raise_for_status()
+            # Make API request over the pooled session
+            started = time.perf_counter()
+            try:
+                response = cls._get_session().post(
+                    cls.API_ENDPOINT,
+                    auth=cls._get_auth(),
+                    data=request_xml,
+                    timeout=(cls.CONNECT_TIMEOUT, cls.READ_TIMEOUT)
+                )
+                response.raise_for_status()
+                observe_upstream('canada_post', 'rates', time.perf_counter() - started, True)
+            except requests.exceptions.RequestException as e:
+                observe_upstream('canada_post', 'rates', time.perf_counter() - started, False)
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                if status is not None and status < 500 and status != 429:
+                    # The upstream answered; the request itself was rejected
+                    cls.breaker.record_success()
+                    raise
+                cls.breaker.record_failure()
+                logger.warning(f"Canada Post request failed: {e}")
+                return cls.get_fallback_shipping_rates(
+                    destination_postal_code, weight_kg, f'Failed to connect to Canada Post service: {str(e)}'
+                )
+            
+            cls.breaker.record_success()
             
             # Parse response
             options = cls._parse_api_response(response.text)
             
-            # Filter based on domestic_only flag
-            if domestic_only:
-                options = [o for o in options if o['service_code'] in cls.ENABLED_DOMESTIC]
-            else:
-                # Filter to enabled services
-                enabled = cls.ENABLED_DOMESTIC | cls.ENABLED_INTERNATIONAL
-                options = [o for o in options if o['service_code'] in enabled]
-            
-            # Sort by price (cheapest first)
-            options = sorted(options, key=lambda x: x['price'])
+            # Filter based on domestic_only flag, cheapest first
+            options = sorted(cls._enabled_options(options, domestic_only), key=lambda x: x['price'])
             
             result['success'] = True
             result['options'] = options
@@ -312,6 +484,192 @@ class CanadaPostShippingService:
         result['options'] = sorted(result['options'], key=lambda x: x['price'])
         return result
     
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        """Per-process thread pool for concurrent parcel quotes (recreated after fork)."""
+        pid = os.getpid()
+        if cls._executor is None or cls._executor_pid != pid:
+            with cls._session_lock:
+                if cls._executor is None or cls._executor_pid != pid:
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=cls.QUOTE_WORKERS,
+                        thread_name_prefix='canada-post-quote'
+                    )
+                    cls._executor_pid = pid
+        return cls._executor
+    
+    @classmethod
+    def get_multi_parcel_rates(
+        cls,
+        destination_postal_code: str,
+        parcel_weights: List[float],
+        domestic_only: bool = True,
+        quote: Optional[Callable[[str, float, bool], Dict]] = None
+    ) -> Dict[str, any]:
+        """
+        Quote a shipment of several parcels, one request per parcel in parallel.
+        
+        Args:
+            destination_postal_code: Customer's postal code
+            parcel_weights: Weight of each parcel in kilograms
+            domestic_only: Only get domestic rates if True
+            quote: Single-parcel quote function (defaults to get_shipping_rates);
+                   pass a cached one to share quotes between parcels of equal weight
+        
+        Returns the same dictionary shape as get_shipping_rates, where each
+        option's price is the total over all parcels. Only services offered for
+        every parcel are returned.
+        """
+        quote = quote or cls.get_shipping_rates
+        
+        if len(parcel_weights) == 1:
+            results = [quote(destination_postal_code, parcel_weights[0], domestic_only)]
+        else:
+            futures = [
+                cls._get_executor().submit(quote, destination_postal_code, weight, domestic_only)
+                for weight in parcel_weights
+            ]
+            results = [future.result() for future in futures]
+        
+        result = {
+            'success': False,
+            'error': None,
+            'origin': cls.ORIGIN_POSTAL_CODE,
+            'destination': destination_postal_code,
+            'weight_kg': round(sum(parcel_weights), 3),
+            'parcel_count': len(parcel_weights),
+            'parcels': [
+                {'weight_kg': weight, 'cache_status': parcel_result.get('cache_status')}
+                for weight, parcel_result in zip(parcel_weights, results)
+            ],
+            'options': []
+        }
+        
+        failed = next((r for r in results if not r['success']), None)
+        if failed:
+            result['error'] = failed.get('error')
+            return result
+        
+        # Combine per service code, keeping services available for every parcel
+        combined = {option['service_code']: dict(option) for option in results[0]['options']}
+        for parcel_result in results[1:]:
+            prices = {option['service_code']: option['price'] for option in parcel_result['options']}
+            for code in list(combined):
+                if code in prices:
+                    combined[code]['price'] = round(combined[code]['price'] + prices[code], 2)
+                else:
+                    del combined[code]
+        
+        result['success'] = True
+        result['options'] = sorted(combined.values(), key=lambda x: x['price'])
+        for flag in ('is_demo', 'is_fallback', 'is_estimate'):
+            if any(r.get(flag) for r in results):
+                result[flag] = True
+        return result
+    
+    @classmethod
+    def get_estimated_shipping_rates(
+        cls,
+        destination_postal_code: str,
+        weight_kg: float
+    ) -> Dict[str, any]:
+        """
+        Offline estimate: the rate table if one is loaded and covers the
+        destination, otherwise the demo formula (marked `is_demo`).
+        """
+        if cls.rate_table is not None and cls._is_canadian_postal_code(destination_postal_code):
+            result = cls.rate_table.quote(destination_postal_code, weight_kg)
+            if result['success']:
+                result['is_estimate'] = True
+                return result
+        
+        result = cls.get_demo_shipping_rates(destination_postal_code, weight_kg)
+        result['is_demo'] = True
+        return result
+    
+    @classmethod
+    def get_fallback_shipping_rates(
+        cls,
+        destination_postal_code: str,
+        weight_kg: float,
+        reason: str
+    ) -> Dict[str, any]:
+        """
+        Estimated rates used when the live API is unreachable, slow or the circuit is open.
+        Marked with `is_fallback` so they are never cached as real quotes.
+        """
+        result = cls.get_estimated_shipping_rates(destination_postal_code, weight_kg)
+        result['is_fallback'] = True
+        result['warning'] = reason
+        return result
+    
+    @classmethod
+    def _get_hedge_executor(cls) -> ThreadPoolExecutor:
+        pid = os.getpid()
+        if cls._hedge_executor is None or cls._hedge_executor_pid != pid:
+            with cls._session_lock:
+                if cls._hedge_executor is None or cls._hedge_executor_pid != pid:
+                    cls._hedge_executor = ThreadPoolExecutor(
+                        max_workers=cls.QUOTE_WORKERS,
+                        thread_name_prefix='canada-post-live'
+                    )
+                    cls._hedge_executor_pid = pid
+        return cls._hedge_executor
+    
+    @classmethod
+    def get_rates(
+        cls,
+        destination_postal_code: str,
+        weight_kg: float,
+        domestic_only: bool = True,
+        backend: str = 'live',
+        estimate_after: Optional[float] = None,
+        on_late_result: Optional[Callable[[Dict], None]] = None
+    ) -> Dict[str, any]:
+        """
+        Quote one parcel from the selected backend.
+        
+        Args:
+            backend: 'live' (Canada Post API) or 'table' (offline rate table)
+            estimate_after: For the live backend, seconds to wait before answering
+                            with a rate-table estimate; the live call keeps running
+            on_late_result: Called with the live result if it finishes after the
+                            estimate was returned (e.g. to cache it)
+        
+        Without API credentials, the live backend answers with offline estimates.
+        """
+        if backend == 'table':
+            if cls.rate_table is None:
+                return cls.get_estimated_shipping_rates(destination_postal_code, weight_kg)
+            if not cls._is_canadian_postal_code(destination_postal_code):
+                result = cls.rate_table.quote(destination_postal_code, 0)
+                result['error'] = 'Invalid Canadian postal code format (e.g., N9J 1V6)'
+                return result
+            result = cls.rate_table.quote(destination_postal_code, weight_kg)
+            result['options'] = cls._enabled_options(result['options'], domestic_only)
+            return result
+        
+        if not cls.USERNAME or not cls.PASSWORD:
+            if not cls._is_canadian_postal_code(destination_postal_code):
+                return cls.get_shipping_rates(destination_postal_code, weight_kg, domestic_only)
+            return cls.get_estimated_shipping_rates(destination_postal_code, weight_kg)
+        
+        if not estimate_after or cls.rate_table is None:
+            return cls.get_shipping_rates(destination_postal_code, weight_kg, domestic_only)
+        
+        # Race the live call against the deadline
+        future = cls._get_hedge_executor().submit(
+            cls.get_shipping_rates, destination_postal_code, weight_kg, domestic_only
+        )
+        try:
+            return future.result(timeout=estimate_after)
+        except FuturesTimeoutError:
+            if on_late_result is not None:
+                future.add_done_callback(lambda f: f.exception() is None and on_late_result(f.result()))
+            return cls.get_fallback_shipping_rates(
+                destination_postal_code, weight_kg, 'Live rates are slow to respond; showing estimated rates'
+            )
+    
     @classmethod
     def calculate_total_weight(cls, cart_items: List[Dict]) -> float:
         """
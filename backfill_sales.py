@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Rebuild the daily_sales and service_sales rollup tables from orders and
+order_items. Run once after upgrading, or any time the totals look off;
+checkout and refunds keep them current afterwards.
+"""
+
+import os
+import sys
+import time
+
+# Add the project directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.sales import rebuild_sales_rollups
+
+
+def backfill_sales():
+    """Recompute the sales rollups in one transaction."""
+    app = create_app()
+
+    with app.app_context():
+        print("Rebuilding sales rollups...")
+        started = time.perf_counter()
+        counts = rebuild_sales_rollups()
+
+        print("  [+] {} day(s), {} service(s) in {:.1f}s".format(
+            counts['days'], counts['services'], time.perf_counter() - started))
+
+        print("\n" + "="*50)
+        print("[SUCCESS] Sales rollup backfill completed!")
+        print("="*50)
+
+
+if __name__ == '__main__':
+    backfill_sales()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Benchmark: import time and boot time of the app.
+
+Each measurement runs in a fresh interpreter against a copy of a database
+whose schema is already current (as on a normal restart), and reports the
+median of several runs:
+  - `import app` (Flask, SQLAlchemy and the models),
+  - create_app() with SCHEMA_CHECK=full (create_all + reflect every table)
+    and with SCHEMA_CHECK=version (one fingerprint query),
+  - the Square SDK, whose import now waits for the first payment call,
+  - starting N workers: N separate boots vs. one preloaded boot and N forks
+    (what gunicorn --preload does), each worker serving one request.
+
+Usage:
+    python benchmarks/bench_boot.py [--runs 7] [--workers 4] [--db instance/ecommerce.db]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+booted = time.perf_counter()
+loaded = 'square' in sys.modules
+with application.app_context():
+    from app.payment import get_square_processor
+    get_square_processor().client
+print(json.dumps({'import': imported - started, 'boot': booted - imported, 'square_at_boot': loaded,
+                  'square_first_use': time.perf_counter() - booted}))
+'''
+
+WORKERS = '''
+import json, os, sys, time
+workers, preload = int(sys.argv[1]), sys.argv[2] == 'preload'
+started = time.perf_counter()
+
+def serve(application):
+    from app import reset_after_fork
+    reset_after_fork(application)
+    assert application.test_client().get('/services/').status_code == 200
+
+if preload:
+    from app import create_app
+    application = create_app()
+for _ in range(workers):
+    pid = os.fork()
+    if pid == 0:
+        if not preload:
+            from app import create_app
+            application = create_app()
+        serve(application)
+        os._exit(0)
+for _ in range(workers):
+    assert os.waitstatus_to_exitcode(os.wait()[1]) == 0
+print(json.dumps({'elapsed': time.perf_counter() - started}))
+'''
+
+
+def run(code, env, *args):
+    result = subprocess.run([sys.executable, '-c', code, *args], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--db', default=os.path.join(ROOT, 'instance', 'ecommerce.db'),
+                        help='Database to copy (a fresh one is created if missing)')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench_boot.db')
+    if os.path.exists(args.db):
+        shutil.copy(args.db, path)
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', SHIPPING_RATE_PREFETCH='0')
+    run(BOOT, dict(env, SCHEMA_CHECK='version'))  # bring the copy up to date and record its version
+
+    print(f"Median of {args.runs} runs, fresh interpreter each\n")
+    for check in ('full', 'version'):
+        samples = [run(BOOT, dict(env, SCHEMA_CHECK=check)) for _ in range(args.runs)]
+        median = {key: statistics.median(s[key] for s in samples) for key in ('import', 'boot', 'square_first_use')}
+        print(f"SCHEMA_CHECK={check:8s} import app: {median['import'] * 1000:6.1f} ms   "
+              f"create_app: {median['boot'] * 1000:6.1f} ms   "
+              f"Square SDK loaded at boot: {samples[0]['square_at_boot']}   "
+              f"first Square client: {median['square_first_use'] * 1000:6.1f} ms")
+
+    print()
+    for mode in ('separate', 'preload'):
+        elapsed = statistics.median(
+            run(WORKERS, dict(env, SCHEMA_CHECK='version'), str(args.workers), mode)['elapsed']
+            for _ in range(args.runs)
+        )
+        print(f"{args.workers} workers, {mode:8s} boot + first request: {elapsed * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Benchmark: bulk catalog import vs. one POST /admin/api/items per item.
+
+Generates N catalog rows (with variants and bulk tiers) as CSV, then on a
+throwaway SQLite database times:
+  - the per-item endpoint on a sample of rows (extrapolated to N),
+  - a bulk import of all N rows (validation and writes timed separately),
+  - re-importing the same file with new prices (N updates).
+
+Usage:
+    python benchmarks/bench_catalog_import.py [--rows 50000] [--sample 500]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_csv(count, price_offset=0):
+    """CSV text for `count` items spread over 20 categories."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['name', 'category', 'description', 'price_base', 'bulk_pricing', 'variants', 'weight_kg'])
+    for i in range(count):
+        price = 10 + i % 90 + price_offset
+        writer.writerow([
+            f'Bench Item {i}', f'category-{i % 20}', f'Generated item {i}', price,
+            json.dumps([{'min_quantity': 10, 'price': price * 0.9}, {'min_quantity': 50, 'price': price * 0.8}]),
+            json.dumps([{'name': size, 'sku': f'B{i}-{size}', 'price': price + n} for n, size in enumerate('SML')]),
+            0.5 + i % 5,
+        ])
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--sample', type=int, default=500, help='Rows sent through the per-item endpoint')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench_import.db")}'
+    from app import create_app, db
+    from app.catalog_import import CatalogImport, read_rows
+    from app.models import Category, Service
+
+    app = create_app()
+    with app.app_context():
+        db.session.add_all(Category(name=f'Category {n}', slug=f'category-{n}') for n in range(20))
+        db.session.commit()
+        category_ids = {c.slug: c.id for c in Category.query}
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['admin_logged_in'] = True
+
+        # Per-item endpoint on a sample (distinct names so the bulk import still creates N items)
+        sample = read_rows(make_csv(args.sample), 'csv')
+        started = time.perf_counter()
+        for row in sample:
+            response = client.post('/admin/api/items', json={
+                'name': 'Single ' + row['name'], 'category_id': category_ids[row['category']],
+                'description': row['description'], 'price_base': row['price_base'],
+                'bulk_pricing': json.loads(row['bulk_pricing']),
+                'variants': [dict(v, sku='S' + v['sku']) for v in json.loads(row['variants'])],
+                'weight_kg': row['weight_kg'],
+            })
+            assert response.status_code == 201, response.get_json()
+        single = time.perf_counter() - started
+        print(f"per-item POST  {args.sample:>7,} rows {single:>8.2f}s  {args.sample / single:>9,.0f} rows/s"
+              f"  (~{single / args.sample * args.rows:,.0f}s for {args.rows:,})")
+
+        for label, text in [('bulk create', make_csv(args.rows)), ('bulk update', make_csv(args.rows, price_offset=5))]:
+            started = time.perf_counter()
+            rows = read_rows(text, 'csv')
+            parsed = time.perf_counter()
+            run = CatalogImport(rows)
+            assert run.validate(), run.errors[:3]
+            validated = time.perf_counter()
+            counts = run.write()
+            finished = time.perf_counter()
+            elapsed = finished - started
+            print(f"{label:<14} {len(rows):>7,} rows {elapsed:>8.2f}s  {len(rows) / elapsed:>9,.0f} rows/s"
+                  f"  (parse {parsed - started:.2f}s, validate {validated - parsed:.2f}s, write {finished - validated:.2f}s;"
+                  f" created {counts['created']:,}, updated {counts['updated']:,})")
+
+        print(f"\nItems in catalog: {Service.query.count():,}")
+
+
+if __name__ == '__main__':
+    main()
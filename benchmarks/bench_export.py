@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Benchmark: streaming order export memory and throughput.
+
+Fills a throwaway SQLite database with N orders (3 items each), then streams
+the orders export (app.export.export_chunks) as CSV, NDJSON and gzipped CSV
+while tracing Python allocations, and compares it with building the same CSV
+from one `.all()` query. Peak memory of the streamed export should stay
+roughly constant as --orders grows; the `.all()` baseline grows with it.
+
+Usage:
+    python benchmarks/bench_export.py [--orders 200000]
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.orm import selectinload
+
+from bench_order_list import fill
+
+
+def measure(fn):
+    """Time fn, then run it again under tracemalloc (which slows it down); returns (seconds, peak MB, result)."""
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=200_000)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench_export.db")}'
+    from app import create_app, db
+    from app.models import Order, OrderItem
+    from app.export import ORDER_COLUMNS, export_chunks
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        fill(db, Order, OrderItem, args.orders)
+        db.session.execute(text('ANALYZE'))
+        print(f"Inserted {args.orders:,} orders in {time.perf_counter() - started:.1f}s\n")
+
+        def stream(fmt, compress=False):
+            def run():
+                total = 0
+                for chunk in export_chunks('orders', fmt, {}, compress=compress):
+                    total += len(chunk)
+                db.session.remove()
+                return total
+            return run
+
+        def load_all():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(ORDER_COLUMNS)
+            for order in Order.query.options(selectinload(Order.items)).order_by(Order.id).all():
+                data = order.to_dict(include_items=True)
+                for item in data['items']:
+                    writer.writerow([data['id'], data['order_number'], item['service_name'], item['quantity']])
+            size = len(buffer.getvalue().encode())
+            db.session.remove()
+            return size
+
+        print(f"{'export':<22} {'seconds':>8} {'peak MB':>8} {'output MB':>10} {'orders/s':>10}")
+        print('-' * 62)
+        for name, fn in [
+            ('stream csv', stream('csv')),
+            ('stream ndjson', stream('ndjson')),
+            ('stream csv + gzip', stream('csv', compress=True)),
+            ('.all() csv (baseline)', load_all),
+        ]:
+            elapsed, peak, size = measure(fn)
+            print(f"{name:<22} {elapsed:>8.2f} {peak:>8.1f} {size / 1024 / 1024:>10.1f} {args.orders / elapsed:>10,.0f}")
+
+
+if __name__ == '__main__':
+    main()
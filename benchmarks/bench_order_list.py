@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Benchmark: admin order listing on a large orders table, keyset vs. OFFSET paging.
+
+Fills a throwaway SQLite database with N orders (3 items each), then times
+fetching pages near the start and deep into the table with keyset
+pagination (app.orders.list_orders) and with LIMIT/OFFSET, plus filtered
+pages and indexed lookups. Prints each query plan so index use is visible.
+
+Usage:
+    python benchmarks/bench_order_list.py [--orders 1000000] [--page-size 50]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import selectinload
+
+STATUSES = [('completed', 'paid')] * 6 + [('processing', 'paid')] * 3 + [('cancelled', 'refunded'), ('pending', 'failed')]
+
+
+def fill(db, Order, OrderItem, count, chunk=50000):
+    """Insert `count` orders spread over two years, with three items each."""
+    start = datetime(2024, 1, 1)
+    step = timedelta(days=730) / count
+    rng = random.Random(42)
+    for offset in range(0, count, chunk):
+        orders, items = [], []
+        for i in range(offset, min(offset + chunk, count)):
+            status, payment_status = rng.choice(STATUSES)
+            orders.append({
+                'id': i + 1,
+                'order_number': f'ORD-{i + 1:08X}',
+                'customer_email': f'customer{rng.randrange(count // 4 or 1)}@example.com',
+                'customer_name': 'Bench Customer',
+                'subtotal': 40.0,
+                'total_amount': 52.5,
+                'status': status,
+                'payment_status': payment_status,
+                'created_at': start + step * i,
+                'updated_at': start + step * i,
+            })
+            items.extend({'order_id': i + 1, 'service_id': 1, 'service_name': f'Item {n}', 'quantity': 1,
+                          'unit_price': 13.33} for n in range(3))
+        db.session.execute(insert(Order), orders)
+        db.session.execute(insert(OrderItem), items)
+        db.session.commit()
+
+
+def timed(fn, repeat=5):
+    """Best-of-N wall time in ms, and the last result."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench_orders.db")}'
+    from app import create_app, db
+    from app.models import Order, OrderItem
+    from app.orders import encode_cursor, list_orders, order_list_query
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        fill(db, Order, OrderItem, args.orders)
+        db.session.execute(text('ANALYZE'))
+        print(f"Inserted {args.orders:,} orders in {time.perf_counter() - started:.1f}s\n")
+
+        size = args.page_size
+        deep = max(args.orders - size * 2, 0)
+        deep_order = order_list_query({}).offset(deep - 1).limit(1).first() if deep else None
+        deep_cursor = encode_cursor(deep_order) if deep_order else None
+
+        def offset_page(offset, **filters):
+            query = order_list_query(filters).options(selectinload(Order.items))
+            return lambda: query.offset(offset).limit(size).all()
+
+        cases = [
+            ('keyset first page', lambda: list_orders({}, None, size)),
+            ('keyset deep page', lambda: list_orders({}, deep_cursor, size)),
+            ('offset first page', offset_page(0)),
+            (f'offset {deep:,}', offset_page(deep)),
+            ('keyset status=pending', lambda: list_orders({'status': 'pending'}, None, size)),
+            ('keyset payment=refunded + range', lambda: list_orders(
+                {'payment_status': 'refunded', 'start': datetime(2025, 6, 1), 'end': datetime(2025, 7, 1)}, None, size)),
+            ('lookup order_number', lambda: list_orders({'order_number': f'ORD-{args.orders // 2:08X}'}, None, size)),
+            ('lookup customer_email', lambda: list_orders({'customer_email': 'customer7@example.com'}, None, size)),
+        ]
+
+        print(f"{'query':<34} {'ms':>9} {'rows':>5}")
+        print('-' * 50)
+        for name, fn in cases:
+            elapsed, result = timed(fn, repeat=3 if 'offset' in name else 5)
+            rows = result[0] if isinstance(result, tuple) else result
+            print(f"{name:<34} {elapsed:>9.2f} {len(rows):>5}")
+
+        print("\nQuery plans:")
+        for name, query in [
+            ('keyset deep page', order_list_query({}).filter(
+                db.tuple_(Order.created_at, Order.id) < db.tuple_(deep_order.created_at if deep_order else datetime.utcnow(), 1))),
+            ('status filter', order_list_query({'status': 'pending'})),
+            ('customer_email', order_list_query({'customer_email': 'customer7@example.com'})),
+        ]:
+            compiled = query.limit(size).statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+            plan = db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}')).fetchall()
+            print(f"  {name}: " + '; '.join(row[-1] for row in plan))
+
+
+if __name__ == '__main__':
+    main()
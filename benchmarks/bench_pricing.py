@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Microbenchmark: legacy per-call tier sorting vs. the compiled pricing engine.
+
+Usage:
+    python benchmarks/bench_pricing.py [--services 200] [--tiers 12] [--lookups 200000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.pricing import PricingEngine
+
+
+def legacy_price_for_quantity(service, quantity):
+    """The original Service.get_price_for_quantity implementation."""
+    if service.price_base is None:
+        return None
+    if not service.bulk_pricing:
+        return service.price_base
+    applicable_tier = None
+    for tier in sorted(service.bulk_pricing, key=lambda x: x['min_quantity'], reverse=True):
+        if quantity >= tier['min_quantity']:
+            applicable_tier = tier
+            break
+    return applicable_tier['price'] if applicable_tier else service.price_base
+
+
+def make_services(count, tiers):
+    services = []
+    for service_id in range(1, count + 1):
+        base = round(random.uniform(5, 500), 2)
+        bulk_pricing = [
+            {'min_quantity': 5 * (i + 1), 'price': round(base * (1 - 0.03 * (i + 1)), 2)}
+            for i in range(tiers)
+        ]
+        random.shuffle(bulk_pricing)
+        services.append(SimpleNamespace(
+            id=service_id,
+            price_base=base,
+            bulk_pricing=bulk_pricing,
+            variants=[{'name': 'Large', 'price': base * 1.5, 'sku': f'SKU-{service_id}-L', 'is_available': True}],
+            service_options=[],
+            pricing_revision=0,
+            created_at=datetime(2026, 1, 1),
+        ))
+    return services
+
+
+def timed(label, fn, lookups):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<32} {elapsed * 1000:8.1f} ms  ({elapsed / lookups * 1e9:7.0f} ns/lookup)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--services', type=int, default=200)
+    parser.add_argument('--tiers', type=int, default=12)
+    parser.add_argument('--lookups', type=int, default=200000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    services = make_services(args.services, args.tiers)
+    workload = [(random.choice(services), random.randint(1, 5 * args.tiers + 10)) for _ in range(args.lookups)]
+    engine = PricingEngine()
+
+    def run_legacy():
+        for service, quantity in workload:
+            legacy_price_for_quantity(service, quantity)
+
+    def run_engine():
+        for service, quantity in workload:
+            engine.price_line(service, quantity)
+
+    # Results must agree before timings mean anything
+    for service, quantity in workload[:5000]:
+        assert engine.price_line(service, quantity) == round(legacy_price_for_quantity(service, quantity), 2)
+
+    print(f"Pricing {args.lookups} lines across {args.services} services with {args.tiers} tiers each:")
+    legacy = timed('legacy (sort per call)', run_legacy, args.lookups)
+    compiled = timed('engine (compiled + bisect)', run_engine, args.lookups)
+    print(f"  speedup: {legacy / compiled:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
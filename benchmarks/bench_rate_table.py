@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Microbenchmark: offline rate-table quotes vs. the demo rate formula.
+
+Usage:
+    python benchmarks/bench_rate_table.py [--table instance/rate_table.json] [--quotes 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.rate_table import RateTable
+from app.shipping import CanadaPostShippingService
+
+
+def timed(label, fn, count):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<32} {elapsed * 1000:8.1f} ms  ({elapsed / count * 1e6:6.2f} us/quote)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--table', default=os.path.join(ROOT, 'instance', 'rate_table.json'))
+    parser.add_argument('--quotes', type=int, default=100000)
+    args = parser.parse_args()
+
+    table = RateTable.load(args.table)
+    random.seed(42)
+    prefixes = list(table.prefix_zones) or ['K1A']
+    workload = [
+        (f"{random.choice(prefixes)[:3]:X<3}{random.randint(0, 9)}A{random.randint(0, 9)}",
+         round(random.uniform(0.1, table.max_weight_kg), 2))
+        for _ in range(args.quotes)
+    ]
+
+    def run_lookup():
+        for postal_code, weight in workload:
+            table.lookup(postal_code, weight)
+
+    def run_quote():
+        for postal_code, weight in workload:
+            table.quote(postal_code, weight)
+
+    def run_demo():
+        for postal_code, weight in workload:
+            CanadaPostShippingService.get_demo_shipping_rates(postal_code, weight)
+
+    print(f"{args.quotes} quotes against {len(table.zone_codes)} zones x "
+          f"{len(table.weight_breaks)} weight breaks x {len(table.services)} services:")
+    timed('table lookup (prices only)', run_lookup, args.quotes)
+    timed('table quote (full response)', run_quote, args.quotes)
+    timed('demo formula', run_demo, args.quotes)
+
+    # Several parcels to one destination share the zone resolution
+    weights = [w for _, w in workload[:8]]
+    start = time.perf_counter()
+    for postal_code, _ in workload[:args.quotes // 8]:
+        table.lookup_many(postal_code, weights)
+    elapsed = time.perf_counter() - start
+    print(f"  {'lookup_many (8 parcels)':<32} {elapsed * 1000:8.1f} ms  "
+          f"({elapsed / (args.quotes // 8 * 8) * 1e6:6.2f} us/parcel)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Benchmark: concurrent cart writes and catalog reads under each SQLite profile.
+
+For every profile in app/db_profile.py, seeds a throwaway database with a
+catalog, then runs W worker processes (like gunicorn sync workers) against
+it for a fixed time. Writers add items to carts (POST /services/add-to-cart,
+a SELECT plus INSERT/UPDATE commit per request). Readers render the catalog
+(GET /services/?category=...). Reports throughput, latency percentiles and
+"database is locked" failures per operation.
+
+Usage:
+    python benchmarks/bench_sqlite_profile.py [--workers 4] [--writers 2] [--duration 10] [--items 500]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_shipping import percentile
+
+CATEGORIES = 10
+
+
+def seed(items):
+    """Fill a fresh database with `items` priced items over CATEGORIES categories."""
+    from app import create_app, db
+    from app.catalog_import import import_catalog
+    from app.models import Category
+
+    app = create_app()
+    with app.app_context():
+        db.session.add_all(Category(name=f'Category {n}', slug=f'category-{n}') for n in range(CATEGORIES))
+        db.session.commit()
+        report = import_catalog([
+            {'name': f'Bench Item {i}', 'category': f'category-{i % CATEGORIES}', 'description': f'Item {i}',
+             'price_base': 10 + i % 50, 'bulk_pricing': [{'min_quantity': 10, 'price': 8 + i % 50}]}
+            for i in range(items)
+        ])
+        assert report['success'], report['errors'][:3]
+        db.session.remove()
+        db.engine.dispose()
+
+
+def worker(role, items, start, deadline, results):
+    """Issue requests of one kind until the deadline; report (latencies, errors)."""
+    from app import create_app
+
+    app = create_app()
+    client = app.test_client()
+    rng = random.Random(os.getpid())
+    latencies, errors = [], 0
+    start.wait()
+    while time.time() < deadline.value:
+        started = time.perf_counter()
+        if role == 'write':
+            if rng.random() < 0.2:
+                client.delete_cookie('cart_session')  # a new shopper now and then
+            response = client.post('/services/add-to-cart', json={'service_id': rng.randint(1, items), 'quantity': rng.randint(1, 12)})
+        else:
+            response = client.get(f'/services/?category=category-{rng.randrange(CATEGORIES)}')
+        if response.status_code == 200:
+            latencies.append((time.perf_counter() - started) * 1000)
+        else:
+            errors += 1
+    results.put((role, latencies, errors))
+
+
+def run_profile(profile, args):
+    # Config classes read the environment once, so point them at this run's database directly
+    import config
+    config.DevelopmentConfig.SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tempfile.mkdtemp(), f'bench_{profile}.db')}"
+    config.DevelopmentConfig.SQLITE_PROFILE = profile
+    config.DevelopmentConfig.SHIPPING_RATE_PREFETCH = False
+    seed(args.items)
+
+    context = multiprocessing.get_context('fork')
+    start, results = context.Event(), context.Queue()
+    deadline = context.Value('d', 0.0)
+    roles = ['write'] * args.writers + ['read'] * (args.workers - args.writers)
+    processes = [context.Process(target=worker, args=(role, args.items, start, deadline, results)) for role in roles]
+    for process in processes:
+        process.start()
+    time.sleep(1.0)  # let every worker finish booting
+    deadline.value = time.time() + args.duration
+    start.set()
+
+    totals = {'write': ([], 0), 'read': ([], 0)}
+    for _ in processes:
+        role, latencies, errors = results.get()
+        totals[role] = (totals[role][0] + latencies, totals[role][1] + errors)
+    for process in processes:
+        process.join()
+
+    print(f"profile={profile}")
+    for role, label in (('write', 'add-to-cart'), ('read', 'catalog read')):
+        latencies, errors = totals[role]
+        latencies.sort()
+        print(f"  {label:12s} {len(latencies) / args.duration:7.1f} req/s   "
+              f"p50 {percentile(latencies, 50):6.1f} ms   p95 {percentile(latencies, 95):6.1f} ms   "
+              f"p99 {percentile(latencies, 99):7.1f} ms   errors {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes')
+    parser.add_argument('--writers', type=int, default=2, help='How many of them write')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per profile')
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--profiles', default='default,production')
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers ({args.writers} writing), {args.duration:g} s per profile\n")
+    for profile in args.profiles.split(','):
+        run_profile(profile, args)
+
+
+if __name__ == '__main__':
+    main()
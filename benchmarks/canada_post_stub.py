@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Canada Post getnrates API.
+
+Speaks the same XML protocol as the real endpoint (an <eparcel><quote> request
+in, <price-quotes> or <error> out) with configurable latency, fault rates and
+payload size, so the shipping client can be tested and load-tested offline.
+
+Usage:
+    python benchmarks/canada_post_stub.py [--port 8089] [--profile healthy]
+    CANADA_POST_API_ENDPOINT=http://127.0.0.1:8089/getnrates \\
+    CANADA_POST_USERNAME=stub CANADA_POST_PASSWORD=stub python run_debug.py
+
+The active fault profile can be switched at runtime:
+    curl -X POST http://127.0.0.1:8089/_profile -d '{"profile": "flaky"}'
+    curl http://127.0.0.1:8089/_stats
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Fault profiles: latency in ms; rates are probabilities per request
+PROFILES = {
+    'healthy': {'latency_ms': 120, 'jitter_ms': 60},
+    'slow': {'latency_ms': 1500, 'jitter_ms': 1000},
+    'flaky': {'latency_ms': 200, 'jitter_ms': 150, 'http_error_rate': 0.2, 'api_error_rate': 0.05},
+    'hanging': {'latency_ms': 150, 'jitter_ms': 50, 'hang_rate': 0.1, 'hang_ms': 15000},
+    'malformed': {'latency_ms': 100, 'malformed_rate': 0.3},
+    'large': {'latency_ms': 150, 'jitter_ms': 50, 'extra_services': 400},
+    'outage': {'latency_ms': 50, 'http_error_rate': 1.0},
+}
+
+DEFAULTS = {
+    'latency_ms': 0,
+    'jitter_ms': 0,
+    'http_error_rate': 0.0,    # 503 responses
+    'api_error_rate': 0.0,     # 200 with an <error> document
+    'malformed_rate': 0.0,     # truncated XML
+    'hang_rate': 0.0,          # answer after hang_ms (read timeouts)
+    'hang_ms': 15000,
+    'extra_services': 0,       # additional (filtered) services to bloat the payload
+}
+
+SERVICES = [
+    # code, name, base price, price per kg, guaranteed days
+    ('DOM.RP', 'Regular Parcel', 9.50, 1.10, '5'),
+    ('DOM.EP', 'Expedited Parcel', 11.25, 1.45, '3'),
+    ('DOM.XP', 'Xpresspost', 16.40, 2.20, '2'),
+    ('DOM.PRIORITY', 'Priority', 24.75, 3.10, '1'),
+    ('INTL.IP', 'International Parcel Surface', 38.00, 6.50, '30'),
+    ('INTL.XIP', 'Xpresspost International', 52.00, 9.80, '6'),
+]
+
+
+def build_profile(name='healthy', **overrides):
+    """Resolve a named profile plus overrides into a full settings dict."""
+    settings = dict(DEFAULTS)
+    settings.update(PROFILES[name])
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+    settings['name'] = name
+    return settings
+
+
+def parse_quote_request(body: bytes):
+    """Return (destination postal code, weight in kg) from an <eparcel> request."""
+    root = ET.fromstring(body)
+    quote = root.find('quote')
+    destination = quote.findtext('destination-postal-code', '').strip()
+    weight_kg = int(quote.find('parcel').findtext('weight', '0')) / 1000
+    return destination, weight_kg
+
+
+def render_rates(destination: str, weight_kg: float, extra_services: int = 0) -> str:
+    """Build a <price-quotes> document; prices grow with weight and distance (by FSA letter)."""
+    distance = 1 + (ord(destination[:1] or 'N') % 7) * 0.15
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<price-quotes>']
+    for code, name, base, per_kg, days in SERVICES:
+        price = round((base + per_kg * weight_kg) * distance, 2)
+        parts.append(
+            f'<service><service-code>{code}</service-code><service-name>{name}</service-name>'
+            f'<price>{price:.2f}</price><guaranteed-days>{days}</guaranteed-days>'
+            f'<est-delivery-date>2026-01-0{min(int(days), 9)}</est-delivery-date></service>'
+        )
+    for index in range(extra_services):
+        parts.append(
+            f'<service><service-code>USA.STUB{index}</service-code><service-name>Stub Service {index}</service-name>'
+            f'<price>{50 + index % 50}.00</price><guaranteed-days>7</guaranteed-days></service>'
+        )
+    parts.append('</price-quotes>')
+    return ''.join(parts)
+
+
+def render_error(message: str) -> str:
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<error><message>{message}</message></error>'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if self.path.startswith('/_profile'):
+            data = json.loads(body or b'{}')
+            settings = stub.set_profile(data.pop('profile', stub.settings['name']), **data)
+            return self._send(200, json.dumps(settings), 'application/json')
+
+        stub.begin()
+        try:
+            status, payload = stub.respond(body)
+            self._send(status, payload)
+        finally:
+            stub.end()
+
+    def do_GET(self):
+        if self.path.startswith('/_stats'):
+            return self._send(200, json.dumps(self.server.stub.stats()), 'application/json')
+        self._send(404, render_error('Not found'))
+
+    def _send(self, status, payload, content_type='application/vnd.cpc.ship.rate-v4+xml'):
+        body = payload.encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client gave up (read timeout)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections (pool resets, read timeouts) are expected
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+
+class CanadaPostStub:
+    """Threaded getnrates stub; use as a context manager or call start()/stop()."""
+
+    def __init__(self, host='127.0.0.1', port=0, profile='healthy', seed=None, **overrides):
+        self.settings = build_profile(profile, **overrides)
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self.reset_stats()
+        self.httpd = StubHTTPServer((host, port), StubHandler)
+        self.httpd.stub = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/getnrates'
+
+    def set_profile(self, name, **overrides):
+        with self._lock:
+            self.settings = build_profile(name, **overrides)
+            return dict(self.settings)
+
+    def reset_stats(self):
+        with self._lock:
+            self._counters = {
+                'requests': 0, 'ok': 0, 'http_errors': 0, 'api_errors': 0,
+                'malformed': 0, 'hangs': 0, 'bad_requests': 0,
+                'in_flight': 0, 'max_in_flight': 0, 'bytes_sent': 0,
+            }
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['profile'] = self.settings['name']
+            return stats
+
+    def begin(self):
+        with self._lock:
+            self._counters['requests'] += 1
+            self._counters['in_flight'] += 1
+            self._counters['max_in_flight'] = max(self._counters['max_in_flight'], self._counters['in_flight'])
+
+    def end(self):
+        with self._lock:
+            self._counters['in_flight'] -= 1
+
+    def _count(self, key, payload=''):
+        with self._lock:
+            self._counters[key] += 1
+            self._counters['bytes_sent'] += len(payload)
+
+    def respond(self, body: bytes):
+        """Pick the outcome for one request according to the active profile. Returns (status, payload)."""
+        with self._lock:
+            settings = dict(self.settings)
+            roll = self.random.random()
+            latency = settings['latency_ms'] + self.random.uniform(-1, 1) * settings['jitter_ms']
+
+        # Outcomes are mutually exclusive, checked in order against one roll
+        outcome = 'ok'
+        threshold = 0.0
+        for name, key in (('hang', 'hang_rate'), ('http_error', 'http_error_rate'),
+                          ('api_error', 'api_error_rate'), ('malformed', 'malformed_rate')):
+            threshold += settings[key]
+            if roll < threshold:
+                outcome = name
+                break
+
+        time.sleep(max(latency, 0) / 1000)
+
+        if outcome == 'hang':
+            time.sleep(settings['hang_ms'] / 1000)
+            self._count('hangs')
+        if outcome == 'http_error':
+            payload = 'Service Unavailable'
+            self._count('http_errors', payload)
+            return 503, payload
+
+        try:
+            destination, weight_kg = parse_quote_request(body)
+        except (ET.ParseError, AttributeError, ValueError):
+            payload = render_error('Invalid request')
+            self._count('bad_requests', payload)
+            return 400, payload
+
+        if outcome == 'api_error':
+            payload = render_error('Rating service is temporarily unavailable for this lane')
+            self._count('api_errors', payload)
+            return 200, payload
+
+        payload = render_rates(destination, weight_kg, settings['extra_services'])
+        if outcome == 'malformed':
+            payload = payload[:len(payload) // 2]
+            self._count('malformed', payload)
+            return 200, payload
+
+        self._count('ok', payload)
+        return 200, payload
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Canada Post getnrates stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='healthy')
+    parser.add_argument('--latency-ms', type=float)
+    parser.add_argument('--jitter-ms', type=float)
+    parser.add_argument('--http-error-rate', type=float)
+    parser.add_argument('--api-error-rate', type=float)
+    parser.add_argument('--malformed-rate', type=float)
+    parser.add_argument('--hang-rate', type=float)
+    parser.add_argument('--extra-services', type=int)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    stub = CanadaPostStub(
+        args.host, args.port, args.profile, seed=args.seed,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        http_error_rate=args.http_error_rate, api_error_rate=args.api_error_rate,
+        malformed_rate=args.malformed_rate, hang_rate=args.hang_rate,
+        extra_services=args.extra_services,
+    )
+    print(f"Canada Post stub listening on {stub.url} (profile: {args.profile})")
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""
+Load test: the whole checkout funnel against local Square and Canada Post stubs.
+
+Runs the app on a fixed pool of worker threads (like a gunicorn gthread
+worker) with Square pointed at benchmarks/square_stub.py through
+SQUARE_BASE_URL and Canada Post at benchmarks/canada_post_stub.py. Each
+synthetic shopper loops add-to-cart -> shipping quote -> process-payment
+with a fresh cart. Reports funnel throughput, per-step latency percentiles
+and SQLite lock contention (slow writes and commits, "database is locked"
+errors).
+
+Usage:
+    python benchmarks/load_checkout.py [--shoppers 16] [--workers 8] [--duration 10]
+        [--square-latency-ms 150] [--error-rate 0] [--decline-rate 0] [--card-declines 0.05]
+        [--shipping-backend live|table] [--outbox-worker]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from sqlalchemy import event
+
+from canada_post_stub import CanadaPostStub
+from load_shipping import PooledWSGIServer, percentile
+from square_stub import SquareStub
+
+STEPS = ('add_to_cart', 'shipping', 'payment')
+FSAS = ['K1A', 'M5V', 'H2X', 'V6B', 'T2P', 'R3C', 'S4P', 'E1C', 'B3H', 'A1C', 'N9J', 'L4C']
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class LockMonitor:
+    """Times SQLite write statements and commits on an engine; counts 'database is locked' errors."""
+
+    def __init__(self, engine, slow_ms=10.0):
+        self.slow_ms = slow_ms
+        self.lock = threading.Lock()
+        self.reset()
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+        event.listen(engine, 'handle_error', self._error)
+
+        # SQLAlchemy has no "after commit" connection event, so time the dialect's commit call
+        dialect = engine.dialect
+        do_commit = dialect.do_commit
+
+        def timed_commit(dbapi_connection):
+            started = time.perf_counter()
+            try:
+                do_commit(dbapi_connection)
+            finally:
+                self._record('commit', (time.perf_counter() - started) * 1000)
+        dialect.do_commit = timed_commit
+
+    def reset(self):
+        with self.lock:
+            self.times = {'write': [], 'commit': []}
+            self.locked_errors = 0
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_started'] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() in WRITES:
+            self._record('write', (time.perf_counter() - conn.info.pop('query_started')) * 1000)
+
+    def _error(self, context):
+        if 'database is locked' in str(context.original_exception):
+            with self.lock:
+                self.locked_errors += 1
+
+    def _record(self, kind, elapsed_ms):
+        with self.lock:
+            self.times[kind].append(elapsed_ms)
+
+    def summary(self):
+        with self.lock:
+            result = {'locked_errors': self.locked_errors}
+            for kind, values in self.times.items():
+                values = sorted(values)
+                result[kind] = {
+                    'count': len(values),
+                    'slow': sum(1 for v in values if v >= self.slow_ms),
+                    'p95_ms': percentile(values, 95),
+                    'max_ms': values[-1] if values else 0.0,
+                    'total_ms': sum(values),
+                }
+            return result
+
+
+def setup_app(args, square_url):
+    """Create the app on a throwaway database with a few shippable items, using the Square stub."""
+    db_path = os.path.join(tempfile.mkdtemp(), 'load_checkout.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['SQUARE_BASE_URL'] = square_url
+    os.environ['SQUARE_ACCESS_TOKEN'] = 'stub'
+    os.environ['SQUARE_MAX_CONNECTIONS'] = str(args.workers)
+
+    from app import create_app, db
+    from app.models import Category, Service
+
+    app = create_app()
+    app.config['SHIPPING_RATE_BACKEND'] = args.shipping_backend
+    if args.shipping_backend == 'table' and not app.config.get('SHIPPING_RATE_TABLE_PATH'):
+        # No table is configured by default; the bundled sample is fine for load testing
+        from app.rate_table import init_rate_table
+        app.config['SHIPPING_RATE_TABLE_PATH'] = os.path.join(ROOT, 'instance', 'rate_table.json')
+        init_rate_table(app)
+    with app.app_context():
+        category = Category(name='Load Test', slug='load-test')
+        db.session.add(category)
+        db.session.flush()
+        services = [
+            Service(name=f'Parcel Item {i}', slug=f'parcel-item-{i}', description='Load test item',
+                    price_base=10.0 + 5 * i, weight_kg=0.5 + i, category_id=category.id)
+            for i in range(5)
+        ]
+        db.session.add_all(services)
+        db.session.commit()
+        return app, [service.id for service in services]
+
+
+def shop_once(base_url, service_ids, declines):
+    """One shopper visit with a new cart. Returns (outcome, {step: [seconds, ...]})."""
+    session = requests.Session()
+    timings = {}
+
+    def step(name, path, payload):
+        started = time.perf_counter()
+        response = session.post(f'{base_url}{path}', json=payload, timeout=60)
+        timings.setdefault(name, []).append(time.perf_counter() - started)
+        return response
+
+    cart_total = 0
+    for service_id in random.sample(service_ids, random.randint(1, 3)):
+        response = step('add_to_cart', '/services/add-to-cart', {'service_id': service_id, 'quantity': random.randint(1, 5)})
+        if response.status_code != 200:
+            return f'add_to_cart_{response.status_code}', timings
+        cart_total = response.json()['cart_total']
+
+    postal_code = f'{random.choice(FSAS)} {random.randint(1, 9)}A{random.randint(1, 9)}'
+    response = step('shipping', '/services/api/shipping-rates', {'destination_postal_code': postal_code})
+    body = response.json() if response.status_code == 200 else {}
+    if not body.get('success') or not body.get('options'):
+        return f'shipping_{response.status_code}', timings
+    option = min(body['options'], key=lambda o: o['price'])
+
+    response = step('payment', '/services/process-payment', {
+        'amount': int(round((cart_total + option['price']) * 100)),
+        'nonce': 'cnon:card-declined' if random.random() < declines else 'cnon:card-nonce-ok',
+        'customer_name': 'Load Shopper',
+        'customer_email': 'shopper@example.com',
+        'customer_address': '1 Test St',
+        'customer_city': 'Ottawa',
+        'customer_state': 'ON',
+        'customer_zip': postal_code,
+        'shipping_method': option['service_code'],
+        'shipping_service_name': option['service_name'],
+        'shipping_cost': option['price'],
+    })
+    if response.status_code == 200 and response.json().get('success'):
+        return 'ordered', timings
+    return f'payment_{response.status_code}', timings
+
+
+def run(args, base_url, service_ids, monitor, square):
+    outcomes, step_times, visits = {}, {name: [] for name in STEPS}, []
+    results_lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def shopper(_):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                outcome, timings = shop_once(base_url, service_ids, args.card_declines)
+            except requests.RequestException as e:
+                outcome, timings = f'conn_error:{type(e).__name__}', {}
+            with results_lock:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                visits.append(time.perf_counter() - started)
+                for name, seconds in timings.items():
+                    step_times[name].extend(seconds)
+
+    monitor.reset()
+    square.reset_stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.shoppers) as pool:
+        list(pool.map(shopper, range(args.shoppers)))
+    elapsed = time.perf_counter() - started
+    return outcomes, step_times, sorted(visits), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shoppers', type=int, default=16, help='concurrent synthetic shoppers')
+    parser.add_argument('--workers', type=int, default=8, help='app worker threads')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to run')
+    parser.add_argument('--square-latency-ms', type=float, default=150)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of Square requests failing with a 500')
+    parser.add_argument('--decline-rate', type=float, default=0.0, help='share of Square payments declined')
+    parser.add_argument('--card-declines', type=float, default=0.05, help='share of shoppers using a declined test card')
+    parser.add_argument('--shipping-backend', choices=('live', 'table'), default='live')
+    parser.add_argument('--outbox-worker', action='store_true', help='drain the outbox alongside the shoppers')
+    args = parser.parse_args()
+
+    random.seed(42)
+    logging.getLogger('app.payment').setLevel(logging.CRITICAL)  # injected Square failures are expected
+
+    with SquareStub(latency_ms=args.square_latency_ms, jitter_ms=args.square_latency_ms / 3,
+                    error_rate=args.error_rate, decline_rate=args.decline_rate, seed=42) as square, \
+            CanadaPostStub(seed=42) as canada_post:
+        app, service_ids = setup_app(args, square.url)
+
+        from app import db
+        from app.outbox import run_worker
+        from app.shipping import CanadaPostShippingService
+
+        CanadaPostShippingService.API_ENDPOINT = canada_post.url
+        CanadaPostShippingService.USERNAME = 'stub'
+        CanadaPostShippingService.PASSWORD = 'stub'
+
+        with app.app_context():
+            monitor = LockMonitor(db.engine)
+
+        stop_worker = threading.Event()
+        if args.outbox_worker:
+            def outbox():
+                with app.app_context():
+                    run_worker('load-checkout', stop_worker, poll_interval=0.2)
+            threading.Thread(target=outbox, daemon=True).start()
+
+        server = PooledWSGIServer('127.0.0.1', 0, app, args.workers)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+        print(f"{args.shoppers} shoppers -> {args.workers} app workers for {args.duration:g}s; "
+              f"Square {args.square_latency_ms:g} ms, shipping backend {args.shipping_backend}, "
+              f"outbox worker {'on' if args.outbox_worker else 'off'}\n")
+        outcomes, step_times, visits, elapsed = run(args, base_url, service_ids, monitor, square)
+        stop_worker.set()
+        server.shutdown()
+        server.pool.shutdown(wait=False, cancel_futures=True)
+
+        ordered = outcomes.get('ordered', 0)
+        print(f"visits {len(visits)}  orders {ordered}  ({ordered / elapsed:.1f} orders/s, "
+              f"{len(visits) / elapsed:.1f} visits/s)")
+        print("outcomes: " + ', '.join(f'{name} {count}' for name, count in sorted(outcomes.items())) + '\n')
+
+        header = f"{'step':<12} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+        print(header)
+        print('-' * len(header))
+        for name, values in list(step_times.items()) + [('visit', visits)]:
+            values = sorted(values)
+            print(f"{name:<12} {len(values):>6} {percentile(values, 50) * 1000:>8.0f} {percentile(values, 95) * 1000:>8.0f} "
+                  f"{percentile(values, 99) * 1000:>8.0f} {(values[-1] if values else 0) * 1000:>8.0f}")
+
+        locks = monitor.summary()
+        print(f"\nSQLite: {locks['locked_errors']} 'database is locked' errors")
+        for kind in ('write', 'commit'):
+            stats = locks[kind]
+            print(f"  {kind + 's':<8} {stats['count']:>6}  >= {monitor.slow_ms:g} ms: {stats['slow']:>5}  "
+                  f"p95 {stats['p95_ms']:.1f} ms  max {stats['max_ms']:.0f} ms  total {stats['total_ms'] / 1000:.2f} s")
+        square_stats = square.stats()
+        print(f"\nSquare stub: {square_stats['payments']} payments, {square_stats['declines']} declines, "
+              f"{square_stats['errors']} injected errors, {square_stats['replays']} idempotent replays, "
+              f"max in flight {square_stats['max_in_flight']}")
+        print("\nSlow writes/commits mostly wait on SQLite's single writer lock; total is time spent in them.")
+
+
+if __name__ == '__main__':
+    main()
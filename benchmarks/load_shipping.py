@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+Load test: concurrent checkout shipping lookups against the Canada Post stub.
+
+Runs the app on a fixed pool of worker threads (like a gunicorn gthread
+worker) with Canada Post pointed at benchmarks/canada_post_stub.py, drives
+/services/api/shipping-rates from concurrent shoppers under each fault
+profile and reports latency percentiles and worker saturation.
+
+Usage:
+    python benchmarks/load_shipping.py [--profiles healthy,slow,flaky] [--workers 8]
+        [--shoppers 32] [--duration 10] [--read-timeout 2] [--no-cache]
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from canada_post_stub import CanadaPostStub, PROFILES
+
+FSAS = ['K1A', 'M5V', 'H2X', 'V6B', 'T2P', 'R3C', 'S4P', 'E1C', 'B3H', 'A1C', 'N9J', 'L4C']
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class WorkerGauge:
+    """WSGI middleware counting requests queued for, and running on, the worker pool."""
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.queued = 0
+
+    def __call__(self, environ, start_response):
+        with self.lock:
+            self.queued -= 1
+            self.busy += 1
+        try:
+            return self.app(environ, start_response)
+        finally:
+            with self.lock:
+                self.busy -= 1
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Single-process server handing connections to a fixed number of worker threads."""
+
+    def __init__(self, host, port, app, workers):
+        self.gauge = WorkerGauge(app)
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wsgi-worker')
+        super().__init__(host, port, self.gauge, handler=QuietRequestHandler)
+
+    def process_request(self, request, client_address):
+        with self.gauge.lock:
+            self.gauge.queued += 1
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def setup_app(args):
+    """Create the app on a throwaway database with one shippable item."""
+    db_path = os.path.join(tempfile.mkdtemp(), 'load_shipping.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    from app import create_app, db
+    from app.models import Category, Service
+
+    app = create_app()
+    app.config['SHIPPING_RATE_PREFETCH'] = False
+    if args.no_cache:
+        app.extensions['rate_cache'].max_entries = 0
+    with app.app_context():
+        category = Category(name='Load Test', slug='load-test')
+        db.session.add(category)
+        db.session.flush()
+        service = Service(name='Parcel Item', slug='parcel-item', description='Load test item',
+                          price_base=25.0, weight_kg=2.5, category_id=category.id)
+        db.session.add(service)
+        db.session.commit()
+        return app, service.id
+
+
+def make_shoppers(base_url, service_id, count):
+    """One HTTP session per shopper, each with its own cart (1-3 parcels)."""
+    sessions = []
+    for _ in range(count):
+        session = requests.Session()
+        response = session.post(f'{base_url}/services/add-to-cart',
+                                json={'service_id': service_id, 'quantity': random.randint(1, 30)})
+        response.raise_for_status()
+        sessions.append(session)
+    return sessions
+
+
+def run_profile(profile, stub, server, shoppers, base_url, args):
+    from app.shipping import CanadaPostShippingService
+
+    stub.set_profile(profile)
+    stub.reset_stats()
+    CanadaPostShippingService.reset_session()
+    server.gauge.app.extensions['rate_cache'].clear()
+
+    latencies, statuses, fallbacks, failures = [], {}, [0], [0]
+    results_lock = threading.Lock()
+    samples = []
+    stop = threading.Event()
+    deadline = time.perf_counter() + args.duration
+
+    def shopper(session):
+        while time.perf_counter() < deadline:
+            postal_code = f'{random.choice(FSAS)} {random.randint(1, 9)}A{random.randint(1, 9)}'
+            started = time.perf_counter()
+            try:
+                response = session.post(f'{base_url}/services/api/shipping-rates',
+                                        json={'destination_postal_code': postal_code, 'domestic_only': True},
+                                        timeout=60)
+                status = response.status_code
+                body = response.json() if status == 200 else {}
+                degraded, failed = bool(body.get('is_fallback')), status == 200 and not body.get('success')
+            except requests.RequestException:
+                status, degraded, failed = 'conn_error', False, False
+            elapsed = time.perf_counter() - started
+            with results_lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                fallbacks[0] += degraded
+                failures[0] += failed
+
+    def sampler():
+        while not stop.is_set():
+            with server.gauge.lock:
+                samples.append((server.gauge.busy, max(server.gauge.queued, 0)))
+            time.sleep(0.01)
+
+    sampler_thread = threading.Thread(target=sampler, daemon=True)
+    sampler_thread.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(shoppers)) as pool:
+        list(pool.map(shopper, shoppers))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    sampler_thread.join()
+
+    latencies.sort()
+    busy = [s[0] for s in samples] or [0]
+    return {
+        'profile': profile,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'max': (latencies[-1] if latencies else 0) * 1000,
+        'errors': sum(count for status, count in statuses.items() if status != 200),
+        'fallbacks': fallbacks[0],
+        'failed': failures[0],
+        'utilization': sum(busy) / len(busy) / server.workers * 100,
+        'saturated': sum(1 for b in busy if b >= server.workers) / len(busy) * 100,
+        'max_queue': max(s[1] for s in samples) if samples else 0,
+        'upstream': stub.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profiles', default='healthy,slow,flaky,hanging,large,outage')
+    parser.add_argument('--workers', type=int, default=8, help='app worker threads')
+    parser.add_argument('--shoppers', type=int, default=32, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per profile')
+    parser.add_argument('--read-timeout', type=float, default=2, help='Canada Post read timeout')
+    parser.add_argument('--no-cache', action='store_true', help='send every lookup upstream')
+    args = parser.parse_args()
+
+    profiles = [p.strip() for p in args.profiles.split(',') if p.strip()]
+    unknown = [p for p in profiles if p not in PROFILES]
+    if unknown:
+        parser.error(f"unknown profile(s): {', '.join(unknown)} (choose from {', '.join(sorted(PROFILES))})")
+
+    random.seed(42)
+    logging.getLogger('app.shipping').setLevel(logging.ERROR)  # upstream failures are expected here
+    app, service_id = setup_app(args)
+
+    from app.shipping import CanadaPostShippingService
+
+    with CanadaPostStub(seed=42) as stub:
+        CanadaPostShippingService.API_ENDPOINT = stub.url
+        CanadaPostShippingService.USERNAME = 'stub'
+        CanadaPostShippingService.PASSWORD = 'stub'
+        CanadaPostShippingService.READ_TIMEOUT = args.read_timeout
+
+        server = PooledWSGIServer('127.0.0.1', 0, app, args.workers)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        shoppers = make_shoppers(base_url, service_id, args.shoppers)
+
+        print(f"{args.shoppers} shoppers -> {args.workers} app workers, {args.duration:g}s per profile, "
+              f"read timeout {args.read_timeout:g}s, cache {'off' if args.no_cache else 'on'}\n")
+        header = (f"{'profile':<10} {'reqs':>6} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                  f"{'max ms':>8} {'errors':>6} {'failed':>6} {'fallbk':>6} {'util %':>6} {'sat %':>6} {'queue':>5} {'upstream':>8}")
+        print(header)
+        print('-' * len(header))
+        for profile in profiles:
+            CanadaPostShippingService.breaker.reset()
+            r = run_profile(profile, stub, server, shoppers, base_url, args)
+            print(f"{r['profile']:<10} {r['requests']:>6} {r['rps']:>7.1f} {r['p50']:>8.0f} {r['p95']:>8.0f} "
+                  f"{r['p99']:>8.0f} {r['max']:>8.0f} {r['errors']:>6} {r['failed']:>6} {r['fallbacks']:>6} "
+                  f"{r['utilization']:>6.0f} {r['saturated']:>6.0f} {r['max_queue']:>5} {r['upstream']['requests']:>8}")
+
+        server.shutdown()
+        server.pool.shutdown(wait=False, cancel_futures=True)
+
+    print("\nutil % = mean busy workers / workers; sat % = share of samples with every worker busy;"
+          "\nqueue = most connections waiting for a worker; errors = non-200 responses;"
+          "\nfailed = 200 without rates (upstream API errors); fallbk = responses served from estimates")
+
+
+if __name__ == '__main__':
+    main()
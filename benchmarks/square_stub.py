@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Square Payments and Refunds APIs.
+
+Implements the endpoints the app uses (create/get payment, refund payment)
+with in-memory state, Square-style idempotency and error bodies, plus
+configurable latency, failure injection and a server-side rate limit, so
+payment code can be tested and benchmarked offline.
+
+Usage:
+    python benchmarks/square_stub.py [--port 8090] [--latency-ms 80] [--error-rate 0]
+        [--decline-rate 0] [--rate-limit 0]
+    SQUARE_BASE_URL=http://127.0.0.1:8090 SQUARE_ACCESS_TOKEN=stub python run_debug.py
+
+Card nonces: any source_id is approved except 'cnon:card-declined' (CARD_DECLINED);
+--decline-rate declines a share of the rest.
+
+Settings can be changed at runtime:
+    curl -X POST http://127.0.0.1:8090/_config -d '{"latency_ms": 500, "error_rate": 0.1}'
+    curl http://127.0.0.1:8090/_stats
+"""
+
+import argparse
+import itertools
+import json
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAYMENT_PATH = re.compile(r'^/v2/payments/([^/?]+)')
+
+
+class SquareStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}') if length else {}
+
+    def _handle(self, route, *args):
+        stub = self.server.stub
+        outcome = stub.admit()
+        if outcome is not None:
+            return self._send(*outcome)
+        try:
+            self._send(*route(*args))
+        finally:
+            stub.release()
+
+    def do_POST(self):
+        stub = self.server.stub
+        if self.path.startswith('/v2/payments'):
+            body = self._read_json()
+            return self._handle(stub.create_payment, body)
+        if self.path.startswith('/v2/refunds'):
+            body = self._read_json()
+            return self._handle(stub.refund_payment, body)
+        if self.path.startswith('/_config'):
+            try:
+                return self._send(200, stub.configure(**self._read_json()))
+            except (TypeError, ValueError) as e:
+                return self._send(400, stub.error('BAD_REQUEST', 'INVALID_REQUEST_ERROR', str(e)))
+        self._send(404, stub.error('NOT_FOUND', 'INVALID_REQUEST_ERROR', 'Unknown endpoint'))
+
+    def do_GET(self):
+        stub = self.server.stub
+        match = PAYMENT_PATH.match(self.path)
+        if match:
+            return self._handle(stub.get_payment, match.group(1))
+        if self.path.startswith('/_stats'):
+            return self._send(200, stub.stats())
+        self._send(404, stub.error('NOT_FOUND', 'INVALID_REQUEST_ERROR', 'Unknown endpoint'))
+
+    def log_message(self, *args):
+        pass
+
+
+class SquareStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionError, TimeoutError)):
+            super().handle_error(request, client_address)
+
+
+class SquareStub:
+    """In-memory Square API; use as a context manager or call start()/stop()."""
+
+    SETTINGS = ('latency_ms', 'jitter_ms', 'error_rate', 'decline_rate', 'rate_limit')
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 rate_limit=0.0, seed=None, decline_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate  # share of requests answered with a 500
+        self.decline_rate = decline_rate  # share of payments declined (CARD_DECLINED)
+        self.rate_limit = rate_limit  # requests per second; 0 = unlimited (429 beyond it)
+        self.random = random.Random(seed)
+        self.payments = {}
+        self.refunds = {}
+        self._idempotent = {}  # (endpoint, idempotency key) -> (status, response)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._window = []
+        self.reset_stats()
+        self.httpd = SquareStubServer((host, port), SquareStubHandler)
+        self.httpd.stub = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    # --------------------------------------------------------------- helpers
+
+    @staticmethod
+    def error(code, category, detail):
+        return {'errors': [{'category': category, 'code': code, 'detail': detail}]}
+
+    def configure(self, **settings):
+        """Change latency / failure settings; returns the current settings."""
+        unknown = set(settings) - set(self.SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown setting(s): {', '.join(sorted(unknown))}")
+        with self._lock:
+            for name, value in settings.items():
+                setattr(self, name, float(value))
+            return {name: getattr(self, name) for name in self.SETTINGS}
+
+    def reset_stats(self):
+        in_flight = getattr(self, '_counters', {}).get('in_flight', 0)
+        self._counters = {'requests': 0, 'payments': 0, 'declines': 0, 'refunds': 0, 'gets': 0,
+                          'replays': 0, 'errors': 0, 'throttled': 0, 'in_flight': in_flight, 'max_in_flight': in_flight}
+
+    def _new_id(self, prefix):
+        return f'{prefix}{next(self._ids):06d}{self.random.getrandbits(32):08X}'
+
+    def admit(self):
+        """Apply rate limit, latency and injected errors. Returns (status, body[, headers]) to reject."""
+        with self._lock:
+            self._counters['requests'] += 1
+            now = time.monotonic()
+            if self.rate_limit:
+                self._window = [t for t in self._window if now - t < 1.0]
+                if len(self._window) >= self.rate_limit:
+                    self._counters['throttled'] += 1
+                    return 429, self.error('RATE_LIMITED', 'RATE_LIMIT_ERROR', 'Too many requests'), {'Retry-After': '1'}
+                self._window.append(now)
+            failed = self.random.random() < self.error_rate
+            delay = max(0.0, self.latency_ms + self.random.uniform(-1, 1) * self.jitter_ms) / 1000
+            self._counters['in_flight'] += 1
+            self._counters['max_in_flight'] = max(self._counters['max_in_flight'], self._counters['in_flight'])
+        time.sleep(delay)
+        if failed:
+            self.release()
+            with self._lock:
+                self._counters['errors'] += 1
+            return 500, self.error('INTERNAL_SERVER_ERROR', 'API_ERROR', 'Injected failure')
+        return None
+
+    def release(self):
+        with self._lock:
+            self._counters['in_flight'] -= 1
+
+    def _replay(self, endpoint, key, build):
+        """Square idempotency: the same key returns the original response."""
+        with self._lock:
+            recorded = self._idempotent.get((endpoint, key))
+            if recorded is not None:
+                self._counters['replays'] += 1
+                return recorded
+            result = build()
+            if key:
+                self._idempotent[(endpoint, key)] = result
+            return result
+
+    def add_payment(self, amount, status='COMPLETED', currency='USD', refunded=0):
+        """Seed a payment (e.g. for orders created outside the stub). Returns its id."""
+        with self._lock:
+            payment_id = self._new_id('PAY')
+            self.payments[payment_id] = self._payment(payment_id, amount, currency, status, refunded)
+            return payment_id
+
+    @staticmethod
+    def _payment(payment_id, amount, currency, status, refunded=0):
+        now = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        payment = {
+            'id': payment_id,
+            'status': status,
+            'amount_money': {'amount': amount, 'currency': currency},
+            'total_money': {'amount': amount, 'currency': currency},
+            'receipt_url': f'https://squareup.com/receipt/preview/{payment_id}',
+            'created_at': now,
+            'updated_at': now,
+            'refund_ids': [],
+        }
+        if refunded:
+            payment['refunded_money'] = {'amount': refunded, 'currency': currency}
+        return payment
+
+    # ------------------------------------------------------------- endpoints
+
+    def create_payment(self, body):
+        def build():
+            money = body.get('amount_money') or {}
+            if not body.get('source_id') or not money.get('amount'):
+                return 400, self.error('BAD_REQUEST', 'INVALID_REQUEST_ERROR', 'source_id and amount_money are required')
+            if body['source_id'] == 'cnon:card-declined' or self.random.random() < self.decline_rate:
+                self._counters['declines'] += 1
+                return 400, self.error('CARD_DECLINED', 'PAYMENT_METHOD_ERROR', 'Card declined.')
+            payment_id = self._new_id('PAY')
+            payment = self._payment(payment_id, money['amount'], money.get('currency', 'USD'), 'COMPLETED')
+            self.payments[payment_id] = payment
+            self._counters['payments'] += 1
+            return 200, {'payment': payment}
+        return self._replay('payments', body.get('idempotency_key'), build)
+
+    def get_payment(self, payment_id):
+        with self._lock:
+            self._counters['gets'] += 1
+            payment = self.payments.get(payment_id)
+            if payment is None:
+                return 404, self.error('NOT_FOUND', 'INVALID_REQUEST_ERROR', f'Could not find payment with id: {payment_id}')
+            return 200, {'payment': dict(payment)}
+
+    def refund_payment(self, body):
+        def build():
+            payment = self.payments.get(body.get('payment_id'))
+            money = body.get('amount_money') or {}
+            if payment is None:
+                return 404, self.error('NOT_FOUND', 'INVALID_REQUEST_ERROR', 'Payment not found')
+            refunded = (payment.get('refunded_money') or {}).get('amount', 0)
+            if payment['status'] != 'COMPLETED' or refunded + money.get('amount', 0) > payment['amount_money']['amount']:
+                return 400, self.error('REFUND_AMOUNT_INVALID', 'INVALID_REQUEST_ERROR', 'Refund exceeds the available amount')
+            refund_id = self._new_id('REF')
+            refund = {
+                'id': refund_id,
+                'status': 'PENDING',
+                'amount_money': money,
+                'payment_id': payment['id'],
+                'created_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            }
+            self.refunds[refund_id] = refund
+            payment['refunded_money'] = {'amount': refunded + money['amount'], 'currency': money.get('currency', 'USD')}
+            payment['refund_ids'] = payment.get('refund_ids', []) + [refund_id]
+            self._counters['refunds'] += 1
+            return 200, {'refund': refund}
+        return self._replay('refunds', body.get('idempotency_key'), build)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+    # --------------------------------------------------------------- serving
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Square API stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=float, default=80)
+    parser.add_argument('--jitter-ms', type=float, default=30)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a 500')
+    parser.add_argument('--decline-rate', type=float, default=0.0, help='share of payments declined')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='requests per second (0 = unlimited)')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    stub = SquareStub(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate,
+                     args.rate_limit, args.seed, args.decline_rate)
+    print(f"Square stub listening on {stub.url}")
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
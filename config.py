@@ -11,12 +11,63 @@ class Config:
     # Database
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_RECORD_QUERIES = True
+    # Startup schema check: 'version' compares a stored fingerprint of the models and
+    # upgrades only when it differs; 'full' runs create_all and reflects every table on each boot
+    SCHEMA_CHECK = os.environ.get('SCHEMA_CHECK', 'version')
+    # SQLite PRAGMAs applied on connect: 'default' (SQLite's own) or 'production' (WAL etc., see app/db_profile.py)
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'default')
+    SQLITE_PRAGMAS = {}  # Per-PRAGMA overrides of the profile, e.g. {'busy_timeout': 10000}
+    
+    # Query profiler over the recorded queries (see app/query_profiler.py and /admin/queries)
+    QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', 100))  # log statements slower than this
+    QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5))  # same statement this often in one request = N+1
+    QUERY_PROFILE_WINDOW = int(os.environ.get('QUERY_PROFILE_WINDOW', 900))  # seconds of per-endpoint stats kept
+    
+    # Prometheus metrics at /metrics (see app/metrics.py; workers share them via PROMETHEUS_MULTIPROC_DIR)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # if set, scrapes must send "Authorization: Bearer <token>"
     
     # Square Payment
     SQUARE_APPLICATION_ID = os.environ.get('SQUARE_APPLICATION_ID')
     SQUARE_ACCESS_TOKEN = os.environ.get('SQUARE_ACCESS_TOKEN')
     SQUARE_ENVIRONMENT = os.environ.get('SQUARE_ENVIRONMENT', 'production')
     SQUARE_LOCATION_ID = os.environ.get('SQUARE_LOCATION_ID', '')
+    SQUARE_BASE_URL = os.environ.get('SQUARE_BASE_URL')  # e.g. benchmarks/square_stub.py for offline testing
+    SQUARE_TIMEOUT = float(os.environ.get('SQUARE_TIMEOUT', 15))  # seconds per request
+    SQUARE_CONNECT_TIMEOUT = float(os.environ.get('SQUARE_CONNECT_TIMEOUT', 5))
+    SQUARE_MAX_CONNECTIONS = int(os.environ.get('SQUARE_MAX_CONNECTIONS', 10))  # pooled connections per worker
+    # Pending payment attempts older than this (seconds) are taken over by the next submit
+    PAYMENT_ATTEMPT_STALE_AFTER = float(os.environ.get('PAYMENT_ATTEMPT_STALE_AFTER', 30))
+    # A duplicate submit during a payment is answered 409 with this Retry-After (seconds)
+    PAYMENT_ATTEMPT_RETRY_AFTER = int(os.environ.get('PAYMENT_ATTEMPT_RETRY_AFTER', 2))
+    # Admin batch refunds/reconciliation: concurrent Square calls and requests per second
+    SQUARE_BATCH_WORKERS = int(os.environ.get('SQUARE_BATCH_WORKERS', 8))
+    SQUARE_BATCH_RATE = float(os.environ.get('SQUARE_BATCH_RATE', 10))
+    
+    # Outbox worker (post-payment work, see outbox_worker.py)
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 1.0))  # seconds between polls when idle
+    OUTBOX_BATCH_SIZE = 20
+    OUTBOX_MAX_ATTEMPTS = 8  # then the event is marked failed
+    OUTBOX_LEASE_SECONDS = 300  # an event whose handler runs longer than this is retried by another worker
+    
+    # Shipping rate quote cache
+    SHIPPING_RATE_CACHE_TTL = int(os.environ.get('SHIPPING_RATE_CACHE_TTL', 900))  # seconds
+    SHIPPING_RATE_CACHE_SIZE = int(os.environ.get('SHIPPING_RATE_CACHE_SIZE', 2048))  # entries per worker
+    SHIPPING_RATE_CACHE_PATH = os.environ.get('SHIPPING_RATE_CACHE_PATH')  # SQLite file shared by workers (optional)
+    SHIPPING_RATE_WEIGHT_BUCKET_KG = float(os.environ.get('SHIPPING_RATE_WEIGHT_BUCKET_KG', 0.25))
+    SHIPPING_RATE_CACHE_FSA_FALLBACK = True  # Reuse a quote for the same forward sortation area
+    
+    # Shipping rate backend: 'live' (Canada Post API) or 'table' (offline rate table)
+    SHIPPING_RATE_BACKEND = os.environ.get('SHIPPING_RATE_BACKEND', 'live')
+    # Contract rate table (JSON); unset = no table. instance/rate_table.json is only a sample format
+    SHIPPING_RATE_TABLE_PATH = os.environ.get('SHIPPING_RATE_TABLE_PATH') or None
+    # Seconds to wait for the live API before answering with a rate-table estimate (unset = wait)
+    SHIPPING_RATE_ESTIMATE_AFTER = float(os.environ['SHIPPING_RATE_ESTIMATE_AFTER']) if os.environ.get('SHIPPING_RATE_ESTIMATE_AFTER') else None
+    
+    # Background quote prefetch for known destinations (add to cart, checkout render)
+    SHIPPING_RATE_PREFETCH = os.environ.get('SHIPPING_RATE_PREFETCH', '1') != '0'
+    SHIPPING_RATE_PREFETCH_WORKERS = int(os.environ.get('SHIPPING_RATE_PREFETCH_WORKERS', 4))
+    SHIPPING_RATE_PREFETCH_MAX_PENDING = 64  # queued prefetches per worker
 
 class DevelopmentConfig(Config):
     """Development configuration."""
@@ -30,3 +81,11 @@ class ProductionConfig(Config):
     TESTING = False
     SESSION_COOKIE_SECURE = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///ecommerce.db')
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'production')
+    # Connections stay open in the pool, so the profile's PRAGMAs (and SQLite's page cache)
+    # are set up once per connection; a sync worker needs one, background threads a few more
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': 10,  # seconds to wait for a free connection
+    }
@@ -0,0 +1,150 @@
+"""
+Shared pytest fixtures.
+
+`app` is built on a fresh SQLite database in the test's tmp_path, with its
+app context pushed for the duration of the test. Settings can be overridden
+per test with @pytest.mark.app_settings(NAME=value). Requesting `square_stub`
+points the app's Square client at a local stand-in (benchmarks/square_stub.py);
+`canada_post_stub` does the same for the Canada Post client.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.models import Category, Order, OrderItem
+from app.shipping import CanadaPostShippingService
+from benchmarks.canada_post_stub import CanadaPostStub
+from benchmarks.square_stub import SquareStub
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'app_settings(**settings): configuration overrides for the app fixture')
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app on its own fresh database (or database_uri): make_app(**settings). Cleaned up after the test."""
+    built = []
+
+    def make(database_uri=None, **settings):
+        database_uri = database_uri or f'sqlite:///{tmp_path / f"app{len(built)}.db"}'
+        app = create_app(database_uri=database_uri, **settings)
+        context = app.app_context()
+        context.push()
+        built.append((app, context))
+        return app
+
+    yield make
+    for app, context in reversed(built):
+        processor, _ = app.extensions['square_processor']
+        processor.close()
+        db.session.remove()
+        db.engine.dispose()
+        context.pop()
+
+
+@pytest.fixture
+def app(make_app, request):
+    """The app on a fresh database (its app context is pushed)."""
+    settings = {}
+    marker = request.node.get_closest_marker('app_settings')
+    if marker:
+        settings.update(marker.kwargs)
+    if 'square_stub' in request.fixturenames:
+        stub = request.getfixturevalue('square_stub')
+        settings.update(SQUARE_ACCESS_TOKEN='stub-token', SQUARE_MAX_CONNECTIONS=16, SQUARE_BASE_URL=stub.url)
+    return make_app(**settings)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(app):
+    """A test client logged in to the admin panel."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    return client
+
+
+@pytest.fixture
+def catalog(app):
+    """Two categories: Props and its sub-category Weapons. Returns Props."""
+    props = Category(name='Props', slug='props')
+    db.session.add(props)
+    db.session.flush()
+    db.session.add(Category(name='Weapons', slug='weapons', parent_id=props.id))
+    db.session.commit()
+    return props
+
+
+@pytest.fixture
+def orders(app):
+    """120 orders with two items each, placed two per hour from 2026-05-04 00:00. Returns their count."""
+    count, start = 120, datetime(2026, 5, 4)
+    statuses = [('completed', 'paid'), ('processing', 'paid'), ('cancelled', 'refunded')]
+    db.session.execute(insert(Order), [{
+        'id': i,
+        'order_number': f'ORD-{i:08X}',
+        'customer_email': f'customer{i % 10}@example.com',
+        'customer_name': f'Customer {i}',
+        'subtotal': 20.0,
+        'total_amount': 25.0,
+        'status': statuses[i % 3][0],
+        'payment_status': statuses[i % 3][1],
+        # Pairs of orders share a timestamp, so id has to break ties
+        'created_at': start + timedelta(hours=i // 2),
+    } for i in range(1, count + 1)])
+    db.session.execute(insert(OrderItem), [
+        {'order_id': i, 'service_id': 1, 'service_name': f'Item {n}', 'quantity': n, 'unit_price': 10.0}
+        for i in range(1, count + 1) for n in (1, 2)
+    ])
+    db.session.commit()
+    return count
+
+
+@pytest.fixture
+def square_stub():
+    """A local Square API stand-in; the `app` fixture points the Square client at it."""
+    with SquareStub() as stub:
+        yield stub
+
+
+@pytest.fixture
+def canada_post_client():
+    """point_at(url, **overrides): aim the Canada Post client at a local server, with fast timeouts and no backoff."""
+    original = {}
+
+    def point_at(url, **overrides):
+        settings = {
+            'API_ENDPOINT': url,
+            'USERNAME': 'user',
+            'PASSWORD': 'pass',
+            'RETRY_BACKOFF': 0,
+            'MAX_RETRIES': 2,
+            'READ_TIMEOUT': 2,
+            **overrides,
+        }
+        for name, value in settings.items():
+            original.setdefault(name, getattr(CanadaPostShippingService, name))
+            setattr(CanadaPostShippingService, name, value)
+        CanadaPostShippingService.reset_session()
+
+    yield point_at
+    for name, value in original.items():
+        setattr(CanadaPostShippingService, name, value)
+    CanadaPostShippingService.reset_session()
+
+
+@pytest.fixture
+def canada_post_stub(canada_post_client):
+    """benchmarks/canada_post_stub.py with no added latency, and the Canada Post client pointed at it."""
+    with CanadaPostStub(profile='healthy', seed=1, latency_ms=0, jitter_ms=0) as stub:
+        canada_post_client(stub.url)
+        yield stub
@@ -0,0 +1,52 @@
+"""
+Gunicorn configuration (read automatically from the working directory).
+
+The app is preloaded: the master imports the code and runs the startup schema
+check once, then forks the workers, which share the imported modules
+copy-on-write instead of each importing and booting on its own. Set
+GUNICORN_PRELOAD=0 to boot each worker separately (e.g. to reload code with
+HUP).
+"""
+
+import os
+import shutil
+import tempfile
+
+# Workers share request metrics through files in this directory (see app/metrics.py).
+# Set before the app (and prometheus_client) is imported.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'propsworks-metrics'))
+os.makedirs(metrics_dir, exist_ok=True)
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+worker_class = 'sync'
+# A sync worker busy with one request longer than this is killed. Batch refunds and
+# reconciliation stream for about (orders / SQUARE_BATCH_RATE) seconds on one request.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+accesslog = '-'
+errorlog = '-'
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+
+def on_starting(server):
+    """Start each run with empty metrics: drop the files left by earlier runs' workers."""
+    for name in os.listdir(metrics_dir):
+        path = os.path.join(metrics_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    """Stop counting a dead worker's in-flight requests."""
+    from app.metrics import mark_worker_dead
+    mark_worker_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    """Drop database connections a preloaded app may have inherited from the master."""
+    if preload_app:
+        from app import reset_after_fork
+        from wsgi import app
+        reset_after_fork(app)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Create or update catalog items in bulk from a CSV, JSON or NDJSON file (for
+example an edited catalog export). Items are matched by slug; categories are
+given by slug or id.
+
+Usage:
+    python import_catalog.py items.csv [--dry-run] [--skip-invalid]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the project directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.catalog_import import import_catalog, read_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import catalog items')
+    parser.add_argument('path', help='CSV, JSON or NDJSON file')
+    parser.add_argument('--dry-run', action='store_true', help='Validate only; write nothing')
+    parser.add_argument('--skip-invalid', action='store_true', help='Import valid rows even if some rows fail')
+    args = parser.parse_args()
+
+    fmt = args.path.rsplit('.', 1)[-1].lower()
+    with open(args.path, encoding='utf-8-sig', newline='') as f:
+        rows = read_rows(f.read(), fmt)
+
+    app = create_app()
+
+    with app.app_context():
+        print("Importing {} row(s) from {}...".format(len(rows), args.path))
+        started = time.perf_counter()
+        report = import_catalog(rows, dry_run=args.dry_run, skip_invalid=args.skip_invalid)
+
+        for error in report['errors']:
+            print("  [!] Row {} ({}): {}".format(error['row'], error['slug'] or '-', '; '.join(error['errors'])))
+        verb = 'Would create' if args.dry_run else 'Created'
+        print("  [+] {} {} item(s), {} {} item(s), {} invalid row(s) in {:.1f}s".format(
+            verb, report['created'], 'would update' if args.dry_run else 'updated', report['updated'],
+            report['failed'], time.perf_counter() - started))
+
+        if not report['success']:
+            print("\n[FAILED] Nothing was imported; fix the rows above or use --skip-invalid")
+            sys.exit(1)
+
+        print("\n" + "="*50)
+        print("[SUCCESS] Catalog import {}!".format('validated' if args.dry_run else 'completed'))
+        print("="*50)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Migration script to build the service_variants index table and the min_price
+column from the existing Service.variants JSON data.
+"""
+
+import os
+import sys
+
+# Add the project directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app, db
+from app.models import Service
+from app.catalog import sync_variant_index
+
+
+def migrate_variants():
+    """Populate service_variants and min_price for every item."""
+    app = create_app()
+
+    with app.app_context():
+        print("Starting variant index migration...")
+
+        indexed = 0
+        skipped = []
+        for service in Service.query.order_by(Service.id).all():
+            try:
+                with db.session.begin_nested():
+                    sync_variant_index(service)
+                indexed += 1
+            except ValueError as e:
+                skipped.append((service, str(e)))
+
+        db.session.commit()
+
+        print("  [+] Indexed variants for {} item(s)".format(indexed))
+        for service, error in skipped:
+            print("  [!] Skipped {} (ID: {}): {}".format(service.name, service.id, error))
+
+        print("\n" + "="*50)
+        print("[SUCCESS] Variant index migration completed!")
+        print("="*50)
+
+
+if __name__ == '__main__':
+    migrate_variants()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Outbox worker: runs post-payment work queued by checkout (see app/outbox.py).
+
+Run one or more alongside the web workers:
+    python outbox_worker.py              # poll until stopped (SIGTERM/SIGINT)
+    python outbox_worker.py --once       # drain due events and exit (e.g. from cron)
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+
+# Add the project directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.outbox import drain, run_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drain the transactional outbox')
+    parser.add_argument('--once', action='store_true', help='process due events, then exit')
+    parser.add_argument('--batch-size', type=int, help='events claimed per query')
+    parser.add_argument('--poll-interval', type=float, help='seconds to sleep when the outbox is empty')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    app = create_app(os.environ.get('FLASK_ENV', 'production'))
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+
+    with app.app_context():
+        if args.once:
+            processed, failed = drain(worker_id, args.batch_size)
+            print(f"Processed {processed} event(s), {failed} failed")
+            return
+
+        stop_event = threading.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: stop_event.set())
+        run_worker(worker_id, stop_event, args.poll_interval, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
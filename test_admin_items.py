@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""Tests for the paginated, projected admin items API"""
+
+import sys
+sys.path.insert(0, '.')
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.catalog_import import import_catalog
+from app.models import Category
+
+
+def add_items(count=120):
+    rows = [{
+        'name': f'{"Sword" if i % 4 == 0 else "Prop"} {i}', 'category': 'props',
+        'sub_category': 'weapons' if i % 4 == 0 else '', 'price_base': i,
+        'media_gallery': [{'type': 'photo', 'url': f'/static/uploads/{i}.jpg'}],
+        'variants': [{'name': 'S', 'sku': f'V{i}-S', 'price': i}, {'name': 'L', 'sku': f'V{i}-L', 'price': i + 5}],
+    } for i in range(count)]
+    assert import_catalog(rows)['success']
+
+
+def test_pages_cover_every_item_once(catalog, admin_client):
+    add_items()
+    seen, cursor = [], None
+    while True:
+        data = admin_client.get('/admin/api/items', query_string={'limit': 50, **({'cursor': cursor} if cursor else {})}).get_json()
+        seen.extend(item['id'] for item in data['items'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    assert seen == list(range(1, 121)), seen[:5]
+
+
+def test_default_projection_and_one_query_per_page(catalog, admin_client):
+    add_items()
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    data = admin_client.get('/admin/api/items?limit=20').get_json()
+    assert len(statements) == 1, statements
+
+    item = data['items'][0]
+    assert (item['category_name'], item['sub_category_name']) == ('Props', 'Weapons')
+    assert (item['media_count'], item['tier_count'], item['variant_count']) == (1, 0, 2)
+    assert 'variants' not in item and 'media_gallery' not in item and 'long_description' not in item
+
+    data = admin_client.get('/admin/api/items?fields=name,variants&limit=5').get_json()
+    assert set(data['items'][0]) == {'id', 'name', 'variants'}
+    assert data['items'][0]['variants'][1]['sku'] == 'V0-L'
+
+
+def test_filters_and_errors(catalog, admin_client):
+    add_items()
+    weapons = Category.query.filter_by(slug='weapons').one()
+
+    def names(**args):
+        response = admin_client.get('/admin/api/items', query_string=dict(args, fields='name', limit=200))
+        assert response.status_code == 200, response.get_json()
+        return [item['name'] for item in response.get_json()['items']]
+
+    assert names(q='sword') == [f'Sword {i}' for i in range(0, 120, 4)]
+    assert names(category_id=weapons.id, q='sword 1') == ['Sword 12', 'Sword 16'] + [f'Sword {i}' for i in range(100, 120, 4)]
+    assert names(q='nothing like this') == []
+
+    assert admin_client.get('/admin/api/items?fields=name,secret').status_code == 400
+    assert admin_client.get('/admin/api/items?cursor=abc').status_code == 400
+    assert admin_client.get('/admin/items').status_code == 200
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
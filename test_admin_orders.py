@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Tests for the admin order list (keyset pagination, filters, lookups) and order detail"""
+
+import sys
+sys.path.insert(0, '.')
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.orders import list_orders
+
+
+def test_keyset_pages_cover_every_order_once_in_order(orders, admin_client):
+    seen, cursor = [], None
+    while True:
+        data = admin_client.get('/admin/api/orders', query_string={'limit': 25, **({'cursor': cursor} if cursor else {})}).get_json()
+        seen.extend(order['id'] for order in data['orders'])
+        assert all(len(order['items']) == 2 for order in data['orders'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+    assert seen == list(range(120, 0, -1)), seen[:10]
+
+
+def test_page_loads_orders_and_items_in_two_queries(orders):
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    orders, cursor = list_orders({}, None, 50)
+    [order.to_dict(include_items=True) for order in orders]
+    orders, _ = list_orders({}, cursor, 50)
+    [order.to_dict(include_items=True) for order in orders]
+    assert len(statements) == 4, statements
+
+
+def test_filters_and_lookups(orders, admin_client):
+    def ids(**args):
+        response = admin_client.get('/admin/api/orders', query_string=args)
+        assert response.status_code == 200, response.get_json()
+        return [order['id'] for order in response.get_json()['orders']]
+
+    assert ids(status='cancelled', limit=200) == [i for i in range(120, 0, -1) if i % 3 == 2]
+    assert ids(payment_status='paid', start_date='2026-05-05', end_date='2026-05-05') == \
+        [i for i in range(95, 47, -1) if i % 3 != 2]
+    assert ids(order_number='ORD-0000002A') == [42]
+    assert ids(customer_email='customer7@example.com', status='processing') == [i for i in range(120, 0, -1) if i % 10 == 7 and i % 3 == 1]
+
+    assert admin_client.get('/admin/api/orders?status=lost').status_code == 400
+    assert admin_client.get('/admin/api/orders?cursor=not-a-cursor').status_code == 400
+    assert admin_client.get('/admin/api/orders?start_date=05/04/2026').status_code == 400
+
+
+def test_order_detail(orders, admin_client):
+    order = admin_client.get('/admin/api/orders/42').get_json()
+    assert order['order_number'] == 'ORD-0000002A'
+    assert [item['line_total'] for item in order['items']] == [10.0, 20.0]
+    assert admin_client.get('/admin/api/orders/9999').status_code == 404
+    page = admin_client.get('/admin/orders/42')
+    assert page.status_code == 200 and b'ORD-0000002A' in page.data
+    assert admin_client.get('/admin/orders').status_code == 200
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""Tests for the variant SKU index, min_price and the SKU lookup API"""
+
+import sys
+sys.path.insert(0, '.')
+
+import pytest
+
+from app import db
+from app.catalog import compute_min_price
+from app.models import Category, Service, ServiceVariant
+
+
+def create(client, name, **fields):
+    props = Category.query.filter_by(slug='props').one()
+    return client.post('/admin/api/items', json={'name': name, 'category_id': props.id, 'description': name, **fields})
+
+
+def test_min_price():
+    assert compute_min_price(20.0, []) == 20.0
+    assert compute_min_price(20.0, [{'name': 'S', 'price': 15}, {'name': 'L', 'price': 30}]) == 15.0
+    # Unavailable and quote-only variants are not purchasable prices
+    assert compute_min_price(20.0, [{'name': 'S', 'price': 5, 'is_available': False}, {'name': 'C', 'price': None}]) == 20.0
+    assert compute_min_price(None, [{'name': 'S', 'price': '12.5'}]) == 12.5
+    assert compute_min_price(None, [{'name': 'C', 'price': None}]) is None
+    assert compute_min_price(None, None) is None
+
+
+def test_sku_lookup(catalog, admin_client):
+    response = create(admin_client, 'Sword', price_base=35, variants=[
+        {'name': 'Red', 'sku': 'SW-R', 'price': 32},
+        {'name': 'Gold', 'sku': ' SW-G ', 'price': 20, 'is_available': False},
+    ])
+    assert response.status_code == 201, response.get_json()
+    item_id = response.get_json()['item_id']
+    assert db.session.get(Service, item_id).min_price == 32.0
+
+    variant = admin_client.get('/services/api/variants/SW-R').get_json()['variant']
+    assert (variant['service_id'], variant['name'], variant['price'], variant['service_slug']) == (item_id, 'Red', 32.0, 'sword')
+    # SKUs are stored trimmed; unavailable variants are still found, flagged as such
+    assert admin_client.get('/services/api/variants/SW-G').get_json()['variant']['is_available'] is False
+    assert admin_client.get('/services/api/variants/NOPE').status_code == 404
+
+    # Variants of inactive items are hidden
+    admin_client.put(f'/admin/api/items/{item_id}', json={'is_active': False})
+    assert admin_client.get('/services/api/variants/SW-R').status_code == 404
+
+
+def test_duplicate_skus_are_rejected(catalog, admin_client):
+    item_id = create(admin_client, 'Sword', price_base=35, variants=[{'name': 'Red', 'sku': 'SW-R', 'price': 32}]).get_json()['item_id']
+
+    response = create(admin_client, 'Shield', price_base=50, variants=[{'name': 'Red', 'sku': 'SW-R', 'price': 45}])
+    assert response.status_code == 400 and 'SW-R' in response.get_json()['error']
+    assert Service.query.filter_by(slug='shield').first() is None
+
+    response = create(admin_client, 'Shield', price_base=50, variants=[{'name': 'A', 'sku': 'SH'}, {'name': 'B', 'sku': 'SH'}])
+    assert response.status_code == 400 and 'unique' in response.get_json()['error']
+
+    shield_id = create(admin_client, 'Shield', price_base=50, variants=[{'name': 'Round', 'sku': 'SH-R', 'price': 45}]).get_json()['item_id']
+    response = admin_client.put(f'/admin/api/items/{shield_id}', json={'variants': [{'name': 'Red', 'sku': 'SW-R', 'price': 40}]})
+    assert response.status_code == 400 and 'already used' in response.get_json()['error']
+    assert [v.sku for v in ServiceVariant.query.filter_by(service_id=shield_id)] == ['SH-R']
+
+    # Re-saving an item's own SKUs is fine; the index and min_price follow the edit
+    response = admin_client.put(f'/admin/api/items/{item_id}', json={'price_base': 40, 'variants': [
+        {'name': 'Red', 'sku': 'SW-R', 'price': 38}, {'name': 'Custom', 'sku': 'SW-C', 'price': None}
+    ]})
+    assert response.status_code == 200, response.get_json()
+    assert sorted(v.sku for v in ServiceVariant.query.filter_by(service_id=item_id)) == ['SW-C', 'SW-R']
+    assert db.session.get(Service, item_id).min_price == 38.0
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
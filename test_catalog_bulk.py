@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""Tests for set-based bulk item operations (prices, flags, category moves, dry runs)"""
+
+import sys
+sys.path.insert(0, '.')
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.catalog_import import import_catalog
+from app.models import Cart, CartItem, Category, Service, ServiceVariant
+from app.pricing import pricing_engine
+
+
+def add_items():
+    rows = [
+        {'name': 'Foam Sword', 'category': 'props', 'sub_category': 'weapons', 'price_base': 40,
+         'bulk_pricing': [{'min_quantity': 10, 'price': 30}],
+         'variants': [{'name': 'Red', 'sku': 'SW-R', 'price': 36}, {'name': 'Gold', 'sku': 'SW-G', 'price': 50}]},
+        {'name': 'Shield', 'category': 'props', 'sub_category': 'weapons', 'price_base': 25},
+        {'name': 'Quote Statue', 'category': 'props', 'price_base': None},
+        {'name': 'Mask', 'category': 'props', 'price_base': 10, 'is_active': False},
+    ]
+    assert import_catalog(rows)['success']
+    return {service.slug: service for service in Service.query}
+
+
+def test_percent_price_change_moves_tiers_variants_and_carts(catalog, admin_client):
+    items = add_items()
+    sword = items['foam-sword']
+    pricing_engine.compile(sword)
+    cart = Cart(session_id='cart-1', items=[CartItem(service_id=sword.id, quantity=1, price_at_time=40.0)])
+    db.session.add(cart)
+    db.session.commit()
+    weapons = Category.query.filter_by(slug='weapons').one()
+
+    body = {'filter': {'category_id': weapons.id}, 'price': {'percent': -10}}
+    preview = admin_client.post('/admin/api/items/bulk', json=dict(body, dry_run=True)).get_json()
+    assert (preview['matched'], preview['repriced_items'], preview['dry_run']) == (2, 2, True), preview
+    assert db.session.get(Service, sword.id).price_base == 40
+
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    report = admin_client.post('/admin/api/items/bulk', json=body).get_json()
+    assert report['success'] and report['updated'] == 2 and report['carts_repriced'] == 1, report
+
+    db.session.expire_all()
+    sword = db.session.get(Service, sword.id)
+    assert (sword.price_base, sword.min_price, sword.pricing_revision) == (36.0, 32.4, 1)
+    assert sword.bulk_pricing == [{'min_quantity': 10, 'price': 27.0}]
+    assert [v['price'] for v in sword.variants] == [32.4, 45.0]
+    assert [v.price for v in ServiceVariant.query.filter_by(service_id=sword.id).order_by(ServiceVariant.position)] == [32.4, 45.0]
+    assert db.session.get(Service, items['shield'].id).price_base == 22.5
+    assert db.session.get(Service, items['mask'].id).price_base == 10, 'outside the filter'
+    assert pricing_engine.compile(sword).base_price == 36.0
+    assert db.session.get(Cart, cart.id).items[0].price_at_time == 36.0
+
+    # Set-based: a fixed number of UPDATEs, not one per item
+    updates = [s for s in statements if s.lstrip().upper().startswith('UPDATE SERVICE')]
+    assert len(updates) == 4, updates
+
+
+def test_absolute_change_flags_and_category_move(catalog, admin_client):
+    items = add_items()
+    ids = [items['shield'].id, items['quote-statue'].id, items['mask'].id]
+
+    report = admin_client.post('/admin/api/items/bulk', json={'ids': ids, 'price': {'amount': -12}}).get_json()
+    assert report['repriced_items'] == 2, report
+    db.session.expire_all()
+    assert [db.session.get(Service, i).price_base for i in ids] == [13.0, None, 0.0]
+
+    # Tiers without a price of their own are left as they are
+    shield = db.session.get(Service, items['shield'].id)
+    shield.bulk_pricing = [{'min_quantity': 5, 'discount_percent': 10}, {'min_quantity': 20, 'price': 10}]
+    db.session.commit()
+    admin_client.post('/admin/api/items/bulk', json={'ids': ids[:1], 'price': {'amount': 2}})
+    db.session.expire_all()
+    assert db.session.get(Service, shield.id).bulk_pricing == [
+        {'min_quantity': 5, 'discount_percent': 10}, {'min_quantity': 20, 'price': 12.0}]
+
+    report = admin_client.post('/admin/api/items/bulk', json={'ids': ids, 'set': {'is_active': True}, 'dry_run': True}).get_json()
+    assert (report['matched'], report['changed']) == (3, 1), report
+
+    extras = Category(name='Extras', slug='extras')
+    db.session.add(extras)
+    db.session.commit()
+    report = admin_client.post('/admin/api/items/bulk', json={
+        'filter': {'is_active': False}, 'set': {'is_active': True, 'is_featured': True, 'category_id': extras.id,
+                                                'sub_category_id': None}
+    }).get_json()
+    assert report['updated'] == 1, report
+    mask = db.session.get(Service, items['mask'].id)
+    db.session.refresh(mask)
+    assert mask.is_active and mask.is_featured and mask.category_id == extras.id
+
+    assert admin_client.post('/admin/api/items/bulk', json={'filter': {'q': 'sword'}, 'set': {'is_featured': True}}).get_json()['updated'] == 1
+
+
+def test_bulk_validation(catalog, admin_client):
+    add_items()
+
+    def error(body):
+        response = admin_client.post('/admin/api/items/bulk', json=body)
+        assert response.status_code == 400, response.get_json()
+        return response.get_json()['error']
+
+    assert 'ids or a filter' in error({'set': {'is_active': True}})
+    assert 'Nothing to change' in error({'ids': [1]})
+    assert 'Cannot bulk-set' in error({'ids': [1], 'set': {'price_base': 1}})
+    assert 'not found' in error({'ids': [1], 'set': {'category_id': 999}})
+    assert 'percent' in error({'ids': [1], 'price': {'percent': -100}})
+    assert 'price must be' in error({'ids': [1], 'price': {'percent': 5, 'amount': 1}})
+    assert 'Unknown filter' in error({'filter': {'color': 'red'}, 'set': {'is_active': True}})
+    assert 'true or false' in error({'ids': [1], 'set': {'is_active': 'yes'}})
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
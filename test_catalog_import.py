@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""Tests for the bulk catalog import (CSV/JSON, validation report, batched writes, export round trip)"""
+
+import sys
+sys.path.insert(0, '.')
+
+import io
+import json
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.models import Cart, CartItem, Service, ServiceVariant
+
+CSV_ITEMS = '''name,category,sub_category,description,price_base,bulk_pricing,variants,is_active
+Foam Sword,props,weapons,Light foam sword,35,"[{""min_quantity"": 10, ""price"": 30}]","[{""name"": ""Red"", ""sku"": ""SW-R"", ""price"": 32}]",true
+Latex Mask,props,,Painted mask,,[],[],yes
+Helmet,props,,Helmet,120,,"[{""name"": ""L"", ""sku"": ""HL-L"", ""price"": 110}, {""name"": ""XL"", ""sku"": ""HL-XL"", ""price"": 125}]",0
+'''
+
+
+def upload(client, text, filename='items.csv', **args):
+    return client.post('/admin/api/items/import', query_string=args,
+                       data={'file': (io.BytesIO(text.encode()), filename)}, content_type='multipart/form-data')
+
+
+def test_csv_import_creates_items_and_variant_index(catalog, admin_client):
+    response = upload(admin_client, CSV_ITEMS)
+    report = response.get_json()
+    assert response.status_code == 200, report
+    assert (report['created'], report['updated'], report['failed']) == (3, 0, 0)
+
+    sword = Service.query.filter_by(slug='foam-sword').one()
+    assert sword.category_obj.slug == 'props' and sword.sub_category_obj.slug == 'weapons'
+    assert sword.bulk_pricing == [{'min_quantity': 10, 'price': 30}] and sword.get_price_for_quantity(10) == 30
+    assert sword.min_price == 32
+    mask = Service.query.filter_by(slug='latex-mask').one()
+    assert mask.price_base is None and mask.is_active and mask.min_price is None
+    helmet = Service.query.filter_by(slug='helmet').one()
+    assert not helmet.is_active and helmet.min_price == 110
+    assert [v.sku for v in ServiceVariant.query.filter_by(service_id=helmet.id).order_by(ServiceVariant.position)] == ['HL-L', 'HL-XL']
+
+
+def test_update_via_export_round_trip(catalog, admin_client):
+    upload(admin_client, CSV_ITEMS)
+    sword = Service.query.filter_by(slug='foam-sword').one()
+    revision = sword.pricing_revision or 0
+    cart = Cart(session_id='cart-1')
+    cart.items.append(CartItem(service_id=sword.id, quantity=2, price_at_time=35.0))
+    db.session.add(cart)
+    db.session.commit()
+
+    exported = admin_client.get('/admin/api/export/catalog.ndjson').get_data(as_text=True)
+    records = [json.loads(line) for line in exported.splitlines()]
+    for record in records:
+        if record['slug'] == 'foam-sword':
+            record['price_base'] = 29.0
+            record['variants'] = [{'name': 'Blue', 'sku': 'SW-B', 'price': 31}]
+    response = upload(admin_client, '\n'.join(json.dumps(record) for record in records), filename='catalog.ndjson')
+    report = response.get_json()
+    assert (report['created'], report['updated'], report['carts_repriced']) == (0, 3, 1), report
+
+    db.session.expire_all()
+    sword = db.session.get(Service, sword.id)
+    assert sword.price_base == 29.0 and sword.min_price == 29.0 and sword.pricing_revision == revision + 1
+    assert [v.sku for v in ServiceVariant.query.filter_by(service_id=sword.id)] == ['SW-B']
+    assert Service.query.count() == 3
+    cart = db.session.get(Cart, cart.id)
+    assert cart.items[0].price_at_time == 29.0 and cart.cached_total == 58.0 and cart.prices_changed
+
+    # A partial JSON update only touches the given fields
+    response = admin_client.post('/admin/api/items/import', json=[{'slug': 'helmet', 'is_featured': True}])
+    assert response.get_json()['updated'] == 1
+    helmet = Service.query.filter_by(slug='helmet').one()
+    assert helmet.is_featured and helmet.price_base == 120 and helmet.description == 'Helmet'
+
+
+def test_validation_report_and_skip_invalid(catalog, admin_client):
+    upload(admin_client, CSV_ITEMS)
+    rows = [
+        {'name': 'Shield', 'category': 'props', 'price_base': 50},
+        {'name': 'Cape', 'category': 'capes'},
+        {'name': 'Bow', 'category': 'props', 'price_base': 'cheap'},
+        {'name': 'Shield', 'category': 'props'},
+        {'name': 'Axe', 'category': 'props', 'variants': [{'name': 'Big', 'sku': 'HL-L'}]},
+        {'description': 'no name'},
+        {'name': 'Spear', 'category': 'props', 'bulk_pricing': [{'min_quantity': 5}]},
+    ]
+    response = admin_client.post('/admin/api/items/import', json={'items': rows})
+    report = response.get_json()
+    assert response.status_code == 400 and not report['success']
+    assert [(error['row'], error['slug']) for error in report['errors']] == [
+        (2, 'cape'), (3, 'bow'), (4, 'shield'), (5, 'axe'), (6, None), (7, 'spear')
+    ], report['errors']
+    assert 'Unknown category: capes' in report['errors'][0]['errors']
+    assert 'already used by another item' in report['errors'][3]['errors'][0]
+    assert Service.query.count() == 3, 'nothing is written when a row is invalid'
+
+    assert admin_client.post('/admin/api/items/import?dry_run=1', json=rows[:1]).get_json()['created'] == 1
+    assert Service.query.count() == 3
+
+    report = admin_client.post('/admin/api/items/import?skip_invalid=1', json=rows).get_json()
+    assert report['success'] and (report['created'], report['failed']) == (1, 6), report
+    assert Service.query.filter_by(slug='shield').one().price_base == 50
+
+    assert upload(admin_client, 'not json', filename='items.json').status_code == 400
+    response = upload(admin_client, '{"name": "Shield"}\n[1, 2]\n', filename='items.ndjson')
+    assert response.status_code == 400 and 'Each NDJSON line must be an object' in response.get_json()['error']
+    assert upload(admin_client, 'a,b', filename='items.xlsx').status_code == 400
+
+
+def test_import_writes_in_batches(catalog, admin_client):
+    rows = [{'name': f'Item {i}', 'category': 'props', 'price_base': i,
+             'variants': [{'name': 'Default', 'sku': f'SKU-{i}', 'price': i}]} for i in range(1, 1001)]
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    report = admin_client.post('/admin/api/items/import', json=rows).get_json()
+    assert report['created'] == 1000 and ServiceVariant.query.count() == 1000
+    writes = [s for s in statements if not s.lstrip().upper().startswith('SELECT')]
+    assert len(writes) <= 5, len(writes)
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Tests for the category closure table (subtrees, breadcrumbs, moves, cycle checks, backfill)"""
+
+import sys
+sys.path.insert(0, '.')
+
+import pytest
+from sqlalchemy import event, select
+
+from app import db
+from app.catalog_import import import_catalog
+from app.category_tree import breadcrumbs, descendants, ensure_category_paths, is_in_subtree
+from app.models import Category, CategoryPath
+
+
+def add_tree(client):
+    """props > weapons > swords > sabers, plus a separate costumes root."""
+    ids = {category.slug: category.id for category in Category.query}
+    for name, parent in (('Swords', 'weapons'), ('Sabers', 'swords'), ('Costumes', None)):
+        response = client.post('/admin/api/categories', json={'name': name, 'parent_id': ids.get(parent)})
+        assert response.status_code == 201, response.get_json()
+        ids[response.get_json()['category']['slug']] = response.get_json()['category']['id']
+    return ids
+
+
+def paths():
+    return set(db.session.execute(
+        select(CategoryPath.ancestor_id, CategoryPath.descendant_id, CategoryPath.depth)
+    ).all())
+
+
+def test_subtree_and_breadcrumbs_at_any_depth(catalog, admin_client):
+    ids = add_tree(admin_client)
+    assert [c.slug for c in breadcrumbs(ids['sabers'])] == ['props', 'weapons', 'swords', 'sabers']
+    assert [c.slug for c in descendants(ids['props'])] == ['weapons', 'swords', 'sabers']
+    assert is_in_subtree(ids['sabers'], ids['props']) and not is_in_subtree(ids['props'], ids['sabers'])
+
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    tree = admin_client.get(f"/admin/api/categories/{ids['swords']}/tree").get_json()
+    assert [c['slug'] for c in tree['breadcrumbs']] == ['props', 'weapons', 'swords']
+    assert [c['slug'] for c in tree['descendants']] == ['sabers']
+    assert len(statements) == 3, statements  # category, breadcrumbs, descendants
+
+    # Items filed deep in the tree show up under every ancestor
+    assert import_catalog([
+        {'name': 'Cutlass', 'category': 'props', 'sub_category': 'sabers', 'price_base': 20},
+        {'name': 'Cape', 'category': 'costumes', 'price_base': 15},
+    ])['success']
+    names = lambda **args: [i['name'] for i in admin_client.get('/admin/api/items', query_string=dict(args, fields='name')).get_json()['items']]
+    assert names(category_id=ids['weapons']) == ['Cutlass']
+    assert names(category_id=ids['costumes']) == ['Cape']
+    page = admin_client.get('/services/?category=props&subcategory=swords').get_data(as_text=True)
+    assert 'Cutlass' in page and 'Cape' not in page
+
+
+def test_moves_relink_the_whole_subtree_and_cycles_are_rejected(catalog, admin_client):
+    ids = add_tree(admin_client)
+    response = admin_client.put(f"/admin/api/categories/{ids['swords']}", json={'parent_id': ids['costumes']})
+    assert response.status_code == 200, response.get_json()
+    assert [c.slug for c in breadcrumbs(ids['sabers'])] == ['costumes', 'swords', 'sabers']
+    assert [c.slug for c in descendants(ids['props'])] == ['weapons']
+
+    for parent in ('sabers', 'swords'):
+        response = admin_client.put(f"/admin/api/categories/{ids['swords']}", json={'parent_id': ids[parent]})
+        assert response.status_code == 400, response.get_json()
+    assert admin_client.put(f"/admin/api/categories/{ids['swords']}", json={'parent_id': 999}).status_code == 400
+
+    # Direct ORM changes are guarded as well
+    db.session.get(Category, ids['costumes']).parent_id = ids['sabers']
+    try:
+        db.session.commit()
+        assert False, 'cycle was committed'
+    except ValueError:
+        db.session.rollback()
+
+    assert admin_client.put(f"/admin/api/categories/{ids['swords']}", json={'parent_id': None}).status_code == 200
+    assert [c.slug for c in breadcrumbs(ids['sabers'])] == ['swords', 'sabers']
+    assert admin_client.delete(f"/admin/api/categories/{ids['sabers']}").status_code == 200
+    assert not [p for p in paths() if ids['sabers'] in p[:2]]
+
+
+def test_backfill_matches_maintained_paths(catalog, admin_client):
+    add_tree(admin_client)
+    maintained = paths()
+    db.session.query(CategoryPath).delete()
+    db.session.commit()
+    assert ensure_category_paths() == len(maintained) == 11
+    assert paths() == maintained
+    assert ensure_category_paths() == 0
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""Tests for the SQLite connection profile (PRAGMAs applied on connect)"""
+
+import sys
+sys.path.insert(0, '.')
+
+import pytest
+from sqlalchemy import text
+
+from app import db
+from app.db_profile import sqlite_pragmas
+
+
+def pragmas(app):
+    """PRAGMA values seen by a new connection of the app."""
+    with app.app_context():
+        return {
+            name: db.session.execute(text(f'PRAGMA {name}')).scalar()
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size', 'temp_store')
+        }
+
+
+@pytest.mark.app_settings(SQLITE_PROFILE='production')
+def test_production_profile_is_applied_on_connect(app):
+    values = pragmas(app)
+    assert values == {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000,
+                      'mmap_size': 256 * 1024 * 1024, 'cache_size': -64000, 'temp_store': 2}, values
+
+
+def test_default_profile_and_overrides(make_app):
+    values = pragmas(make_app(SQLITE_PROFILE='default'))
+    assert (values['journal_mode'], values['synchronous']) == ('delete', 2), values
+
+    values = pragmas(make_app(SQLITE_PROFILE='production', SQLITE_PRAGMAS={'busy_timeout': 250}))
+    assert (values['journal_mode'], values['busy_timeout']) == ('wal', 250), values
+
+    with pytest.raises(ValueError, match='turbo'):
+        sqlite_pragmas({'SQLITE_PROFILE': 'turbo'})
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""Tests for the streaming admin exports (orders, catalog, categories; CSV, NDJSON, gzip)"""
+
+import sys
+sys.path.insert(0, '.')
+
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from app import db
+from app.models import Category, Service
+
+
+def add_catalog():
+    parent = Category(name='Props', slug='props')
+    db.session.add(parent)
+    db.session.flush()
+    child = Category(name='Masks', slug='masks', parent_id=parent.id)
+    db.session.add(child)
+    db.session.flush()
+    db.session.add(Service(
+        name='Mask', slug='mask', description='A mask, "painted"', price_base=20.0, category_id=parent.id,
+        sub_category_id=child.id, bulk_pricing=[{'min_qty': 10, 'price': 18.0}],
+        variants=[{'name': 'Red', 'sku': 'MASK-R', 'price': 22.0}]
+    ))
+    db.session.commit()
+
+
+def test_orders_csv_and_ndjson(orders, admin_client):
+    response = admin_client.get('/admin/api/export/orders.csv')
+    assert response.status_code == 200 and response.mimetype == 'text/csv'
+    assert 'attachment; filename="orders-' in response.headers['Content-Disposition']
+    assert response.is_streamed
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == 240 and [row['order_id'] for row in rows[:4]] == ['1', '1', '2', '2']
+    assert rows[0]['item_service_name'] == 'Item 1' and rows[1]['item_quantity'] == '2'
+
+    lines = admin_client.get('/admin/api/export/orders.ndjson?status=cancelled').get_data(as_text=True).splitlines()
+    orders = [json.loads(line) for line in lines]
+    assert [order['id'] for order in orders] == [i for i in range(1, 121) if i % 3 == 2]
+    assert all(len(order['items']) == 2 for order in orders)
+
+    assert admin_client.get('/admin/api/export/orders.csv?status=lost').status_code == 400
+    assert admin_client.get('/admin/api/export/users.csv').status_code == 404
+    assert admin_client.get('/admin/api/export/orders.xml').status_code == 404
+
+
+def test_gzip_negotiation_and_download(orders, admin_client):
+    plain = admin_client.get('/admin/api/export/orders.ndjson').data
+    encoded = admin_client.get('/admin/api/export/orders.ndjson', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert encoded.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(encoded.data) == plain and len(encoded.data) < len(plain) / 4
+
+    download = admin_client.get('/admin/api/export/orders.csv?gzip=1')
+    assert download.mimetype == 'application/gzip' and 'Content-Encoding' not in download.headers
+    assert download.headers['Content-Disposition'].endswith('.csv.gz"')
+    assert gzip.decompress(download.data).decode().startswith('order_id,order_number')
+
+
+def test_catalog_and_categories(admin_client):
+    add_catalog()
+    rows = list(csv.DictReader(io.StringIO(admin_client.get('/admin/api/export/catalog.csv').get_data(as_text=True))))
+    assert len(rows) == 1
+    row = rows[0]
+    assert (row['category'], row['sub_category'], row['description']) == ('props', 'masks', 'A mask, "painted"')
+    assert json.loads(row['variants'])[0]['sku'] == 'MASK-R'
+    assert json.loads(row['bulk_pricing']) == [{'min_qty': 10, 'price': 18.0}]
+
+    record = json.loads(admin_client.get('/admin/api/export/catalog.ndjson').data)
+    assert record['variants'][0]['price'] == 22.0 and record['bulk_pricing'][0]['min_qty'] == 10
+
+    categories = [json.loads(line) for line in admin_client.get('/admin/api/export/categories.ndjson').data.splitlines()]
+    assert [(c['slug'], c['parent']) for c in categories] == [('props', None), ('masks', 'props')]
+
+
+def test_export_requires_login(client):
+    response = client.get('/admin/api/export/orders.csv')
+    assert response.status_code == 302, response.status_code
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
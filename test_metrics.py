@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Tests for the Prometheus /metrics endpoint (request, SQL and upstream metrics; multiprocess aggregation)"""
+
+import sys
+sys.path.insert(0, '.')
+
+import os
+import subprocess
+
+import pytest
+from prometheus_client.parser import text_string_to_metric_families
+
+from app.metrics import observe_upstream
+
+# Run in separate processes sharing one PROMETHEUS_MULTIPROC_DIR, like gunicorn workers
+WORKER = '''
+import os, sys
+sys.path.insert(0, '.')
+from app import create_app
+client = create_app(database_uri=os.environ['TEST_DATABASE_URI']).test_client()
+if sys.argv[1] == 'scrape':
+    sys.stdout.write(client.get('/metrics').get_data(as_text=True))
+else:
+    for _ in range(int(sys.argv[1])):
+        assert client.get('/health').status_code == 200
+'''
+
+
+def samples(text):
+    """{(name, frozenset(labels)): value} from Prometheus text output."""
+    return {
+        (sample.name, frozenset(sample.labels.items())): sample.value
+        for family in text_string_to_metric_families(text) for sample in family.samples
+    }
+
+
+def test_request_db_and_upstream_metrics(app, catalog, admin_client):
+    before = samples(admin_client.get('/metrics').get_data(as_text=True))
+    for _ in range(3):
+        assert admin_client.get('/admin/api/items').status_code == 200
+    assert admin_client.get('/no-such-page').status_code == 404
+    observe_upstream('square', 'create_payment', 0.2, True)
+
+    response = admin_client.get('/metrics')
+    assert response.status_code == 200 and response.headers['Content-Type'].startswith('text/plain')
+    after = samples(response.get_data(as_text=True))
+
+    def delta(name, **labels):
+        key = (name, frozenset(labels.items()))
+        return after.get(key, 0) - before.get(key, 0)
+
+    items = {'method': 'GET', 'endpoint': 'admin.get_items'}
+    assert delta('http_requests_total', status='200', **items) == 3
+    assert delta('http_request_duration_seconds_count', **items) == 3
+    assert delta('http_request_db_seconds_count', **items) == 3
+    assert delta('http_requests_total', method='GET', endpoint='unmatched', status='404') == 1
+    assert delta('upstream_request_duration_seconds_count', service='square', operation='create_payment', outcome='ok') == 1
+    assert after[('http_requests_in_progress', frozenset())] == 0
+    assert not [key for key in after if ('endpoint', 'metrics') in key[1]], 'scrapes are not counted'
+
+    app.config['METRICS_TOKEN'] = 'secret'
+    assert admin_client.get('/metrics').status_code == 401
+    assert admin_client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_workers_are_aggregated(tmp_path):
+    # The metric files are *.db too, so the database lives elsewhere
+    metrics_dir = tmp_path / 'metrics'
+    metrics_dir.mkdir()
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(metrics_dir), TEST_DATABASE_URI=f'sqlite:///{tmp_path / "app.db"}')
+    for count in (2, 3):
+        subprocess.run([sys.executable, '-c', WORKER, str(count)], env=env, check=True)
+    text = subprocess.run([sys.executable, '-c', WORKER, 'scrape'], env=env, check=True,
+                          capture_output=True, text=True).stdout
+    key = ('http_requests_total', frozenset({'method': 'GET', 'endpoint': 'main.health', 'status': '200'}.items()))
+    assert samples(text)[key] == 5, text
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""Tests for the transactional outbox (claiming, lease renewal and expiry, retry backoff, max_attempts)"""
+
+import sys
+sys.path.insert(0, '.')
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import OutboxEvent
+from app.outbox import HANDLERS, claim_events, drain, enqueue, outbox_stats, retry_delay
+
+
+def add_events(count, event_type='test.noop'):
+    events = [enqueue(event_type, {'n': n}) for n in range(count)]
+    db.session.commit()
+    return [event.id for event in events]
+
+
+def test_claim_locks_due_events_once(app):
+    ids = add_events(3)
+    later = enqueue('test.noop', {'n': 3})
+    later.available_at = datetime.utcnow() + timedelta(minutes=5)
+    db.session.commit()
+
+    first = claim_events('worker-a', batch_size=2)
+    assert [e.id for e in first] == ids[:2]
+    assert all(e.status == 'processing' and e.locked_by == 'worker-a' and e.attempts == 1 for e in first)
+    # Claimed events aren't handed to another worker; events not yet due aren't handed out at all
+    assert [e.id for e in claim_events('worker-b', batch_size=10)] == ids[2:]
+    assert claim_events('worker-c') == []
+    assert outbox_stats()['processing'] == 3 and outbox_stats()['pending'] == 1
+
+
+def test_expired_lease_is_reclaimed(app):
+    event_id, = add_events(1)
+    claim_events('worker-a', lease_seconds=300)
+    assert claim_events('worker-b', lease_seconds=300) == []
+
+    # worker-a died: once the lease runs out the event is handed out again
+    db.session.get(OutboxEvent, event_id).locked_at = datetime.utcnow() - timedelta(seconds=301)
+    db.session.commit()
+    reclaimed = claim_events('worker-b', lease_seconds=300)
+    assert [(e.id, e.locked_by, e.attempts) for e in reclaimed] == [(event_id, 'worker-b', 2)]
+
+
+def test_lease_is_renewed_for_each_handler(app, monkeypatch):
+    lease = 300
+    stolen = []
+
+    def slow(payload):
+        # Each handler takes most of a lease, so the batch as a whole outlasts it
+        for event in OutboxEvent.query.filter_by(status='processing'):
+            event.locked_at -= timedelta(seconds=lease * 0.6)
+        db.session.commit()
+        stolen.extend(claim_events('worker-b', lease_seconds=lease))
+
+    monkeypatch.setitem(HANDLERS, 'test.slow', slow)
+    add_events(3, 'test.slow')
+    assert drain('worker-a') == (3, 0)
+    assert stolen == []
+    assert [(e.status, e.locked_by, e.attempts) for e in OutboxEvent.query] == [('done', 'worker-a', 1)] * 3
+
+
+def test_reclaimed_event_is_skipped_by_the_old_worker(app, monkeypatch):
+    calls = []
+
+    def record(payload):
+        calls.append(payload['n'])
+        if payload['n'] == 0:
+            # The second event's lease expired and another worker took it over
+            taken = OutboxEvent.query.order_by(OutboxEvent.id.desc()).first()
+            taken.locked_by = 'worker-b'
+            db.session.commit()
+
+    monkeypatch.setitem(HANDLERS, 'test.record', record)
+    add_events(2, 'test.record')
+    assert drain('worker-a') == (1, 0)
+    assert calls == [0]
+    assert OutboxEvent.query.filter_by(locked_by='worker-b').one().status == 'processing'
+
+
+def test_late_finisher_does_not_overwrite_a_reclaimed_event(app, monkeypatch):
+    def stalled(payload):
+        # The lease ran out while the handler was still going and worker-b took the event over
+        event = db.session.get(OutboxEvent, payload['event_id'])
+        event.locked_by = 'worker-b'
+        db.session.commit()
+        if payload['fail']:
+            raise RuntimeError('receipt service down')
+
+    monkeypatch.setitem(HANDLERS, 'test.stalled', stalled)
+    for fail in (False, True):
+        event = enqueue('test.stalled', {})
+        db.session.flush()
+        event.payload = {'event_id': event.id, 'fail': fail}
+        db.session.commit()
+        assert drain('worker-a') == (0, 0)
+        event = db.session.get(OutboxEvent, event.id)
+        assert (event.status, event.locked_by, event.last_error) == ('processing', 'worker-b', None)
+
+
+def test_failures_back_off_then_fail_after_max_attempts(app, monkeypatch):
+    def flaky(payload):
+        raise RuntimeError('receipt service down')
+
+    monkeypatch.setitem(HANDLERS, 'test.flaky', flaky)
+    app.config['OUTBOX_MAX_ATTEMPTS'] = 3
+    event_id, = add_events(1, 'test.flaky')
+    for attempt in range(1, 4):
+        assert drain('worker-a') == (0, 1)
+        event = db.session.get(OutboxEvent, event_id)
+        assert event.attempts == attempt and event.last_error == 'RuntimeError: receipt service down'
+        assert event.locked_by is None
+        if attempt < 3:
+            assert event.status == 'pending' and event.available_at > datetime.utcnow()
+            assert drain('worker-a') == (0, 0)  # not retried before its backoff is up
+            event.available_at = datetime.utcnow()
+            db.session.commit()
+    assert event.status == 'failed'
+    assert drain('worker-a') == (0, 0)
+
+    # An event type with no handler is not retried
+    missing_id, = add_events(1, 'test.unknown')
+    assert drain('worker-a') == (0, 1)
+    missing = db.session.get(OutboxEvent, missing_id)
+    assert (missing.status, missing.attempts) == ('failed', 1) and 'LookupError' in missing.last_error
+
+
+def test_retry_delay_grows_with_jitter_up_to_the_cap():
+    for attempts, ceiling in ((1, 2.0), (2, 4.0), (4, 16.0), (20, 600.0)):
+        delays = [retry_delay(attempts) for _ in range(50)]
+        assert all(ceiling * 0.5 <= delay <= ceiling for delay in delays), (attempts, min(delays), max(delays))
+    assert retry_delay(0) <= 2.0
+
+
+def test_successful_event_is_done(app, monkeypatch):
+    monkeypatch.setitem(HANDLERS, 'test.noop', lambda payload: None)
+    event_id, = add_events(1)
+    assert drain('worker-a') == (1, 0)
+    event = db.session.get(OutboxEvent, event_id)
+    assert event.status == 'done' and event.processed_at is not None and event.attempts == 1
+    assert outbox_stats() == {'pending': 0, 'processing': 0, 'done': 1, 'failed': 0, 'oldest_pending_seconds': 0.0}
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
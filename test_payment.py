@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Tests for the Square payment processor (per-worker client, call stats, error mapping) against the Square stub"""
+
+import sys
+sys.path.insert(0, '.')
+
+import os
+
+import pytest
+
+from app.payment import CallStats, SquarePaymentProcessor, get_square_processor
+from benchmarks.square_stub import SquareStub
+
+
+def test_call_stats_snapshot():
+    stats = CallStats()
+    for elapsed_ms in range(1, 101):
+        stats.record('create_payment', float(elapsed_ms), ok=elapsed_ms % 10 != 0)
+    stats.record('refund_payment', 12.34, ok=True)
+
+    snapshot = stats.snapshot()
+    payments = snapshot['create_payment']
+    assert (payments['calls'], payments['errors']) == (100, 10)
+    assert (payments['avg_ms'], payments['p50_ms'], payments['p95_ms'], payments['max_ms']) == (50.5, 51.0, 96.0, 100.0)
+    assert payments['total_ms'] == 5050.0
+    assert snapshot['refund_payment'] == {'calls': 1, 'errors': 0, 'total_ms': 12.3, 'max_ms': 12.3,
+                                          'avg_ms': 12.3, 'p50_ms': 12.3, 'p95_ms': 12.3}
+
+    # Percentiles cover the most recent SAMPLE_SIZE calls; counters cover every call
+    for _ in range(CallStats.SAMPLE_SIZE):
+        stats.record('create_payment', 1.0, ok=True)
+    payments = stats.snapshot()['create_payment']
+    assert payments['calls'] == 100 + CallStats.SAMPLE_SIZE and payments['p95_ms'] == 1.0 and payments['max_ms'] == 100.0
+
+
+def test_processor_is_rebuilt_per_worker_process(app, square_stub):
+    processor = get_square_processor()
+    assert get_square_processor() is processor
+    assert processor._client is None  # the SDK client is built on first use
+
+    assert processor.process_payment(1500, 'cnon:card-nonce-ok')['success']
+    client = processor.client
+    assert processor.process_payment(1500, 'cnon:card-nonce-ok')['success']
+    assert processor.client is client and processor.stats.snapshot()['create_payment']['calls'] == 2
+
+    # As if this worker was forked from the process that created the app
+    app.extensions['square_processor'] = (processor, os.getpid() - 1)
+    forked = get_square_processor()
+    assert forked is not processor and forked._client is None
+    assert app.extensions['square_processor'] == (forked, os.getpid())
+    assert get_square_processor() is forked
+    processor.close()
+
+
+def test_errors_and_timeouts_are_mapped():
+    with SquareStub() as stub:
+        processor = SquarePaymentProcessor('stub-token', base_url=stub.url, timeout=0.2, connect_timeout=0.2)
+        try:
+            paid = processor.process_payment(2500, 'cnon:card-nonce-ok', idempotency_key='order-1')
+            assert paid['success'] and paid['amount'] == 2500 and paid['status'] == 'COMPLETED'
+            # Square replays the same idempotency key instead of charging twice
+            assert processor.process_payment(2500, 'cnon:card-nonce-ok', idempotency_key='order-1')['payment_id'] == paid['payment_id']
+            assert stub.stats()['payments'] == 1
+
+            declined = processor.process_payment(2500, 'cnon:card-declined')
+            assert not declined['success'] and declined['declined'] and declined['details'][0]['code'] == 'CARD_DECLINED'
+
+            # Server errors and timeouts leave the outcome open: not a decline, so the key may be retried
+            stub.configure(error_rate=1)
+            failed = processor.process_payment(2500, 'cnon:card-nonce-ok')
+            assert failed == {'success': False, 'error': 'Payment processing error', 'details': failed['details']}
+            assert failed['details'][0]['code'] == 'INTERNAL_SERVER_ERROR'
+
+            stub.configure(error_rate=0, latency_ms=500)
+            timed_out = processor.process_payment(2500, 'cnon:card-nonce-ok')
+            assert timed_out['error'] == 'Payment processing failed' and 'declined' not in timed_out
+            stub.configure(latency_ms=0)
+
+            refund = processor.refund_payment(paid['payment_id'], 1000)
+            assert refund['success'] and refund['amount'] == 1000
+            assert processor.get_payment(paid['payment_id'])['refunded_amount'] == 1000
+            assert not processor.refund_payment(paid['payment_id'], 5000)['success']  # more than is left
+            assert processor.get_payment('PAY-MISSING')['error'] == 'Could not retrieve payment'
+
+            snapshot = processor.stats.snapshot()
+            assert (snapshot['create_payment']['calls'], snapshot['create_payment']['errors']) == (5, 3)
+            assert (snapshot['refund_payment']['calls'], snapshot['refund_payment']['errors']) == (2, 1)
+            assert snapshot['retrieve_payment']['errors'] == 1
+        finally:
+            processor.close()
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
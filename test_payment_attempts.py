@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""Tests for the payment attempt ledger (replays, in-flight duplicates, stale and failed attempts, keys)"""
+
+import sys
+sys.path.insert(0, '.')
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Cart, Order, PaymentAttempt, Service
+from app.payment_attempts import claim_payment_attempt, payment_idempotency_key
+
+
+@pytest.fixture
+def mask(catalog, client):
+    """A $20 item, two of which are in the client's cart. Returns its id."""
+    service = Service(name='Mask', slug='mask', description='Mask', price_base=20.0, category_id=catalog.id)
+    db.session.add(service)
+    db.session.commit()
+    client.post('/services/add-to-cart', json={'service_id': service.id, 'quantity': 2})
+    return service.id
+
+
+def current_cart(client):
+    return Cart.query.filter_by(session_id=client.get_cookie('cart_session').value).first()
+
+
+def pay(client, cents, nonce='cnon:card-nonce-ok'):
+    return client.post('/services/process-payment', json={
+        'amount': cents, 'nonce': nonce, 'shipping_cost': 0,
+        'customer_name': 'Test Shopper', 'customer_email': 'shopper@example.com'
+    })
+
+
+def test_completed_payment_is_replayed_after_the_cart_is_gone(square_stub, client, mask):
+    first = pay(client, 4000)
+    assert first.status_code == 200, first.get_json()
+    assert current_cart(client) is None
+
+    again = pay(client, 4000)
+    assert again.status_code == 200 and again.get_json() == first.get_json()
+    assert square_stub.stats()['payments'] == 1 and Order.query.count() == 1
+    # A different amount is not the same payment
+    assert pay(client, 5000).get_json()['error'] == 'Cart is empty'
+
+
+def test_duplicate_during_payment_is_told_to_retry(square_stub, client, mask):
+    attempt, state = claim_payment_attempt(current_cart(client), 4000, stale_after=30)
+    assert state == 'charge'
+
+    # Another request is charging it: answer at once, no second charge
+    response = pay(client, 4000)
+    assert response.status_code == 409 and response.headers['Retry-After'] == '2'
+    assert response.get_json()['in_progress'] and square_stub.stats()['requests'] == 0
+
+    # Once it is recorded, the retry gets its result
+    attempt.status = 'succeeded'
+    attempt.response, attempt.response_status = {'success': True, 'order_number': 'ORD-FIRST'}, 200
+    db.session.commit()
+    assert pay(client, 4000).get_json()['order_number'] == 'ORD-FIRST'
+    assert square_stub.stats()['requests'] == 0
+
+
+def test_stale_attempt_is_taken_over_with_the_same_square_key(square_stub, client, mask):
+    attempt, _ = claim_payment_attempt(current_cart(client), 4000, stale_after=30)
+    key = attempt.square_idempotency_key
+    # The worker charging it died without recording anything
+    attempt.updated_at = datetime.utcnow() - timedelta(seconds=60)
+    db.session.commit()
+
+    response = pay(client, 4000)
+    assert response.status_code == 200, response.get_json()
+    db.session.refresh(attempt)
+    assert (attempt.status, attempt.tries, attempt.square_idempotency_key) == ('succeeded', 2, key)
+
+
+def test_declined_attempt_allows_a_retry_with_a_new_square_key(square_stub, client, mask):
+    declined = pay(client, 4000, nonce='cnon:card-declined')
+    assert declined.status_code == 400
+    attempt = PaymentAttempt.query.one()
+    assert attempt.status == 'failed'
+    # Replaying the declined attempt's result would be wrong: the customer tries another card
+    paid = pay(client, 4000)
+    assert paid.status_code == 200, paid.get_json()
+
+    db.session.refresh(attempt)
+    assert attempt.status == 'succeeded' and attempt.tries == 2
+    assert attempt.square_idempotency_key == f'{attempt.idempotency_key}-2'
+    assert PaymentAttempt.query.count() == 1
+    assert (square_stub.stats()['declines'], square_stub.stats()['payments']) == (1, 1)
+
+
+def test_lost_takeover_race_replays_only_a_success(square_stub, client, mask):
+    cart = current_cart(client)
+    attempt, _ = claim_payment_attempt(cart, 4000, stale_after=30)
+    attempt.status = 'failed'
+    db.session.commit()
+
+    raced = []
+
+    def declined_again(conn, cursor, statement, *args):
+        # Another request takes the attempt over, and its card is declined too, just before this one's UPDATE
+        if statement.startswith('UPDATE payment_attempts') and not raced:
+            raced.append(statement)
+            cursor.connection.execute(
+                "UPDATE payment_attempts SET tries = 2, updated_at = ? WHERE id = ?",
+                (datetime.utcnow().isoformat(' '), attempt.id)
+            )
+
+    event.listen(db.engine, 'before_cursor_execute', declined_again)
+    assert claim_payment_attempt(cart, 4000, stale_after=30)[1] == 'in_flight'
+    assert raced
+    assert attempt.status == 'failed' and attempt.tries == 2
+
+
+def test_invalid_amount_is_rejected(square_stub, client, mask):
+    for amount in (None, 0, -100, '4000', 40.5, True):
+        response = client.post('/services/process-payment', json={'amount': amount, 'nonce': 'cnon:card-nonce-ok'})
+        assert response.status_code == 400 and 'amount' in response.get_json()['error'], amount
+    assert PaymentAttempt.query.count() == 0 and square_stub.stats()['requests'] == 0
+
+    # Only a duplicate key counts as a concurrent insert; other constraint failures still raise
+    with pytest.raises(IntegrityError):
+        claim_payment_attempt(current_cart(client), None, stale_after=30)
+
+
+def test_new_cart_revision_or_amount_gets_a_new_key(square_stub, client, mask):
+    cart = current_cart(client)
+    key = payment_idempotency_key(cart, 4000)
+    assert payment_idempotency_key(cart, 4000) == key
+    assert payment_idempotency_key(cart, 4500) != key
+
+    client.post('/services/add-to-cart', json={'service_id': mask, 'quantity': 1})
+    db.session.refresh(cart)
+    assert payment_idempotency_key(cart, 4000) != key
+
+    # A pending attempt for the old contents doesn't block paying for the new ones
+    claim_payment_attempt(cart, 6000, stale_after=30)
+    client.post('/services/add-to-cart', json={'service_id': mask, 'quantity': 1})
+    assert pay(client, 8000).status_code == 200
+    assert PaymentAttempt.query.filter_by(status='succeeded').one().amount_cents == 8000
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
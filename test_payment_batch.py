@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""Tests for batch refunds and payment reconciliation against the local Square stub"""
+
+import sys
+sys.path.insert(0, '.')
+
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from app import db
+from app.models import Order
+from app.payment import get_square_processor
+from app.payment_batch import RateLimiter, reconcile_payments, refund_orders
+
+DAY = datetime(2026, 3, 2)
+
+
+def add_orders(stub, specs, created_at=DAY):
+    """Insert one order per (payment_status, square status, refunded cents) spec; returns their ids."""
+    rows = []
+    for i, (payment_status, square_status, refunded) in enumerate(specs):
+        rows.append({
+            'order_number': f'ORD-{created_at:%Y%m%d}-{i:05d}',
+            'customer_email': f'shopper{i}@example.com',
+            'customer_name': f'Shopper {i}',
+            'subtotal': 25.0,
+            'total_amount': 25.0,
+            'status': 'processing',
+            'payment_status': payment_status,
+            'square_payment_id': stub.add_payment(2500, square_status, refunded=refunded),
+            'created_at': created_at + timedelta(minutes=i),
+        })
+    db.session.execute(insert(Order), rows)
+    db.session.commit()
+    return [order_id for (order_id,) in db.session.query(Order.id).filter(Order.created_at >= created_at).order_by(Order.id)]
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(rate=50, burst=1)
+    started = time.perf_counter()
+    for _ in range(26):
+        limiter.acquire()
+    assert time.perf_counter() - started >= 0.45
+
+
+def test_reconciles_hundreds_of_orders_in_seconds(app, square_stub):
+    square_stub.configure(latency_ms=20)
+    specs = ([('paid', 'COMPLETED', 0)] * 200 + [('unpaid', 'COMPLETED', 0)] * 50
+             + [('paid', 'COMPLETED', 2500)] * 30 + [('paid', 'COMPLETED', 1000)] * 10 + [('paid', 'FAILED', 0)] * 10)
+    add_orders(square_stub, specs)
+    add_orders(square_stub, [('unpaid', 'COMPLETED', 0)] * 5, created_at=DAY + timedelta(days=2))  # outside the range
+
+    started = time.perf_counter()
+    events = list(reconcile_payments(get_square_processor(), DAY, DAY + timedelta(days=1), workers=8, rate=500))
+    elapsed = time.perf_counter() - started
+
+    summary = events[-1]
+    assert summary == {'type': 'summary', 'total': 300, 'matched': 200, 'corrected': 100, 'failed': 0}, summary
+    assert [e['done'] for e in events[:-1]] == list(range(1, 301))
+    assert elapsed < 10, elapsed  # ~300 x 20 ms sequentially would be 6 s on its own
+    assert 1 < square_stub.stats()['max_in_flight'] <= 8
+
+    counts = dict(db.session.query(Order.payment_status, db.func.count(Order.id))
+                  .filter(Order.created_at < DAY + timedelta(days=1)).group_by(Order.payment_status).all())
+    assert counts == {'paid': 250, 'refunded': 30, 'partially_refunded': 10, 'failed': 10}, counts
+    assert Order.query.filter(Order.created_at > DAY + timedelta(days=1), Order.payment_status == 'unpaid').count() == 5
+
+
+def test_refunds_are_bulk_recorded_and_never_repeated(app, square_stub):
+    square_stub.configure(latency_ms=10)
+    order_ids = add_orders(square_stub, [('paid', 'COMPLETED', 0)] * 120 + [('unpaid', 'COMPLETED', 0)])
+
+    events = list(refund_orders(get_square_processor(), order_ids + [999999], workers=8, rate=500))
+    assert events[-1] == {'type': 'summary', 'total': 122, 'refunded': 120, 'failed': 2}, events[-1]
+    assert square_stub.stats()['refunds'] == 120
+    assert Order.query.filter_by(payment_status='refunded', status='cancelled').count() == 120
+    assert Order.query.filter(Order.square_refund_id.isnot(None)).count() == 120
+
+    # Running the batch again refunds nothing; a reset order replays Square's original refund
+    events = list(refund_orders(get_square_processor(), order_ids, workers=8, rate=500))
+    assert events[-1]['refunded'] == 0
+    refund_id = db.session.get(Order, order_ids[0]).square_refund_id
+    Order.query.filter_by(id=order_ids[0]).update({'payment_status': 'paid'})
+    db.session.commit()
+    events = list(refund_orders(get_square_processor(), order_ids[:1]))
+    assert events[-1]['refunded'] == 1 and events[0]['refund_id'] == refund_id
+    assert square_stub.stats()['refunds'] == 120
+
+
+def test_disconnect_cancels_queued_refunds_and_saves_finished_ones(app, square_stub):
+    square_stub.configure(latency_ms=20)
+    order_ids = add_orders(square_stub, [('paid', 'COMPLETED', 0)] * 100)
+
+    events = refund_orders(get_square_processor(), order_ids, workers=4, rate=500, flush_every=50)
+    progress = [next(events) for _ in range(10)]
+    events.close()  # the client went away
+
+    # Only the calls already in flight ran after the disconnect
+    assert 10 <= square_stub.stats()['refunds'] <= 10 + 4, square_stub.stats()
+    assert Order.query.filter_by(payment_status='refunded').count() == 10
+    assert {e['order_id'] for e in progress} == {
+        order_id for (order_id,) in db.session.query(Order.id).filter_by(payment_status='refunded')}
+
+    # Running it again finishes the rest without refunding anything twice
+    events = list(refund_orders(get_square_processor(), order_ids, workers=4, rate=500))
+    assert Order.query.filter_by(payment_status='refunded').count() == 100
+    assert square_stub.stats()['refunds'] == 100
+
+
+def test_processor_charges_through_configured_stub(app, square_stub):
+    processor = get_square_processor()
+    paid = processor.process_payment(1999, 'cnon:card-nonce-ok', idempotency_key='stub-key')
+    assert paid['success'] and paid['amount'] == 1999, paid
+    assert processor.process_payment(1999, 'cnon:card-nonce-ok', idempotency_key='stub-key')['payment_id'] == paid['payment_id']
+    declined = processor.process_payment(1999, 'cnon:card-declined')
+    assert not declined['success'] and declined['declined']
+
+    square_stub.configure(error_rate=1.0)
+    failed = processor.process_payment(1999, 'cnon:card-nonce-ok')
+    assert not failed['success'] and not failed.get('declined')
+    assert square_stub.stats()['payments'] == 1 and square_stub.stats()['replays'] == 1
+
+
+def test_admin_endpoints_stream_progress(app, square_stub, admin_client):
+    add_orders(square_stub, [('unpaid', 'COMPLETED', 0)] * 3)
+
+    response = admin_client.post('/admin/api/orders/reconcile', json={'start_date': '2026-03-02', 'end_date': '2026-03-02'})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == 4 and lines[-1]['corrected'] == 3
+
+    assert admin_client.post('/admin/api/orders/reconcile', json={'start_date': 'yesterday'}).status_code == 400
+    assert admin_client.post('/admin/api/orders/refund', json={'order_ids': []}).status_code == 400
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
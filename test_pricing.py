@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""Tests for the compiled pricing engine (bulk tiers, variants, options, revision invalidation)"""
+
+import sys
+sys.path.insert(0, '.')
+
+import pytest
+
+from app import db
+from app.models import CartItem, Service, ServiceOption
+from app.pricing import CompiledPricing, PricingEngine, pricing_engine
+
+
+def make_service(**fields):
+    """A transient service; CompiledPricing only reads its attributes."""
+    fields.setdefault('price_base', 20.0)
+    return Service(id=fields.pop('id', 1), name='Mask', slug='mask', description='Mask', pricing_revision=0, **fields)
+
+
+def test_tier_selection():
+    # Tiers are sorted on compile, whatever order the admin saved them in
+    compiled = CompiledPricing(make_service(bulk_pricing=[
+        {'min_quantity': 50, 'price': 12.0}, {'min_quantity': 10, 'price': 16.0}, {'min_quantity': 25, 'price': None}
+    ]))
+    assert compiled.tier_quantities == (10, 50)
+    assert [compiled.tier_price(q) for q in (1, 9, 10, 49, 50, 500)] == [20.0, 20.0, 16.0, 16.0, 12.0, 12.0]
+    assert compiled.tier_ratio(10) == 0.8 and compiled.tier_ratio(1) == 1.0
+    assert CompiledPricing(make_service()).unit_price(100) == 20.0
+    assert CompiledPricing(make_service(price_base=None, bulk_pricing=[{'min_quantity': 10, 'price': 5}])).unit_price(20) is None
+
+
+def test_variants_options_and_tiers_combine():
+    service = make_service(
+        bulk_pricing=[{'min_quantity': 10, 'price': 15.0}],
+        variants=[
+            {'name': 'Large', 'sku': 'MSK-L', 'price': 30.0},
+            {'name': 'Custom', 'sku': 'MSK-C', 'price': None},
+            {'name': 'Gold', 'sku': 'MSK-G', 'price': 50.0, 'is_available': False},
+        ],
+    )
+    service.service_options = [
+        ServiceOption(id=7, option_name='Paint', option_type='finish', price_adjustment=2.5, is_available=True),
+        ServiceOption(id=8, option_name='Resin', option_type='material', price_adjustment=9.0, is_available=False),
+    ]
+    compiled = CompiledPricing(service)
+
+    # Variant prices get the tier's proportional discount (15 / 20), by name or SKU
+    assert compiled.unit_price(1, {'variant': 'Large'}) == 30.0
+    assert compiled.unit_price(10, {'variant': 'MSK-L'}) == 22.5
+    assert compiled.unit_price(10, {'variant': 'Large', 'option_7': 'yes'}) == 25.0
+    assert compiled.unit_price(10, {'option_7': 'yes'}) == 17.5
+    assert compiled.unit_price(1, {'option_7': ''}) == 20.0
+    assert compiled.unit_price(1, {'variant': 'Custom'}) is None
+
+    for options in ({'variant': 'Gold'}, {'variant': 'Nope'}, {'option_8': 'yes'}):
+        try:
+            compiled.unit_price(1, options)
+        except ValueError:
+            continue
+        raise AssertionError(f'{options} should be rejected')
+
+
+def test_engine_recompiles_only_on_new_revision():
+    engine = PricingEngine()
+    service = make_service(id=42)
+    first = engine.compile(service)
+    assert engine.compile(service) is first
+
+    service.price_base = 25.0  # without a revision bump the cached compile is reused
+    assert engine.price_line(service, 1) == 20.0
+    service.pricing_revision = 1
+    assert engine.price_line(service, 1) == 25.0
+    engine.invalidate(42)
+    assert engine.compile(service) is not first
+
+
+def test_admin_and_option_edits_invalidate_compiled_prices(catalog, admin_client):
+    service = Service(name='Helmet', slug='helmet', description='Helmet', price_base=100.0, category_id=catalog.id)
+    option = ServiceOption(option_name='Visor', option_type='extra', price_adjustment=10.0)
+    service.service_options.append(option)
+    db.session.add(service)
+    db.session.commit()
+    service_id, option_key = service.id, f'option_{option.id}'
+
+    assert pricing_engine.price_line(service, 1, {option_key: 'yes'}) == 110.0
+
+    # Option edits bump the service's pricing revision
+    revision = service.pricing_revision
+    option.price_adjustment = 15.0
+    db.session.commit()
+    assert service.pricing_revision == revision + 1
+    assert pricing_engine.price_line(service, 1, {option_key: 'yes'}) == 115.0
+
+    db.session.add(ServiceOption(service_id=service_id, option_name='Strap', option_type='extra', price_adjustment=1))
+    db.session.commit()
+    assert service.pricing_revision == revision + 2
+
+    db.session.delete(option)
+    db.session.commit()
+    assert service.pricing_revision == revision + 3
+    assert pricing_engine.price_line(service, 1, {option_key: 'yes'}) == 100.0
+
+    # Admin price edits do too, and open carts follow
+    admin_client.post('/services/add-to-cart', json={'service_id': service_id, 'quantity': 2})
+    response = admin_client.put(f'/admin/api/items/{service_id}', json={'price_base': 80.0})
+    assert response.get_json()['repriced']['lines_updated'] == 1, response.get_json()
+    assert pricing_engine.price_line(db.session.get(Service, service_id), 2) == 80.0
+    assert CartItem.query.filter_by(service_id=service_id).one().price_at_time == 80.0
+
+
+def test_checkout_after_admin_price_change_can_pay(app, square_stub, catalog, admin_client):
+    service = Service(name='Mask', slug='mask', description='Mask', price_base=20.0, category_id=catalog.id)
+    db.session.add(service)
+    db.session.commit()
+    service_id = service.id
+
+    admin_client.post('/services/add-to-cart', json={'service_id': service_id, 'quantity': 2})
+    assert admin_client.put(f'/admin/api/items/{service_id}', json={'price_base': 25.0}).get_json()['repriced']['carts_flagged'] == 1
+
+    def pay(total):
+        return admin_client.post('/services/process-payment', json={
+            'amount': int(total * 100), 'nonce': 'cnon:card-nonce-ok', 'shipping_cost': 0,
+            'customer_name': 'Test Shopper', 'customer_email': 'shopper@example.com'
+        })
+
+    # Paying the old total is refused until the customer has seen the new prices...
+    response = pay(40)
+    assert response.status_code == 409 and response.get_json()['prices_changed']
+    # ...which the checkout page shows once
+    assert 'Prices for some items in your cart have changed' in admin_client.get('/services/checkout').get_data(as_text=True)
+    assert 'Prices for some items in your cart have changed' not in admin_client.get('/services/checkout').get_data(as_text=True)
+
+    response = pay(50)
+    assert response.status_code == 200 and response.get_json()['success'], response.get_json()
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""Tests for the per-request query profiler (headers, N+1 detection, slow-query log, admin stats)"""
+
+import sys
+sys.path.insert(0, '.')
+
+import logging
+
+import pytest
+
+from app import db
+from app.catalog_import import import_catalog
+from app.models import Category
+from app.query_profiler import statement_shape
+
+
+def add_items(categories=6):
+    db.session.add_all(Category(name=f'Shelf {n}', slug=f'shelf-{n}') for n in range(categories))
+    db.session.commit()
+    assert import_catalog([
+        {'name': f'Item {i}', 'category': f'shelf-{i % categories}', 'price_base': 5} for i in range(categories * 2)
+    ])['success']
+    # Start from a cold identity map so the catalog page has to load each category
+    db.session.expire_all()
+
+
+def test_statement_shapes():
+    assert statement_shape('SELECT * FROM t WHERE id IN (?, ?, ?)') == statement_shape('SELECT * FROM t WHERE id IN (?)')
+    assert statement_shape("SELECT * FROM t WHERE a = 'x' AND b = 12") == 'SELECT * FROM t WHERE a = ? AND b = ?'
+    assert statement_shape('INSERT INTO t (a, b) VALUES (?, ?), (?, ?)') == 'INSERT INTO t (a, b) VALUES (?)'
+    assert statement_shape('SELECT t1.a FROM t1') == 'SELECT t1.a FROM t1'
+
+
+def test_headers_and_n_plus_one_detection(app, catalog, admin_client):
+    add_items()
+    response = admin_client.get('/admin/api/items?limit=5')
+    assert (response.headers['X-Query-Count'], response.headers['X-Query-Repeats']) == ('1', '0'), response.headers
+    assert float(response.headers['X-Query-Time-Ms']) >= 0
+
+    # The catalog page lazy-loads each service's category: one SELECT per category
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logging.getLogger('app.query_profiler').addHandler(handler)
+    try:
+        response = admin_client.get('/services/')
+    finally:
+        logging.getLogger('app.query_profiler').removeHandler(handler)
+    assert response.status_code == 200
+    assert int(response.headers['X-Query-Repeats']) >= 1, response.headers
+    assert any('Possible N+1 in GET services.catalog' in record.getMessage() for record in records), records
+
+    stats = admin_client.get('/admin/api/queries').get_json()
+    endpoints = {row['endpoint']: row for row in stats['endpoints']}
+    assert endpoints['GET services.catalog']['repeat_requests'] == 1
+    assert endpoints['GET admin.get_items']['avg_queries'] == 1
+    issue = next(issue for issue in stats['issues'] if issue['kind'] == 'repeated')
+    assert issue['endpoint'] == 'GET services.catalog' and issue['count'] >= 5 and 'categories' in issue['statement']
+    assert admin_client.get('/admin/queries').status_code == 200
+
+    assert admin_client.post('/admin/api/queries/reset').get_json()['success']
+    assert [row['endpoint'] for row in admin_client.get('/admin/api/queries').get_json()['endpoints']] == ['POST admin.reset_query_stats']
+
+
+def test_headers_hidden_from_visitors(app, catalog, client, admin_client):
+    add_items()
+    app.debug = False
+    response = client.get('/services/')
+    assert 'X-Query-Count' not in response.headers and 'Cookie' not in response.headers.get('Vary', '')
+    assert 'X-Query-Count' in admin_client.get('/services/').headers
+
+
+@pytest.mark.app_settings(QUERY_SLOW_MS=0)
+def test_slow_queries_are_recorded(admin_client):
+    admin_client.get('/admin/api/items')
+    issue = next(issue for issue in admin_client.get('/admin/api/queries').get_json()['issues'] if issue['kind'] == 'slow')
+    assert issue['endpoint'] == 'GET admin.get_items' and issue['statement'].startswith('SELECT') and 'ms' in issue
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""Tests for the shipping rate quote cache (buckets, TTL, LRU, FSA fallback, shared disk tier)"""
+
+import sys
+sys.path.insert(0, '.')
+
+import os
+import tempfile
+import time
+
+from app.rate_cache import RateQuoteCache
+
+
+def quote(price=12.5):
+    return {'success': True, 'options': [{'service_code': 'DOM.RP', 'price': price}]}
+
+
+class Upstream:
+    """fetch() stand-in that counts calls and remembers the weights it was asked to quote."""
+
+    def __init__(self, result=None):
+        self.result = result or quote()
+        self.weights = []
+
+    def __call__(self, postal_code, weight_kg, domestic_only):
+        self.weights.append(weight_kg)
+        return dict(self.result)
+
+
+def test_weight_buckets_stay_within_the_parcel_limit():
+    cache = RateQuoteCache(weight_bucket_kg=0.25)
+    assert [cache.weight_bucket(w) for w in (0.1, 0.25, 0.26, 29.9)] == [0.25, 0.25, 0.5, 30.0]
+
+    # 29.9 kg would round up to 31.5 kg with 1.5 kg buckets: quote the limit instead
+    cache = RateQuoteCache(weight_bucket_kg=1.5)
+    assert cache.weight_bucket(29.9) == 30.0 and cache.weight_bucket(28.0) == 28.5
+    assert cache.weight_bucket(31.0) == 31.5  # already over the limit: left for the carrier to reject
+    upstream = Upstream()
+    cache.get_or_fetch('K1A 0B1', 29.9, True, upstream)
+    assert upstream.weights == [30.0]
+
+
+def test_hit_after_fetch_and_ttl_expiry():
+    cache = RateQuoteCache(ttl=0.2, fsa_fallback=False)
+    upstream = Upstream()
+    assert cache.get_or_fetch('k1a 0b1', 1.1, True, upstream)['cache_status'] == 'miss'
+    # Same postal code (any spelling) and weight bucket
+    hit = cache.get_or_fetch('K1A0B1', 1.2, True, upstream)
+    assert hit['cache_status'] == 'hit' and hit['weight_kg'] == 1.2 and len(upstream.weights) == 1
+    assert cache.get('K1A0B1', 1.2, domestic_only=False) is None
+
+    time.sleep(0.25)
+    assert cache.get('K1A0B1', 1.2) is None
+    cache.get_or_fetch('K1A0B1', 1.2, True, upstream)
+    assert len(upstream.weights) == 2
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['upstream_calls']) == (1, 2), stats
+
+
+def test_failed_and_estimated_quotes_are_not_cached():
+    cache = RateQuoteCache()
+    for result in ({'success': False, 'error': 'down'}, dict(quote(), is_fallback=True), dict(quote(), is_estimate=True)):
+        cache.get_or_fetch('K1A0B1', 1.0, True, Upstream(result))
+        assert cache.get('K1A0B1', 1.0) is None
+    assert cache.stats()['upstream_errors'] == 2
+
+
+def test_lru_eviction():
+    cache = RateQuoteCache(max_entries=2, fsa_fallback=False)
+    for postal_code in ('A1A1A1', 'B2B2B2'):
+        cache.set(postal_code, 1.0, True, quote())
+    assert cache.get('A1A1A1', 1.0) is not None  # A is now the most recently used
+    cache.set('C3C3C3', 1.0, True, quote())
+    assert cache.get('B2B2B2', 1.0) is None
+    assert cache.get('A1A1A1', 1.0) is not None and cache.get('C3C3C3', 1.0) is not None
+    assert cache.stats()['entries'] == 2
+
+
+def test_fsa_fallback():
+    cache = RateQuoteCache()
+    cache.set('K1A 0B1', 2.0, True, quote(20.0))
+    nearby = cache.get('K1A 9Z9', 2.0)
+    assert nearby['cache_status'] == 'fsa' and nearby['destination'] == 'K1A 9Z9'
+    assert nearby['options'][0]['price'] == 20.0
+    assert cache.get('K1B 0B1', 2.0) is None
+    assert RateQuoteCache(fsa_fallback=False).get('K1A 9Z9', 2.0) is None
+
+    # Cached quotes are copies: callers can't change the cache
+    nearby['options'][0]['price'] = 0
+    assert cache.get('K1A 0B1', 2.0)['options'][0]['price'] == 20.0
+
+
+def test_disk_tier_is_shared_between_workers():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rates.db')
+        first, second = RateQuoteCache(disk_path=path), RateQuoteCache(disk_path=path)
+        first.set('K1A0B1', 1.0, True, quote(9.0))
+
+        found = second.get('K1A0B1', 1.0)
+        assert found['options'][0]['price'] == 9.0 and second.stats()['disk_hits'] == 1
+        second.get('K1A0B1', 1.0)  # now served from its own memory
+        assert second.stats()['disk_hits'] == 1
+
+        first.clear()
+        assert RateQuoteCache(disk_path=path).get('K1A0B1', 1.0) is None
+
+        expired = RateQuoteCache(ttl=-1, disk_path=path)
+        expired.set('K1A0B1', 1.0, True, quote())
+        assert RateQuoteCache(disk_path=path).get('K1A0B1', 1.0) is None
+
+    # An unusable path turns the disk tier off instead of failing requests
+    assert RateQuoteCache(disk_path='/nonexistent/dir/rates.db').stats()['disk_tier'] is False
+
+
+if __name__ == '__main__':
+    print("Testing shipping rate cache...\n")
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✓ {name}")
+    print("\n✅ All rate cache tests passed!")
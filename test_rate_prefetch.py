@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""Tests for shipping rate prefetch (known destinations, warm cache hits, single-flight upstream calls)"""
+
+import sys
+sys.path.insert(0, '.')
+
+import threading
+import time
+
+import pytest
+
+from app import db
+from app.models import Order, Service
+from app.rate_cache import RateQuoteCache, get_rate_cache
+from app.rate_prefetch import RatePrefetcher, get_rate_prefetcher
+
+
+class GatedUpstream:
+    """fetch() stand-in that blocks until released, counting calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, postal_code, weight_kg, domestic_only):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return {'success': True, 'options': [{'service_code': 'DOM.RP', 'price': 11.0}]}
+
+
+def wait_for_prefetches(prefetcher, timeout=5):
+    deadline = time.time() + timeout
+    while prefetcher.stats()['pending'] and time.time() < deadline:
+        time.sleep(0.01)
+    assert not prefetcher.stats()['pending'], prefetcher.stats()
+
+
+def test_lookup_waits_for_an_in_flight_prefetch():
+    cache = RateQuoteCache()
+    prefetcher = RatePrefetcher(cache, workers=2)
+    upstream = GatedUpstream()
+
+    assert prefetcher.prefetch('K1A 0B1', [1.0, 1.0], True, upstream) == 1
+    assert upstream.started.wait(5)
+    # Already in flight: neither a second prefetch nor a checkout lookup calls the upstream again
+    assert prefetcher.prefetch('K1A 0B1', [1.0], True, upstream) == 0
+
+    results = []
+    lookup = threading.Thread(target=lambda: results.append(cache.get_or_fetch('K1A 0B1', 1.0, True, upstream)))
+    lookup.start()
+    time.sleep(0.1)
+    assert not results  # waiting on the prefetch
+    upstream.release.set()
+    lookup.join(5)
+
+    assert upstream.calls == 1
+    assert results[0]['cache_status'] == 'coalesced' and results[0]['options'][0]['price'] == 11.0
+    assert cache.stats()['coalesced'] == 1
+    wait_for_prefetches(prefetcher)
+    assert cache.get('K1A 0B1', 1.0)['cache_status'] == 'hit'
+
+
+def test_concurrent_lookups_share_one_call():
+    cache = RateQuoteCache()
+    upstream = GatedUpstream()
+    results = []
+    lookups = [threading.Thread(target=lambda: results.append(cache.get_or_fetch('K1A 0B1', 2.0, True, upstream)))
+               for _ in range(4)]
+    for lookup in lookups:
+        lookup.start()
+    assert upstream.started.wait(5)
+    time.sleep(0.05)
+    upstream.release.set()
+    for lookup in lookups:
+        lookup.join(5)
+    assert upstream.calls == 1
+    assert sorted(result['cache_status'] for result in results) == ['coalesced'] * 3 + ['miss']
+
+
+def test_slow_in_flight_call_is_not_waited_for_past_the_deadline():
+    cache = RateQuoteCache()
+    slow = GatedUpstream()
+    threading.Thread(target=cache.warm, args=('K1A 0B1', 1.0, True, slow), daemon=True).start()
+    assert slow.started.wait(5)
+
+    fast = GatedUpstream()
+    fast.release.set()
+    started = time.perf_counter()
+    result = cache.get_or_fetch('K1A 0B1', 1.0, True, fast, wait=0.05)
+    assert result['cache_status'] == 'miss' and fast.calls == 1
+    assert time.perf_counter() - started < 1
+    slow.release.set()
+
+
+def test_queued_prefetch_is_not_waited_for():
+    cache = RateQuoteCache()
+    prefetcher = RatePrefetcher(cache, workers=1)
+    busy = GatedUpstream()
+    assert prefetcher.prefetch('K1A 0B1', [1.0], True, busy) == 1
+    assert busy.started.wait(5)
+
+    # Queued behind the busy worker: a lookup fetches it at once instead of waiting for the queue
+    queued = GatedUpstream()
+    queued.release.set()
+    assert prefetcher.prefetch('K1A 0B1', [5.0], True, queued) == 1
+    started = time.perf_counter()
+    assert cache.get_or_fetch('K1A 0B1', 5.0, True, queued)['cache_status'] == 'miss'
+    assert time.perf_counter() - started < 1
+
+    # Once it runs, the queued prefetch finds the quote cached and doesn't call the upstream again
+    busy.release.set()
+    wait_for_prefetches(prefetcher)
+    assert queued.calls == 1 and prefetcher.stats()['skipped'] == 1
+
+
+@pytest.fixture
+def crate(catalog, canada_post_stub):
+    """A 2 kg item, with an empty rate cache and Canada Post on the local stub. Returns its id."""
+    service = Service(name='Crate', slug='crate', description='Crate', price_base=10.0,
+                      weight_kg=2.0, category_id=catalog.id)
+    db.session.add(service)
+    db.session.commit()
+    get_rate_cache().clear()
+    return service.id
+
+
+def shipping_rates(client, postal_code='K1A 0B1'):
+    response = client.post('/services/api/shipping-rates', json={'destination_postal_code': postal_code})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_known_postal_code_prefetches_into_a_cache_hit(client, crate, canada_post_stub):
+    client.set_cookie('shipping_postal_code', 'K1A 0B1')
+    client.post('/services/add-to-cart', json={'service_id': crate, 'quantity': 1})
+    wait_for_prefetches(get_rate_prefetcher())
+    assert canada_post_stub.stats()['requests'] == 1
+
+    rates = shipping_rates(client)
+    assert rates['success'] and [p['cache_status'] for p in rates['parcels']] == ['hit'], rates
+    assert canada_post_stub.stats()['requests'] == 1
+
+
+def test_checkout_lookup_during_prefetch_makes_one_upstream_call(client, crate, canada_post_stub):
+    canada_post_stub.set_profile('healthy', latency_ms=300, jitter_ms=0)
+    client.post('/services/add-to-cart', json={'service_id': crate, 'quantity': 1})
+    client.set_cookie('shipping_postal_code', 'K1A 0B1')
+    page = client.get('/services/checkout').get_data(as_text=True)
+    assert 'value="K1A 0B1"' in page
+
+    # The page asks for rates at once, while the prefetch is still waiting on Canada Post
+    rates = shipping_rates(client)
+    assert rates['success'] and [p['cache_status'] for p in rates['parcels']] == ['coalesced'], rates
+    wait_for_prefetches(get_rate_prefetcher())
+    assert canada_post_stub.stats()['requests'] == 1
+
+
+def test_previous_order_postal_code_is_known(client, crate, canada_post_stub):
+    db.session.add(Order(order_number='ORD-PREV', customer_email='a@example.com', customer_name='A',
+                         customer_zip='K1A 0B1', subtotal=10, total_amount=10))
+    db.session.commit()
+    client.post('/services/add-to-cart', json={'service_id': crate, 'quantity': 1})
+    assert canada_post_stub.stats()['requests'] == 0  # no known destination yet
+    client.set_cookie('last_order', 'ORD-PREV')
+    assert 'value="K1A 0B1"' in client.get('/services/checkout').get_data(as_text=True)
+    wait_for_prefetches(get_rate_prefetcher())
+    assert canada_post_stub.stats()['requests'] == 1
+
+
+def test_lookup_waits_at_most_the_read_timeout(client, crate, canada_post_client, canada_post_stub):
+    canada_post_client(canada_post_stub.url, READ_TIMEOUT=0.2)
+    client.post('/services/add-to-cart', json={'service_id': crate, 'quantity': 1})
+    stuck = GatedUpstream()
+    threading.Thread(target=get_rate_cache().warm, args=('K1A 0B1', 2.0, True, stuck), daemon=True).start()
+    assert stuck.started.wait(5)
+
+    started = time.perf_counter()
+    rates = shipping_rates(client)
+    assert rates['success'] and [p['cache_status'] for p in rates['parcels']] == ['miss'], rates
+    assert time.perf_counter() - started < 2
+    stuck.release.set()
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""Tests for the incrementally maintained sales rollups (checkout, refunds, reconciliation, backfill)"""
+
+import sys
+sys.path.insert(0, '.')
+
+from datetime import date, datetime
+
+import pytest
+
+from app import db
+from app.models import DailySales, Order, Service, ServiceSales
+from app.payment import get_square_processor
+from app.payment_batch import reconcile_payments, refund_orders
+from app.sales import (DAILY_COUNTERS, SERVICE_COUNTERS, _increment_or_insert, _upsert_increment,
+                       rebuild_sales_rollups, sales_summary)
+
+
+def snapshot():
+    """Rollup rows as comparable tuples (rounded, zero rows dropped)."""
+    daily = sorted((row.day, row.orders, round(row.revenue, 2), round(row.shipping, 2), row.items_sold, row.refunds,
+                    round(row.refunded_amount, 2)) for row in DailySales.query if row.orders)
+    services = sorted((row.service_id, row.service_name, row.orders, row.quantity, round(row.revenue, 2),
+                       row.refunded_quantity, round(row.refunded_revenue, 2)) for row in ServiceSales.query if row.orders)
+    return daily, services
+
+
+def checkout(client, items, nonce='cnon:card-nonce-ok', shipping=10.0):
+    """Add items to a fresh cart and pay for it; returns the process-payment JSON."""
+    client.delete_cookie('cart_session')
+    total = 0
+    for service_id, quantity in items:
+        total = client.post('/services/add-to-cart', json={'service_id': service_id, 'quantity': quantity}).get_json()['cart_total']
+    response = client.post('/services/process-payment', json={
+        'amount': int(round((total + shipping) * 100)), 'nonce': nonce, 'shipping_cost': shipping,
+        'customer_name': 'Test Shopper', 'customer_email': 'shopper@example.com'
+    })
+    return response.get_json()
+
+
+def test_rollups_follow_checkout_refunds_and_reconciliation(square_stub, catalog, client):
+    mask = Service(name='Mask', slug='mask', description='Mask', price_base=20.0, category_id=catalog.id)
+    sword = Service(name='Sword', slug='sword', description='Sword', price_base=35.0, category_id=catalog.id)
+    db.session.add_all([mask, sword])
+    db.session.commit()
+
+    assert checkout(client, [(mask.id, 2), (sword.id, 1)])['success']
+    assert checkout(client, [(mask.id, 1)])['success']
+    assert checkout(client, [(sword.id, 3)])['success']
+    assert not checkout(client, [(sword.id, 1)], nonce='cnon:card-declined')['success']
+
+    today = sales_summary()['today']
+    assert today['orders'] == 3 and today['items_sold'] == 7, today
+    assert today['revenue'] == 2 * 20 + 35 + 20 + 3 * 35 + 30, today
+    top = sales_summary()['top_services']
+    assert [(s['service_name'], s['quantity'], s['orders']) for s in top] == [('Sword', 4, 2), ('Mask', 3, 2)], top
+
+    # Refund one order; reconcile another that Square shows as refunded already
+    orders = Order.query.order_by(Order.id).all()
+    list(refund_orders(get_square_processor(), [orders[0].id]))
+    square_stub.payments[orders[1].square_payment_id]['refunded_money'] = {'amount': 3000, 'currency': 'USD'}
+    list(reconcile_payments(get_square_processor(), datetime(2000, 1, 1), datetime(2100, 1, 1)))
+
+    today = sales_summary()['today']
+    assert today['refunds'] == 2 and today['net_revenue'] == 3 * 35 + 10, today
+    mask_sales = db.session.get(ServiceSales, mask.id).to_dict()
+    assert mask_sales['quantity'] == 0 and mask_sales['refunded_quantity'] == 3, mask_sales
+
+    # The incremental tables match a full rebuild from orders
+    incremental = snapshot()
+    assert rebuild_sales_rollups() == {'days': 1, 'services': 2}
+    assert snapshot() == incremental, (snapshot(), incremental)
+
+
+def test_stats_api(admin_client):
+    stats = admin_client.get('/admin/api/sales/stats?days=7&top=5').get_json()
+    assert len(stats['daily']) == 7 and stats['period']['orders'] == 0 and stats['top_services'] == []
+    assert admin_client.get('/admin/api/sales/stats?days=0').status_code == 400
+    assert admin_client.get('/admin/dashboard').status_code == 200
+
+
+def test_portable_fallback_matches_upsert(catalog):
+    mask = Service(name='Mask', slug='mask', description='Mask', price_base=20.0, category_id=catalog.id)
+    db.session.add(mask)
+    db.session.commit()
+
+    def day(d, orders, revenue):
+        return {'day': d, **dict.fromkeys(DAILY_COUNTERS, 0), 'orders': orders, 'revenue': revenue}
+    first, second = date(2026, 3, 1), date(2026, 3, 2)
+    results = []
+    for increment in (_upsert_increment, _increment_or_insert):
+        DailySales.query.delete()
+        ServiceSales.query.delete()
+        increment(DailySales, ['day'], DAILY_COUNTERS, [day(first, 2, 40.0)])
+        increment(DailySales, ['day'], DAILY_COUNTERS, [day(first, 1, 20.0), day(second, 1, 35.0)])
+        sale = {'service_id': mask.id, **dict.fromkeys(SERVICE_COUNTERS, 0), 'orders': 1, 'quantity': 2}
+        increment(ServiceSales, ['service_id'], SERVICE_COUNTERS, [dict(sale, service_name='Mask')], replace=('service_name',))
+        increment(ServiceSales, ['service_id'], SERVICE_COUNTERS, [dict(sale, service_name='Mask v2')], replace=('service_name',))
+        db.session.commit()
+        results.append(snapshot())
+    assert results[0] == results[1], results
+    assert [row[:3] for row in results[1][0]] == [(first, 3, 60.0), (second, 1, 35.0)]
+    assert results[1][1][0][1:4] == ('Mask v2', 2, 4)
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""Tests for schema upgrades (missing columns and indexes, stored fingerprint) and post-fork reset"""
+
+import sys
+sys.path.insert(0, '.')
+
+import os
+import sqlite3
+
+import pytest
+from sqlalchemy import event, inspect, select, text
+
+from app import db, reset_after_fork
+from app.models import CategoryPath, Service
+from app.payment import get_square_processor
+from app.rate_prefetch import get_rate_prefetcher
+from app.schema import prepare_schema, schema_fingerprint, schema_is_current, schema_version
+
+# Two tables as the first release of the shop created them
+BASELINE_SCHEMA = '''
+CREATE TABLE categories (
+    id INTEGER NOT NULL, name VARCHAR(255) NOT NULL, slug VARCHAR(255) NOT NULL, parent_id INTEGER,
+    description TEXT, "order" INTEGER, is_active BOOLEAN, created_at DATETIME,
+    PRIMARY KEY (id), UNIQUE (slug), FOREIGN KEY(parent_id) REFERENCES categories (id)
+);
+CREATE TABLE services (
+    id INTEGER NOT NULL, name VARCHAR(255) NOT NULL, slug VARCHAR(255) NOT NULL, description TEXT NOT NULL,
+    long_description TEXT, price_base FLOAT, category_id INTEGER NOT NULL, sub_category_id INTEGER,
+    image_url VARCHAR(500), is_active BOOLEAN, is_featured BOOLEAN, created_at DATETIME,
+    media_gallery JSON, bulk_pricing JSON, variants JSON, weight_kg FLOAT,
+    PRIMARY KEY (id), UNIQUE (slug), FOREIGN KEY(category_id) REFERENCES categories (id),
+    FOREIGN KEY(sub_category_id) REFERENCES categories (id)
+);
+INSERT INTO categories (id, name, slug, is_active) VALUES (1, 'Props', 'props', 1);
+INSERT INTO services (id, name, slug, description, price_base, category_id, is_active) VALUES (1, 'Mask', 'mask', 'Mask', 20, 1, 1);
+'''
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """URI of a database with the baseline categories and services tables and one row in each."""
+    path = tmp_path / 'baseline.db'
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+    return f'sqlite:///{path}'
+
+
+@pytest.fixture
+def probe_table(app):
+    """A throwaway model table, removed from the metadata after the test."""
+    table = db.Table('schema_probe', db.metadata, db.Column('id', db.Integer, primary_key=True))
+    yield table
+    db.metadata.remove(table)
+
+
+def test_baseline_database_is_upgraded_in_place(make_app, baseline_db):
+    make_app(database_uri=baseline_db)
+    inspector = inspect(db.engine)
+    columns = {column['name'] for column in inspector.get_columns('services')}
+    assert {'length_cm', 'width_cm', 'height_cm', 'pricing_revision', 'min_price'} <= columns
+    assert 'ix_services_min_price' in {index['name'] for index in inspector.get_indexes('services')}
+    assert 'ix_orders_created_at_id' in {index['name'] for index in inspector.get_indexes('orders')}
+
+    # Existing rows are kept, new columns take their defaults, derived tables are backfilled
+    mask = db.session.get(Service, 1)
+    assert (mask.name, mask.pricing_revision, mask.min_price) == ('Mask', 0, None)
+    assert [(p.ancestor_id, p.descendant_id, p.depth) for p in CategoryPath.query] == [(1, 1, 0)]
+    assert db.session.scalar(select(schema_version.c.fingerprint)) == schema_fingerprint()
+    assert schema_is_current()
+
+
+def test_current_fingerprint_skips_the_upgrade(app):
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    assert prepare_schema() is None
+    assert len(statements) == 1, statements  # one fingerprint lookup, no reflection
+
+    # A full check reflects everything but finds nothing to add
+    assert prepare_schema('full') == []
+
+
+def test_model_change_is_upgraded_again(app, probe_table):
+    assert not schema_is_current()
+    assert prepare_schema() == []  # create_all made the new table
+    assert schema_is_current()
+
+    probe_table.append_column(db.Column('label', db.String(50), default='none'))
+    db.Index('ix_schema_probe_label', probe_table.c.label)
+    assert not schema_is_current()
+    assert prepare_schema() == ['schema_probe.label', 'ix_schema_probe_label']
+    assert schema_is_current()
+    assert [column['name'] for column in inspect(db.engine).get_columns('schema_probe')] == ['id', 'label']
+
+
+def test_reset_after_fork_gives_the_worker_its_own_connections_and_clients(app):
+    parent_pool = db.engine.pool
+    parent_processor = get_square_processor()
+    prefetcher = get_rate_prefetcher()
+    parent_executor = prefetcher._get_executor()
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # The gunicorn worker: report what it sees through the pipe, then exit without pytest's teardown
+        status = 1
+        try:
+            reset_after_fork(app)
+            checks = [
+                db.engine.pool is not parent_pool,
+                db.session.execute(text('SELECT 1')).scalar() == 1,
+                get_square_processor() is not parent_processor,
+                get_square_processor() is get_square_processor(),
+                prefetcher._get_executor() is not parent_executor,
+            ]
+            os.write(write, ','.join(str(int(check)) for check in checks).encode())
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write)
+    _, status = os.waitpid(pid, 0)
+    with os.fdopen(read) as pipe:
+        assert (os.waitstatus_to_exitcode(status), pipe.read()) == (0, '1,1,1,1,1')
+
+    # The master keeps its own
+    assert db.engine.pool is parent_pool and get_square_processor() is parent_processor
+    assert prefetcher._get_executor() is parent_executor
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
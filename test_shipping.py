@@ -1,35 +1,128 @@
 #!/usr/bin/env python
-"""Test script for Canada Post shipping service"""
+"""Tests for the Canada Post shipping service (postal codes, parcel packing, multi-parcel quotes, rate table)"""
 
 import sys
 sys.path.insert(0, '.')
 
+import pytest
+
+from app import db
+from app.models import Service
+from app.packing import PackingError, pack_parcels
+from app.rate_cache import get_rate_cache
+from app.rate_table import RateTable
 from app.shipping import CanadaPostShippingService
 
-print("Testing Canada Post Shipping Service...\n")
 
-# Test postal code validation
-valid_code = CanadaPostShippingService._is_canadian_postal_code("N9J 1V6")
-print(f"✓ Valid postal code test: {valid_code}")
+def demo_quote(postal_code, weight_kg, domestic_only):
+    return CanadaPostShippingService.get_demo_shipping_rates(postal_code, weight_kg)
+
+
+def test_postal_code_validation():
+    assert CanadaPostShippingService._is_canadian_postal_code("N9J 1V6")
+    assert not CanadaPostShippingService._is_canadian_postal_code("12345")
+
+
+def test_demo_rates_and_total_weight():
+    demo_rates = CanadaPostShippingService.get_demo_shipping_rates("N9J 1V6", 1.5)
+    assert demo_rates['success'] and len(demo_rates['options']) == 4
+
+    cart_items = [
+        {'weight_kg': 0.5, 'quantity': 2},
+        {'weight_kg': 1.0, 'quantity': 1}
+    ]
+    assert CanadaPostShippingService.calculate_total_weight(cart_items) == 2.0
+
+
+def test_packing_is_first_fit_decreasing():
+    parcels = pack_parcels([
+        {'weight_kg': 4.0, 'quantity': 3},
+        {'weight_kg': 12.0, 'quantity': 5}
+    ])
+    # The 12 kg units go first, two per parcel; then each 4 kg unit goes into the first parcel with room left
+    assert [parcel.to_dict()['weight_kg'] for parcel in parcels] == [28.0, 28.0, 16.0]
+    assert [parcel.contents for parcel in parcels] == [{1: 2, 0: 1}, {1: 2, 0: 1}, {1: 1, 0: 1}]
+
+    # Volume is a limit too: 40 x 40 x 40 cm boxes fit four to a parcel whatever they weigh
+    boxes = pack_parcels([{'weight_kg': 1.0, 'quantity': 9, 'length_cm': 40, 'width_cm': 40, 'height_cm': 40}])
+    assert [parcel.to_dict()['items'] for parcel in boxes] == [4, 4, 1]
+    # Light carts still ship as one parcel at the minimum billable weight
+    assert [parcel.to_dict()['weight_kg'] for parcel in pack_parcels([{'weight_kg': 0.1, 'quantity': 2}])] == [0.5]
+
+
+def test_packing_rejects_items_no_parcel_can_hold():
+    with pytest.raises(PackingError, match='exceeds the 30 kg parcel limit'):
+        pack_parcels([{'name': 'Anvil', 'weight_kg': 31.0, 'quantity': 1}])
+    with pytest.raises(PackingError, match='exceeds Canada Post size limits'):
+        pack_parcels([{'name': 'Banner pole', 'weight_kg': 2.0, 'quantity': 1,
+                       'length_cm': 210, 'width_cm': 5, 'height_cm': 5}])
+    with pytest.raises(PackingError, match='exceeds Canada Post size limits'):
+        pack_parcels([{'name': 'Backdrop', 'weight_kg': 2.0, 'quantity': 1,
+                       'length_cm': 150, 'width_cm': 40, 'height_cm': 40}])
+
+
+def test_multi_parcel_quote_sums_each_parcel():
+    weights = [28.0, 24.0, 12.0]
+    rates = CanadaPostShippingService.get_multi_parcel_rates("N9J 1V6", weights, quote=demo_quote)
+    assert rates['success'] and rates['parcel_count'] == 3 and rates['weight_kg'] == 64.0
+
+    singles = [demo_quote("N9J 1V6", weight, True) for weight in weights]
+    for option in rates['options']:
+        expected = sum(next(o['price'] for o in single['options'] if o['service_code'] == option['service_code'])
+                       for single in singles)
+        assert option['price'] == round(expected, 2), option
+
+
+def test_multi_parcel_quote_fails_when_one_parcel_fails():
+    def quote(postal_code, weight_kg, domestic_only):
+        if weight_kg == 24.0:
+            return {'success': False, 'error': 'Canada Post is unavailable', 'options': []}
+        return demo_quote(postal_code, weight_kg, domestic_only)
+
+    rates = CanadaPostShippingService.get_multi_parcel_rates("N9J 1V6", [28.0, 24.0, 12.0], quote=quote)
+    assert not rates['success'] and rates['error'] == 'Canada Post is unavailable'
+    assert rates['options'] == []
+
+
+def test_rate_table_quote():
+    rate_table = RateTable.load("instance/rate_table.json")
+    table_rates = rate_table.quote("N9J 1V6", 1.2)
+    assert table_rates['success'] and table_rates['zone'] == '1'
+    assert rate_table.lookup_many("N9J 1V6", [1.2, 31]) == [rate_table.lookup("N9J 1V6", 1.2)[1], None]
+
+
+def add_to_cart(client, category_id, name, weight_kg, quantity):
+    service = Service(name=name, slug=name.lower(), description=name, price_base=10.0,
+                      weight_kg=weight_kg, category_id=category_id)
+    db.session.add(service)
+    db.session.commit()
+    client.post('/services/add-to-cart', json={'service_id': service.id, 'quantity': quantity})
+
+
+def test_heavy_cart_is_quoted_as_several_parcels(catalog, client, canada_post_stub):
+    get_rate_cache().clear()
+    add_to_cart(client, catalog.id, 'Sandbag', 12.0, 5)
+    response = client.post('/services/api/shipping-rates', json={'destination_postal_code': 'K1A 0B1'})
+    rates = response.get_json()
+    assert response.status_code == 200 and rates['success'], rates
+    assert (rates['parcel_count'], rates['weight_kg']) == (3, 60.0)
+    assert [parcel['weight_kg'] for parcel in rates['parcels']] == [24.0, 24.0, 12.0]
+    # The two 24 kg parcels share one quote
+    assert canada_post_stub.stats()['requests'] == 2
 
-invalid_code = CanadaPostShippingService._is_canadian_postal_code("12345")
-print(f"✓ Invalid postal code test: {not invalid_code}")
+    cheapest = rates['options'][0]
+    singles = [get_rate_cache().get('K1A 0B1', weight) for weight in (24.0, 24.0, 12.0)]
+    assert cheapest['price'] == round(sum(
+        next(o['price'] for o in single['options'] if o['service_code'] == cheapest['service_code'])
+        for single in singles), 2)
 
-# Test demo shipping rates
-demo_rates = CanadaPostShippingService.get_demo_shipping_rates("N9J 1V6", 1.5)
-print(f"✓ Demo rates calculation: {len(demo_rates['options'])} options available")
 
-if demo_rates['success']:
-    print(f"  - Options:")
-    for option in demo_rates['options']:
-        print(f"    • {option['service_name']}: ${option['price']:.2f}")
+def test_item_over_the_parcel_limit_is_rejected(catalog, client, canada_post_stub):
+    add_to_cart(client, catalog.id, 'Anvil', 31.0, 1)
+    response = client.post('/services/api/shipping-rates', json={'destination_postal_code': 'K1A 0B1'})
+    assert response.status_code == 400 and '30 kg parcel limit' in response.get_json()['error']
+    assert canada_post_stub.stats()['requests'] == 0
 
-# Test weight calculation
-cart_items = [
-    {'weight_kg': 0.5, 'quantity': 2},
-    {'weight_kg': 1.0, 'quantity': 1}
-]
-total_weight = CanadaPostShippingService.calculate_total_weight(cart_items)
-print(f"✓ Weight calculation: {total_weight} kg calculated correctly")
 
-print("\n✅ All shipping service tests passed!")
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""Tests for the Canada Post HTTP client (pooling, retries, circuit breaker) against a local stub server"""
+
+import sys
+sys.path.insert(0, '.')
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import config
+from app.rate_table import RateTable
+from app.shipping import CanadaPostShippingService
+
+RATES_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<price-quotes>
+    <service><service-code>DOM.EP</service-code><service-name>Expedited Parcel</service-name><price>14.20</price></service>
+    <service><service-code>DOM.RP</service-code><service-name>Regular Parcel</service-name><price>11.05</price></service>
+    <service><service-code>INTL.IP</service-code><service-name>International Parcel</service-name><price>40.00</price></service>
+</price-quotes>'''
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers getnrates POSTs according to the server's scripted responses."""
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.client_ports.add(self.client_address[1])
+            status = server.script.pop(0) if server.script else server.default_status
+        if server.delay:
+            time.sleep(server.delay)
+        body = (RATES_XML if status == 200 else 'unavailable').encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client gave up (read timeout)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer:
+    def __init__(self):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.httpd.lock = threading.Lock()
+        self.reset()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def reset(self, script=None, default_status=200, delay=0):
+        self.httpd.requests = 0
+        self.httpd.client_ports = set()
+        self.httpd.script = list(script or [])
+        self.httpd.default_status = default_status
+        self.httpd.delay = delay
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}/getnrates'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server(canada_post_client):
+    """A scripted getnrates server, with the Canada Post client pointed at it."""
+    with StubServer() as server:
+        canada_post_client(server.url)
+        yield server
+
+
+def test_pooled_session_reuses_connection(server):
+    for _ in range(5):
+        result = CanadaPostShippingService.get_shipping_rates('K1A 0B1', 1.0)
+        assert result['success'], result
+    assert [o['service_code'] for o in result['options']] == ['DOM.RP', 'DOM.EP']
+    assert server.httpd.requests == 5
+    assert len(server.httpd.client_ports) == 1  # one keep-alive connection
+
+
+def test_retries_transient_errors(server):
+    server.reset(script=[503, 502])
+    result = CanadaPostShippingService.get_shipping_rates('K1A 0B1', 1.0)
+    assert result['success'] and not result.get('is_fallback'), result
+    assert server.httpd.requests == 3
+
+
+def test_read_timeout_returns_fallback(server, canada_post_client):
+    canada_post_client(server.url, READ_TIMEOUT=0.1, MAX_RETRIES=0)
+    server.reset(delay=0.5)
+    started = time.perf_counter()
+    result = CanadaPostShippingService.get_shipping_rates('K1A 0B1', 1.0)
+    assert result['success'] and result['is_fallback'], result
+    assert time.perf_counter() - started < 2
+
+
+def test_read_timeouts_are_not_retried(server, canada_post_client):
+    canada_post_client(server.url, READ_TIMEOUT=0.15, MAX_RETRIES=2)
+    server.reset(delay=0.5)
+    started = time.perf_counter()
+    result = CanadaPostShippingService.get_shipping_rates('K1A 0B1', 1.0)
+    assert result['is_fallback'], result
+    assert time.perf_counter() - started < 0.45  # one attempt, not MAX_RETRIES + 1
+    assert server.httpd.requests == 1
+
+
+def test_circuit_breaker_opens_and_recovers(server, canada_post_client, monkeypatch):
+    canada_post_client(server.url, MAX_RETRIES=0)
+    server.reset(default_status=503)
+    breaker = CanadaPostShippingService.breaker
+    for _ in range(breaker.failure_threshold):
+        result = CanadaPostShippingService.get_shipping_rates('K1A 0B1', 1.0)
+        assert result['is_fallback']
+    assert breaker.state == breaker.OPEN
+    calls = server.httpd.requests
+
+    # While open, quotes come from the fallback without touching the upstream
+    result = CanadaPostShippingService.get_shipping_rates('K1A 0B1', 1.0)
+    assert result['success'] and result['is_fallback']
+    assert server.httpd.requests == calls
+
+    # After the reset timeout a trial call goes through and closes the circuit
+    server.reset(default_status=200)
+    monkeypatch.setattr(breaker, 'reset_timeout', 0)
+    result = CanadaPostShippingService.get_shipping_rates('K1A 0B1', 1.0)
+    assert result['success'] and not result.get('is_fallback')
+    assert breaker.state == breaker.CLOSED
+
+
+def test_slow_upstream_answers_with_estimate(server, canada_post_client):
+    late_results = []
+    canada_post_client(server.url, rate_table=RateTable.load('instance/rate_table.json'))
+    server.reset(delay=0.5)
+    started = time.perf_counter()
+    result = CanadaPostShippingService.get_rates(
+        'K1A 0B1', 1.0, estimate_after=0.05, on_late_result=late_results.append
+    )
+    assert result['success'] and result['is_estimate'] and result['is_fallback'], result
+    assert result['source'] == 'rate_table'
+    assert time.perf_counter() - started < 0.4
+
+    # The live call keeps running and its result is handed back when it lands
+    deadline = time.time() + 3
+    while not late_results and time.time() < deadline:
+        time.sleep(0.05)
+    assert late_results and late_results[0]['success'] and not late_results[0].get('is_fallback')
+
+
+def test_rate_table_backend_filters_services(monkeypatch):
+    assert config.Config.SHIPPING_RATE_TABLE_PATH is None  # sample table is never loaded implicitly
+
+    table = RateTable.from_dict({
+        'services': [{'code': 'DOM.RP', 'name': 'Regular Parcel'}, {'code': 'INTL.IP', 'name': 'International Parcel'}],
+        'weight_breaks_kg': [1.0, 5.0],
+        'zones': {'1': 'Local'},
+        'fsa_zones': {'K': '1'},
+        'rates': {'1': {'DOM.RP': [10.0, 20.0], 'INTL.IP': [30.0, 40.0]}},
+    })
+    monkeypatch.setattr(CanadaPostShippingService, 'rate_table', table)
+    domestic = CanadaPostShippingService.get_rates('K1A 0B1', 2.0, backend='table')
+    assert domestic['success'] and [o['service_code'] for o in domestic['options']] == ['DOM.RP'], domestic
+    every = CanadaPostShippingService.get_rates('K1A 0B1', 2.0, domestic_only=False, backend='table')
+    assert [(o['service_code'], o['price']) for o in every['options']] == [('DOM.RP', 20.0), ('INTL.IP', 40.0)]
+
+
+def test_parses_and_filters_stub_rates(canada_post_stub):
+    canada_post_stub.set_profile('large', latency_ms=0, jitter_ms=0)
+    result = CanadaPostShippingService.get_shipping_rates('K1A 0B1', 2.5)
+    assert result['success'], result
+    codes = [o['service_code'] for o in result['options']]
+    assert sorted(codes) == sorted(CanadaPostShippingService.ENABLED_DOMESTIC)
+    assert [o['price'] for o in result['options']] == sorted(o['price'] for o in result['options'])
+    assert result['options'][0]['guaranteed_days'] == '5'
+
+    international = CanadaPostShippingService.get_shipping_rates('K1A 0B1', 2.5, domestic_only=False)
+    assert {'INTL.IP', 'INTL.XIP'} <= {o['service_code'] for o in international['options']}
+    assert not any(o['service_code'].startswith('USA.') for o in international['options'])
+
+
+def test_api_error_document_is_reported(canada_post_stub):
+    canada_post_stub.set_profile('healthy', latency_ms=0, jitter_ms=0, api_error_rate=1.0)
+    result = CanadaPostShippingService.get_shipping_rates('K1A 0B1', 1.0)
+    assert not result['success'] and 'temporarily unavailable' in result['error'], result
+    assert CanadaPostShippingService.breaker.state == CanadaPostShippingService.breaker.CLOSED
+
+
+def test_malformed_response_is_reported(canada_post_stub):
+    canada_post_stub.set_profile('healthy', latency_ms=0, jitter_ms=0, malformed_rate=1.0)
+    result = CanadaPostShippingService.get_shipping_rates('K1A 0B1', 1.0)
+    assert not result['success'] and 'Failed to parse' in result['error'], result
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__]))